@@ -0,0 +1,162 @@
+"""
+Control de admisión para las solicitudes de análisis.
+
+Combina un token bucket por pipe_id (ritmo de admisión) con límites de
+concurrencia global y por pipe_id (análisis en cola o en curso). Una
+solicitud rechazada recibe el tiempo estimado de espera para Retry-After.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuración del control de admisión
+ADMISSION_RATE_PER_PIPE = float(os.getenv("ADMISSION_RATE_PER_PIPE", "0.5"))  # solicitudes/segundo
+ADMISSION_BURST_PER_PIPE = int(os.getenv("ADMISSION_BURST_PER_PIPE", "10"))
+ADMISSION_MAX_GLOBAL = int(os.getenv("ADMISSION_MAX_GLOBAL", "50"))
+ADMISSION_MAX_PER_PIPE = int(os.getenv("ADMISSION_MAX_PER_PIPE", "10"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "30"))
+
+# Clave usada para solicitudes sin pipe_id
+DEFAULT_PIPE_KEY = "_sin_pipe"
+
+
+@dataclass
+class AdmissionDecision:
+    admitted: bool
+    retry_after: int = 0
+    reason: Optional[str] = None
+
+
+class TokenBucket:
+    """Token bucket clásico: `rate` tokens por segundo hasta `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_take(self) -> float:
+        """Consume un token. Devuelve 0 si lo consiguió, o los segundos hasta el próximo token."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        if self.rate <= 0:
+            return float(ADMISSION_RETRY_AFTER_SECONDS)
+        return (1 - self.tokens) / self.rate
+
+    def give_back(self) -> None:
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+
+class AdmissionController:
+    """Decide si una solicitud de análisis entra, por pipe_id y globalmente."""
+
+    def __init__(
+        self,
+        rate_per_pipe: float = ADMISSION_RATE_PER_PIPE,
+        burst_per_pipe: int = ADMISSION_BURST_PER_PIPE,
+        max_global: int = ADMISSION_MAX_GLOBAL,
+        max_per_pipe: int = ADMISSION_MAX_PER_PIPE,
+        retry_after_seconds: int = ADMISSION_RETRY_AFTER_SECONDS
+    ):
+        self.rate_per_pipe = rate_per_pipe
+        self.burst_per_pipe = burst_per_pipe
+        self.max_global = max_global
+        self.max_per_pipe = max_per_pipe
+        self.retry_after_seconds = retry_after_seconds
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._rejected: Dict[str, int] = {}
+
+    @staticmethod
+    def _key(pipe_id: Optional[str]) -> str:
+        return pipe_id or DEFAULT_PIPE_KEY
+
+    def try_acquire(self, pipe_id: Optional[str]) -> AdmissionDecision:
+        """Intenta admitir una solicitud. Si entra, ocupa un slot hasta release()."""
+        key = self._key(pipe_id)
+        with self._lock:
+            total_in_flight = sum(self._in_flight.values())
+            if total_in_flight >= self.max_global:
+                return self._reject(key, self.retry_after_seconds, "limite_global")
+            if self._in_flight.get(key, 0) >= self.max_per_pipe:
+                return self._reject(key, self.retry_after_seconds, "limite_por_pipe")
+
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate_per_pipe, self.burst_per_pipe)
+            wait_seconds = bucket.try_take()
+            if wait_seconds > 0:
+                return self._reject(key, math.ceil(wait_seconds), "rate_limit")
+
+            self._in_flight[key] = self._in_flight.get(key, 0) + 1
+            return AdmissionDecision(admitted=True)
+
+    def _reject(self, key: str, retry_after: int, reason: str) -> AdmissionDecision:
+        self._rejected[key] = self._rejected.get(key, 0) + 1
+        logger.warning(f"🚦 Solicitud rechazada para pipe '{key}': {reason} (Retry-After: {retry_after}s)")
+        return AdmissionDecision(admitted=False, retry_after=max(1, retry_after), reason=reason)
+
+    def restore(self, pipe_id: Optional[str]) -> None:
+        """Ocupa un slot sin comprobar límites (jobs recuperados tras un reinicio)."""
+        key = self._key(pipe_id)
+        with self._lock:
+            self._in_flight[key] = self._in_flight.get(key, 0) + 1
+
+    def release(self, pipe_id: Optional[str]) -> None:
+        """Libera el slot ocupado por una solicitud admitida."""
+        key = self._key(pipe_id)
+        with self._lock:
+            remaining = self._in_flight.get(key, 0) - 1
+            if remaining > 0:
+                self._in_flight[key] = remaining
+            else:
+                self._in_flight.pop(key, None)
+
+    def cancel(self, pipe_id: Optional[str]) -> None:
+        """Deshace una admisión cuyo trabajo no llegó a encolarse."""
+        key = self._key(pipe_id)
+        self.release(pipe_id)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.give_back()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado en vivo del limitador, para /status."""
+        with self._lock:
+            pipes = {}
+            for key in set(self._buckets) | set(self._in_flight) | set(self._rejected):
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket._refill()
+                pipes[key] = {
+                    "in_flight": self._in_flight.get(key, 0),
+                    "tokens": round(bucket.tokens, 2) if bucket else self.burst_per_pipe,
+                    "rejected": self._rejected.get(key, 0)
+                }
+            return {
+                "limits": {
+                    "rate_per_pipe": self.rate_per_pipe,
+                    "burst_per_pipe": self.burst_per_pipe,
+                    "max_global": self.max_global,
+                    "max_per_pipe": self.max_per_pipe
+                },
+                "in_flight": sum(self._in_flight.values()),
+                "pipes": pipes
+            }
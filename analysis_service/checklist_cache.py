@@ -0,0 +1,134 @@
+"""
+Caché del checklist en memoria y en disco, indexada por URL.
+
+El checklist casi nunca cambia, por lo que se sirve desde la caché mientras
+esté dentro del TTL. Al expirar se revalida con ETag/If-Modified-Since (un 304
+solo renueva el TTL), las llamadas concurrentes para la misma URL comparten
+una única descarga en curso, y si la descarga falla se sirve la copia vieja.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+CHECKLIST_CACHE_TTL_SECONDS = float(os.getenv("CHECKLIST_CACHE_TTL_SECONDS", "3600"))
+CHECKLIST_CACHE_DIR = Path(os.getenv("CHECKLIST_CACHE_DIR", "cache/checklists"))
+
+
+class ChecklistCache:
+    """Caché de checklists con revalidación condicional y descargas compartidas."""
+
+    def __init__(
+        self,
+        transform: Callable[[str, httpx.Response], str],
+        cache_dir: Path = CHECKLIST_CACHE_DIR,
+        ttl_seconds: float = CHECKLIST_CACHE_TTL_SECONDS,
+        timeout: float = 30.0
+    ):
+        # transform convierte la respuesta HTTP en el texto del checklist
+        self.transform = transform
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.timeout = timeout
+        self._memory: Dict[str, Dict[str, Any]] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._stats = {"hits": 0, "revalidated": 0, "downloaded": 0, "stale_served": 0, "shared_fetches": 0}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        return self._client
+
+    def _disk_path(self, url: str) -> Path:
+        return self.cache_dir / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json"
+
+    def _load(self, url: str) -> Optional[Dict[str, Any]]:
+        entry = self._memory.get(url)
+        if entry is None:
+            path = self._disk_path(url)
+            if path.exists():
+                try:
+                    entry = json.loads(path.read_text(encoding="utf-8"))
+                    self._memory[url] = entry
+                except Exception as e:
+                    logger.warning(f"⚠️ Entrada de caché de checklist corrupta ({path}): {e}")
+        return entry
+
+    def _save(self, url: str, entry: Dict[str, Any]) -> None:
+        self._memory[url] = entry
+        try:
+            path = self._disk_path(url)
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo persistir el checklist en disco: {e}")
+
+    async def get(self, url: str) -> str:
+        """Devuelve el contenido del checklist, descargándolo o revalidándolo solo si hace falta."""
+        entry = self._load(url)
+        if entry and time.time() - entry["fetched_at"] < self.ttl_seconds:
+            self._stats["hits"] += 1
+            return entry["content"]
+
+        task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.create_task(self._refresh(url, entry))
+            self._inflight[url] = task
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+        else:
+            self._stats["shared_fetches"] += 1
+        return await asyncio.shield(task)
+
+    async def _refresh(self, url: str, entry: Optional[Dict[str, Any]]) -> str:
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            logger.info(f"📥 Descargando checklist desde: {url}")
+            response = await self._get_client().get(url, headers=headers)
+            if response.status_code == 304 and entry:
+                logger.info("📋 Checklist sin cambios (304) - renovando caché")
+                self._stats["revalidated"] += 1
+                self._save(url, {**entry, "fetched_at": time.time()})
+                return entry["content"]
+
+            response.raise_for_status()
+            content = self.transform(url, response)
+            self._stats["downloaded"] += 1
+            self._save(url, {
+                "content": content,
+                "etag": response.headers.get("etag"),
+                "last_modified": response.headers.get("last-modified"),
+                "fetched_at": time.time()
+            })
+            return content
+        except Exception as e:
+            if entry:
+                logger.warning(f"⚠️ Error al revalidar checklist ({e}) - usando copia en caché")
+                self._stats["stale_served"] += 1
+                return entry["content"]
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "entries": len(self._memory), "ttl_seconds": self.ttl_seconds}
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
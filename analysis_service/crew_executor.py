@@ -0,0 +1,175 @@
+"""
+Ejecutor acotado para las ejecuciones de CadastroCrew.
+
+CadastroCrew.run() es bloqueante (LLMs, herramientas síncronas), por lo que
+nunca debe ejecutarse dentro del event loop de FastAPI. Este módulo ofrece un
+pool de threads o de procesos con concurrencia máxima configurable y reporta
+la profundidad de la cola de trabajos pendientes.
+
+Cada worker construye CadastroAgents (Serper, Knowledge Base con su modelo de
+embeddings, clientes Supabase, LlamaParse) una sola vez al arrancar y lo
+reutiliza entre casos, reciclándolo tras CREW_WORKER_RECYCLE_AFTER casos.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuración del ejecutor
+CREW_EXECUTOR_MODE = os.getenv("CREW_EXECUTOR_MODE", "thread")  # "thread" o "process"
+CREW_MAX_CONCURRENCY = int(os.getenv("CREW_MAX_CONCURRENCY", "2"))
+CREW_WORKER_RECYCLE_AFTER = int(os.getenv("CREW_WORKER_RECYCLE_AFTER", "50"))  # 0 = nunca reciclar
+CREW_PREWARM_WORKERS = os.getenv("CREW_PREWARM_WORKERS", "true").lower() == "true"
+
+EXECUTOR_MODES = ("thread", "process")
+
+
+# Estado de cada worker (un thread del pool o el thread principal de un proceso)
+_worker_state = threading.local()
+
+
+def _build_agents_manager():
+    """Construye CadastroAgents con todas sus herramientas. Devuelve None si falla."""
+    try:
+        from cadastro_crew.agents import CadastroAgents
+        return CadastroAgents()
+    except Exception as e:
+        logger.error(f"❌ No se pudo inicializar CadastroAgents en el worker: {e}")
+        return None
+
+
+def init_worker() -> None:
+    """Initializer del pool: precarga las herramientas de la crew una sola vez por worker."""
+    _worker_state.agents_manager = _build_agents_manager()
+    _worker_state.cases_run = 0
+    logger.info(f"🔥 Worker de crew precalentado (pid={os.getpid()}, thread={threading.current_thread().name})")
+
+
+def warmup_worker() -> int:
+    """Tarea vacía usada para forzar el arranque de los workers."""
+    return os.getpid()
+
+
+def run_crew(inputs: Dict[str, Any], previous_state: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Ejecuta la crew dentro del worker y devuelve el informe en Markdown, los
+    outputs estructurados (dossier y parecer de riesgo) y los metadatos de la
+    ejecución (tiempos por tarea, etc.).
+    `previous_state` es el estado incremental del último informe del caso.
+    Debe vivir a nivel de módulo para poder serializarse en modo "process".
+    """
+    from cadastro_crew.crew import CadastroCrew
+
+    if not hasattr(_worker_state, "cases_run"):
+        init_worker()
+    elif CREW_WORKER_RECYCLE_AFTER > 0 and _worker_state.cases_run >= CREW_WORKER_RECYCLE_AFTER:
+        logger.info(f"♻️ Reciclando herramientas del worker tras {_worker_state.cases_run} casos")
+        init_worker()
+    elif _worker_state.agents_manager is None:
+        _worker_state.agents_manager = _build_agents_manager()
+
+    _worker_state.cases_run += 1
+    crew = CadastroCrew(
+        inputs=inputs,
+        agents_manager=_worker_state.agents_manager,
+        previous_state=previous_state
+    )
+    crew.run()
+    # "structured" lleva el dossier y el parecer de riesgo validados (dicts, serializables en modo "process")
+    return {"result": crew.report, "structured": crew.structured_output, "run_details": crew.run_details}
+
+
+class CrewExecutor:
+    """Pool acotado de workers para ejecutar CadastroCrew fuera del event loop."""
+
+    def __init__(self, mode: str = CREW_EXECUTOR_MODE, max_concurrency: int = CREW_MAX_CONCURRENCY):
+        if mode not in EXECUTOR_MODES:
+            logger.warning(f"⚠️ CREW_EXECUTOR_MODE inválido '{mode}' - usando 'thread'")
+            mode = "thread"
+        self.mode = mode
+        self.max_concurrency = max(1, max_concurrency)
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+
+    def _get_executor(self) -> Executor:
+        """Crea el pool de forma perezosa en la primera ejecución."""
+        with self._lock:
+            if self._executor is None:
+                if self.mode == "process":
+                    # En modo process el proceso entero se recicla, liberando la memoria acumulada
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_concurrency,
+                        initializer=init_worker,
+                        max_tasks_per_child=CREW_WORKER_RECYCLE_AFTER or None
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_concurrency,
+                        thread_name_prefix="crew-worker",
+                        initializer=init_worker
+                    )
+                logger.info(f"🧵 Pool de crew iniciado: modo={self.mode}, concurrencia={self.max_concurrency}")
+            return self._executor
+
+    async def prewarm(self) -> None:
+        """Arranca todos los workers por adelantado para que el primer caso no pague la inicialización."""
+        if not CREW_PREWARM_WORKERS:
+            return
+        executor = self._get_executor()
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.gather(*[
+                loop.run_in_executor(executor, warmup_worker) for _ in range(self.max_concurrency)
+            ])
+            logger.info(f"🔥 {self.max_concurrency} workers de crew precalentados")
+        except Exception as e:
+            logger.error(f"❌ Error al precalentar los workers de crew: {e}")
+
+    async def run(self, inputs: Dict[str, Any], previous_state: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Envía una ejecución de la crew al pool y espera su resultado sin bloquear el loop."""
+        executor = self._get_executor()
+        with self._lock:
+            self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(executor, run_crew, inputs, previous_state)
+            with self._lock:
+                self._completed += 1
+            return result
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado actual del pool, incluida la profundidad de la cola."""
+        with self._lock:
+            in_flight = self._in_flight
+            return {
+                "mode": self.mode,
+                "max_concurrency": self.max_concurrency,
+                "recycle_after": CREW_WORKER_RECYCLE_AFTER,
+                "running": min(in_flight, self.max_concurrency),
+                "queue_depth": max(0, in_flight - self.max_concurrency),
+                "completed": self._completed,
+                "failed": self._failed,
+            }
+
+    def shutdown(self) -> None:
+        """Detiene el pool sin esperar a las ejecuciones pendientes."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+            logger.info("🛑 Pool de crew detenido")
@@ -0,0 +1,166 @@
+"""
+Índice local del último informe por case_id, respaldado por SQLite.
+
+/informe/{case_id} se consulta en bucle desde Pipefy; sin este índice cada
+llamada era un select ordenado en Supabase. El índice se actualiza con la
+fila que devuelve Supabase al insertar el informe de un análisis terminado,
+de modo que las consultas se sirven localmente y Supabase solo se consulta
+ante un fallo del índice (read-through). Los casos sin informe también se
+recuerdan durante INFORME_INDEX_NEGATIVE_TTL_SECONDS, porque el polling suele
+empezar antes de que el informe exista.
+
+Cada entrada lleva un ETag (hash del contenido) para responder 304 a los
+If-None-Match que coinciden.
+
+Cada caso tiene una generación que avanza con cada escritura autoritativa
+(el insert de un informe nuevo) y con cada invalidación. La lectura de
+Supabase ante un fallo la anota antes del select y solo guarda lo leído si
+la generación no cambió, para que una lectura lenta no pise el informe nuevo
+con el anterior.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Antigüedad máxima de una entrada antes de volver a validarla contra Supabase
+# (informes escritos por otra instancia); 0 = sin caducidad
+INFORME_INDEX_TTL_SECONDS = float(os.getenv("INFORME_INDEX_TTL_SECONDS", "300"))
+INFORME_INDEX_NEGATIVE_TTL_SECONDS = float(os.getenv("INFORME_INDEX_NEGATIVE_TTL_SECONDS", "30"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS latest_informe (
+    case_id TEXT PRIMARY KEY,
+    informe TEXT,
+    etag TEXT,
+    indexed_at REAL NOT NULL
+);
+"""
+
+
+def compute_etag(informe: Dict[str, Any]) -> str:
+    canonical = json.dumps(informe, sort_keys=True, ensure_ascii=False, default=str)
+    return '"' + hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Compara un If-None-Match (lista de ETags, '*' o débiles W/"...") con el ETag actual."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+class InformeIndex:
+    """Último informe por case_id (o su ausencia), seguro para uso desde varios threads."""
+
+    def __init__(
+        self,
+        db_path: Path,
+        ttl_seconds: float = INFORME_INDEX_TTL_SECONDS,
+        negative_ttl_seconds: float = INFORME_INDEX_NEGATIVE_TTL_SECONDS
+    ):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._stats = {"hits": 0, "negative_hits": 0, "misses": 0, "updates": 0, "stale_puts": 0}
+        self._generations: Dict[str, int] = {}
+
+    def lookup(self, case_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Entrada vigente del caso: {"informe": dict|None, "etag": str|None}
+        (informe None = se sabe que no existe). None si hay que consultar Supabase.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT informe, etag, indexed_at FROM latest_informe WHERE case_id = ?", (case_id,)
+            ).fetchone()
+            age = time.time() - row["indexed_at"] if row else None
+            if row is None:
+                fresh = False
+            elif row["informe"] is None:
+                fresh = age < self.negative_ttl_seconds
+            else:
+                fresh = self.ttl_seconds <= 0 or age < self.ttl_seconds
+            if not fresh:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits" if row["informe"] is not None else "negative_hits"] += 1
+        return {"informe": json.loads(row["informe"]) if row["informe"] else None, "etag": row["etag"]}
+
+    def generation(self, case_id: str) -> int:
+        """Generación actual del caso; se pasa a put(if_generation=) tras leer de Supabase."""
+        with self._lock:
+            return self._generations.get(case_id, 0)
+
+    def put(
+        self,
+        case_id: str,
+        informe: Optional[Dict[str, Any]],
+        if_generation: Optional[int] = None
+    ) -> Optional[str]:
+        """
+        Guarda el último informe del caso (o su ausencia, con None) y retorna su ETag.
+        Con if_generation (lectura de Supabase) no guarda nada si el caso se actualizó o
+        invalidó desde entonces, y retorna None; sin él (insert de un informe nuevo) siempre
+        guarda y avanza la generación.
+        """
+        etag = compute_etag(informe) if informe is not None else None
+        with self._lock:
+            if if_generation is not None:
+                if self._generations.get(case_id, 0) != if_generation:
+                    self._stats["stale_puts"] += 1
+                    return None
+            else:
+                self._generations[case_id] = self._generations.get(case_id, 0) + 1
+            self._conn.execute(
+                "INSERT OR REPLACE INTO latest_informe (case_id, informe, etag, indexed_at) VALUES (?, ?, ?, ?)",
+                (
+                    case_id,
+                    json.dumps(informe, ensure_ascii=False, default=str) if informe is not None else None,
+                    etag,
+                    time.time()
+                )
+            )
+            self._stats["updates"] += 1
+        return etag
+
+    def invalidate(self, case_id: str) -> None:
+        """Descarta la entrada del caso (p. ej. al terminar un análisis nuevo, antes de su insert)."""
+        with self._lock:
+            self._generations[case_id] = self._generations.get(case_id, 0) + 1
+            self._conn.execute("DELETE FROM latest_informe WHERE case_id = ?", (case_id,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) AS entries, COUNT(informe) AS informes FROM latest_informe"
+            ).fetchone()
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["negative_hits"] + stats["misses"]
+        return {
+            **stats,
+            "entries": row["entries"],
+            "informes": row["informes"],
+            "hit_rate": round((stats["hits"] + stats["negative_hits"]) / lookups, 3) if lookups else None,
+            "ttl_seconds": self.ttl_seconds,
+            "negative_ttl_seconds": self.negative_ttl_seconds,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
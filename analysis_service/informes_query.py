@@ -0,0 +1,179 @@
+"""
+Consulta paginada de informe_cadastro para /informes.
+
+Paginación por keyset sobre (created_at, id) en lugar de offset: cada página
+continúa justo después de la última fila de la anterior (cursor opaco), así
+que su coste no crece con la profundidad. Por defecto se proyectan solo las
+columnas ligeras; el informe completo y analysis_details hay que pedirlos
+con `fields=`. Las filas se leen de Supabase en tramos de
+INFORMES_FETCH_CHUNK y se emiten en streaming, de modo que la memoria por
+petición queda acotada a un tramo sea cual sea el tamaño de la tabla.
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+INFORMES_DEFAULT_LIMIT = int(os.getenv("INFORMES_DEFAULT_LIMIT", "50"))
+INFORMES_MAX_LIMIT = int(os.getenv("INFORMES_MAX_LIMIT", "1000"))
+INFORMES_FETCH_CHUNK = int(os.getenv("INFORMES_FETCH_CHUNK", "100"))
+
+INFORME_COLUMNS = (
+    "id", "case_id", "informe", "risk_score", "risk_score_numeric", "summary_report",
+    "documents_analyzed", "crewai_available", "analysis_details", "status", "created_at", "updated_at",
+)
+# Columnas grandes que solo se devuelven si se piden explícitamente
+LARGE_COLUMNS = ("informe", "analysis_details")
+DEFAULT_FIELDS = tuple(column for column in INFORME_COLUMNS if column not in LARGE_COLUMNS)
+# Necesarias para construir el cursor de la página siguiente
+_KEY_COLUMNS = ("id", "created_at")
+
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """Columnas a seleccionar a partir de `fields=a,b,c` ('*' = todas). Levanta ValueError si alguna no existe."""
+    if not fields:
+        selected = list(DEFAULT_FIELDS)
+    elif fields.strip() == "*":
+        selected = list(INFORME_COLUMNS)
+    else:
+        selected = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in selected if field not in INFORME_COLUMNS]
+        if unknown:
+            raise ValueError(f"Campos desconocidos: {', '.join(unknown)}")
+    return selected + [column for column in _KEY_COLUMNS if column not in selected]
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    raw = json.dumps({"created_at": row["created_at"], "id": row["id"]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return {"created_at": str(data["created_at"]), "id": str(data["id"])}
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+def _validate_date(value: Optional[str], name: str) -> Optional[str]:
+    if value is None:
+        return None
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} debe ser una fecha ISO 8601")
+    return value
+
+
+class InformesQuery:
+    """Parámetros validados de una consulta a /informes."""
+
+    def __init__(
+        self,
+        limit: int = INFORMES_DEFAULT_LIMIT,
+        cursor: Optional[str] = None,
+        fields: Optional[str] = None,
+        status: Optional[str] = None,
+        risk_score: Optional[str] = None,
+        created_from: Optional[str] = None,
+        created_to: Optional[str] = None
+    ):
+        if limit < 1:
+            raise ValueError("limit debe ser mayor que 0")
+        self.limit = min(limit, INFORMES_MAX_LIMIT)
+        self.after = decode_cursor(cursor) if cursor else None
+        self.columns = parse_fields(fields)
+        self.status = status
+        self.risk_score = risk_score
+        self.created_from = _validate_date(created_from, "created_from")
+        self.created_to = _validate_date(created_to, "created_to")
+
+    def build(self, client: Any, after: Optional[Dict[str, Any]], size: int) -> Any:
+        """Select de un tramo de `size` filas posteriores a `after` en orden (created_at, id) descendente."""
+        query = client.table("informe_cadastro").select(",".join(self.columns))
+        if self.status:
+            query = query.eq("status", self.status)
+        if self.risk_score:
+            query = query.eq("risk_score", self.risk_score)
+        if self.created_from:
+            query = query.gte("created_at", self.created_from)
+        if self.created_to:
+            query = query.lt("created_at", self.created_to)
+        if after:
+            # Keyset: filas estrictamente anteriores a la última ya emitida
+            query = query.or_(
+                f'created_at.lt."{after["created_at"]}",'
+                f'and(created_at.eq."{after["created_at"]}",id.lt.{after["id"]})'
+            )
+        return query.order("created_at", desc=True).order("id", desc=True).limit(size)
+
+
+async def fetch_chunk(
+    client_getter: Callable[[], Any],
+    query: InformesQuery,
+    after: Optional[Dict[str, Any]],
+    size: int
+) -> List[Dict[str, Any]]:
+    """Un tramo de filas (select en un thread). Levanta la excepción de Supabase si falla."""
+    response = await asyncio.to_thread(lambda: query.build(client_getter(), after, size).execute())
+    return response.data or []
+
+
+async def fetch_first_chunk(client_getter: Callable[[], Any], query: InformesQuery) -> List[Dict[str, Any]]:
+    """
+    Primer tramo de la consulta, leído antes de abrir la respuesta en streaming para que
+    un fallo de Supabase todavía pueda devolverse como error HTTP.
+    """
+    return await fetch_chunk(client_getter, query, query.after, min(INFORMES_FETCH_CHUNK, query.limit))
+
+
+async def stream_informes(
+    client_getter: Callable[[], Any],
+    query: InformesQuery,
+    first_rows: List[Dict[str, Any]]
+) -> AsyncIterator[bytes]:
+    """
+    Emite el cuerpo JSON {"informes": [...], "status", "count", "next_cursor"} fila a fila,
+    a partir del primer tramo ya leído y leyendo el resto de Supabase tramo a tramo.
+    Si un tramo posterior falla, el status es "partial" (con "error") y next_cursor apunta
+    a la última fila emitida para poder reanudar.
+    """
+    yield b'{"informes":['
+    count, after, last_row, exhausted, error = 0, query.after, None, False, None
+    rows, size = first_rows, min(INFORMES_FETCH_CHUNK, query.limit)
+    while True:
+        for row in rows:
+            yield (b"," if count else b"") + json.dumps(row, ensure_ascii=False, default=str).encode("utf-8")
+            count += 1
+        if rows:
+            last_row = rows[-1]
+            after = {"created_at": last_row["created_at"], "id": last_row["id"]}
+        if len(rows) < size:
+            exhausted = True
+            break
+        if count >= query.limit:
+            break
+        size = min(INFORMES_FETCH_CHUNK, query.limit - count)
+        try:
+            rows = await fetch_chunk(client_getter, query, after, size)
+        except Exception as e:
+            # El código de estado ya se envió: el error va en el propio cuerpo
+            logger.error(f"❌ Error al consultar informes: {e}")
+            error = str(e)
+            break
+    next_cursor = encode_cursor(last_row) if last_row is not None and not exhausted else None
+    tail: Dict[str, Any] = {
+        "status": "partial" if error is not None else "success",
+        "count": count,
+        "next_cursor": next_cursor,
+    }
+    if error is not None:
+        tail["error"] = error
+    yield b"]," + json.dumps(tail, ensure_ascii=False)[1:].encode("utf-8")
@@ -0,0 +1,191 @@
+"""
+Cola de trabajos persistente respaldada por SQLite.
+
+Reemplaza a BackgroundTasks para /analyze: cada solicitud se guarda como un
+job con estado (queued/running/done/failed) antes de responder, de modo que
+un reinicio o redeploy no pierde análisis en cola ni en curso.
+
+Cada vez que un worker toma un job se incrementa su contador de intentos. Un
+job que sigue 'running' tras un reinicio y ya agotó JOB_MAX_ATTEMPTS (p. ej.
+porque tumba el proceso) se marca 'failed' en lugar de reintentarse en cada
+arranque.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+# Veces que se toma un job antes de darlo por fallido si se interrumpe (reinicio o caída)
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    case_id TEXT NOT NULL,
+    pipe_id TEXT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_case_id ON jobs (case_id);
+"""
+
+
+class JobQueue:
+    """Almacén de jobs en SQLite, seguro para uso desde varios threads."""
+
+    def __init__(self, db_path: Path, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max(1, max_attempts)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def recover(self) -> int:
+        """
+        Devuelve a la cola los jobs que quedaron 'running' tras un reinicio; los que ya
+        agotaron max_attempts se marcan 'failed'. Retorna cuántos se devolvieron a la cola.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                failed = self._conn.execute(
+                    """
+                    UPDATE jobs SET status = 'failed', finished_at = ?,
+                        error = 'Interrumpido ' || attempts || ' veces (reinicio o caída del worker); no se reintenta más'
+                    WHERE status = 'running' AND attempts >= ?
+                    """,
+                    (datetime.now().isoformat(), self.max_attempts)
+                ).rowcount
+                requeued = self._conn.execute(
+                    "UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'"
+                ).rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if failed:
+            logger.error(f"☠️ {failed} jobs interrumpidos tras {self.max_attempts} intentos marcados como 'failed'")
+        if requeued:
+            logger.warning(f"♻️ {requeued} jobs interrumpidos devueltos a la cola")
+        return requeued
+
+    def enqueue(self, case_id: str, pipe_id: Optional[str], payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Registra un nuevo job en estado 'queued' y lo devuelve."""
+        job_id = uuid.uuid4().hex
+        now = datetime.now().isoformat()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, case_id, pipe_id, payload, status, created_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+                (job_id, case_id, pipe_id, json.dumps(payload, ensure_ascii=False), now)
+            )
+        return self.get(job_id)  # type: ignore[return-value]
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Toma el job más antiguo en cola y lo marca como 'running'."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ? WHERE id = ?",
+                    (datetime.now().isoformat(), row["id"])
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(row["id"], include_payload=True)
+
+    def finish(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        """Marca un job como terminado ('done' o 'failed')."""
+        if status not in ("done", "failed"):
+            raise ValueError(f"Estado final inválido para job: {status}")
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (
+                    status,
+                    json.dumps(result, ensure_ascii=False) if result is not None else None,
+                    error,
+                    datetime.now().isoformat(),
+                    job_id
+                )
+            )
+
+    def get(self, job_id: str, include_payload: bool = False) -> Optional[Dict[str, Any]]:
+        """Devuelve un job por su id, o None si no existe."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_dict(row, include_payload) if row else None
+
+    def list(self, status: Optional[str] = None, case_id: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Lista los jobs más recientes, opcionalmente filtrados por estado o case_id."""
+        query = "SELECT * FROM jobs"
+        conditions, params = [], []
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if case_id:
+            conditions.append("case_id = ?")
+            params.append(case_id)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def active_pipe_ids(self) -> List[Optional[str]]:
+        """pipe_id de cada job pendiente o en curso (uno por job)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT pipe_id FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchall()
+        return [row["pipe_id"] for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """Número de jobs por estado."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS total FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update({row["status"]: row["total"] for row in rows})
+        return counts
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row, include_payload: bool = False) -> Dict[str, Any]:
+        job = dict(row)
+        payload = job.pop("payload")
+        if include_payload:
+            job["payload"] = json.loads(payload)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
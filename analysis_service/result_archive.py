@@ -0,0 +1,256 @@
+"""
+Archivo segmentado y comprimido de resultados de análisis.
+
+Reemplaza los dos archivos sueltos (Markdown y JSON) que se escribían en
+analysis_results/ por cada análisis. Los resultados se añaden a segmentos
+JSONL comprimidos (segment-000001.jsonl.gz, ...), de solo escritura al final:
+cada registro es un miembro gzip independiente, así que un segmento es un
+.gz válido y cada registro se puede leer por separado. Un índice SQLite
+guarda, por registro, su case_id, segmento, offset y longitud, lo que da
+acceso aleatorio por case_id sin descomprimir el segmento completo.
+
+El segmento activo rota al superar RESULT_ARCHIVE_SEGMENT_MAX_MB y, en cada
+rotación, se eliminan los segmentos más antiguos que
+RESULT_ARCHIVE_RETENTION_DAYS junto con sus entradas del índice.
+
+Migración del directorio antiguo:
+    python -m analysis_service.result_archive migrate analysis_results [--delete]
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from analysis_service.result_outbox import idempotency_key
+
+logger = logging.getLogger(__name__)
+
+RESULT_ARCHIVE_SEGMENT_MAX_MB = float(os.getenv("RESULT_ARCHIVE_SEGMENT_MAX_MB", "64"))
+# 0 conserva los segmentos indefinidamente
+RESULT_ARCHIVE_RETENTION_DAYS = float(os.getenv("RESULT_ARCHIVE_RETENTION_DAYS", "365"))
+
+_SEGMENT_PATTERN = re.compile(r"^segment-(\d{6})\.jsonl\.gz$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    key TEXT PRIMARY KEY,
+    case_id TEXT NOT NULL,
+    status TEXT,
+    timestamp TEXT,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    archived_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_records_case_id ON records (case_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_records_segment ON records (segment);
+"""
+
+
+def _segment_name(number: int) -> str:
+    return f"segment-{number:06d}.jsonl.gz"
+
+
+class ResultArchive:
+    """Archivo append-only de resultados en segmentos gzip con índice por case_id."""
+
+    def __init__(
+        self,
+        root_dir: Path,
+        segment_max_bytes: int = int(RESULT_ARCHIVE_SEGMENT_MAX_MB * 1024 * 1024),
+        retention_days: float = RESULT_ARCHIVE_RETENTION_DAYS
+    ):
+        self.root_dir = Path(root_dir)
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self.segment_max_bytes = max(1, segment_max_bytes)
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.root_dir / "index.db"), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        segments = self._segment_numbers()
+        self._active = segments[-1] if segments else 1
+
+    def _segment_numbers(self) -> List[int]:
+        numbers = []
+        for path in self.root_dir.iterdir():
+            match = _SEGMENT_PATTERN.match(path.name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    @property
+    def active_segment(self) -> str:
+        return _segment_name(self._active)
+
+    def _segment_path(self, number: int) -> Path:
+        return self.root_dir / _segment_name(number)
+
+    def append(self, record: Dict[str, Any], key: Optional[str] = None) -> bool:
+        """
+        Añade un resultado al segmento activo. Retorna False si ya estaba archivado
+        (misma clave), de modo que reintentar una entrega no lo duplica.
+        """
+        case_id = record["case_id"]
+        key = key or idempotency_key(case_id, record.get("status", ""), record.get("timestamp", ""))
+        member = gzip.compress(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM records WHERE key = ?", (key,)).fetchone():
+                return False
+            path = self._segment_path(self._active)
+            if path.exists() and path.stat().st_size + len(member) > self.segment_max_bytes:
+                self._rotate()
+                path = self._segment_path(self._active)
+            with open(path, "ab") as f:
+                offset = f.tell()
+                f.write(member)
+                f.flush()
+                os.fsync(f.fileno())
+            self._conn.execute(
+                """
+                INSERT INTO records (key, case_id, status, timestamp, segment, offset, length, archived_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key, case_id, record.get("status"), record.get("timestamp"), self._active, offset, len(member),
+                 datetime.now().isoformat())
+            )
+        return True
+
+    def _rotate(self) -> None:
+        """Cierra el segmento activo y aplica la retención (con el lock tomado)."""
+        self._active += 1
+        logger.info(f"🗜️ Archivo de resultados: nuevo segmento {_segment_name(self._active)}")
+        if self.retention_days <= 0:
+            return
+        cutoff = time.time() - self.retention_days * 86400
+        for number in self._segment_numbers():
+            path = self._segment_path(number)
+            if number != self._active and path.stat().st_mtime < cutoff:
+                self._conn.execute("DELETE FROM records WHERE segment = ?", (number,))
+                path.unlink()
+                logger.info(f"🧹 Segmento {path.name} eliminado por retención ({self.retention_days:g} días)")
+
+    def _read(self, segment: int, offset: int, length: int) -> Dict[str, Any]:
+        with open(self._segment_path(segment), "rb") as f:
+            f.seek(offset)
+            return json.loads(gzip.decompress(f.read(length)))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Resultado archivado con la clave dada, o None."""
+        with self._lock:
+            row = self._conn.execute("SELECT segment, offset, length FROM records WHERE key = ?", (key,)).fetchone()
+        return self._read(row["segment"], row["offset"], row["length"]) if row else None
+
+    def latest(self, case_id: str) -> Optional[Dict[str, Any]]:
+        """Último resultado archivado de un caso, o None."""
+        history = self.history(case_id, limit=1)
+        return self.get(history[0]["key"]) if history else None
+
+    def history(self, case_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """Entradas del índice de un caso, de la más reciente a la más antigua (sin el contenido)."""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT key, case_id, status, timestamp, segment, archived_at FROM records
+                WHERE case_id = ? ORDER BY timestamp DESC, archived_at DESC LIMIT ?
+                """,
+                (case_id, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) AS records, COUNT(DISTINCT case_id) AS cases FROM records"
+            ).fetchone()
+            segments = self._segment_numbers()
+        return {
+            "records": row["records"],
+            "cases": row["cases"],
+            "segments": len(segments),
+            "active_segment": self.active_segment,
+            "bytes": sum(self._segment_path(number).stat().st_size for number in segments),
+            "segment_max_bytes": self.segment_max_bytes,
+            "retention_days": self.retention_days,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_LEGACY_FILE_PATTERN = re.compile(r"^analysis_(?P<case_id>.+)_(?P<stamp>\d{8}_\d{6})\.(?P<ext>md|json)$")
+
+
+def migrate_legacy_directory(archive: ResultArchive, source_dir: Path, delete: bool = False) -> Dict[str, int]:
+    """
+    Importa al archivo los analysis_<case_id>_<timestamp>.json/.md del directorio antiguo.
+    Los JSON se archivan tal cual; un Markdown sin su JSON se archiva como
+    {'case_id', 'timestamp', 'legacy_markdown'}. Con delete=True se eliminan
+    los archivos importados (o que ya estaban archivados).
+    """
+    counts = {"archived": 0, "already_archived": 0, "skipped": 0, "deleted": 0}
+    files = sorted(Path(source_dir).glob("analysis_*"))
+    json_stems = {path.stem for path in files if path.suffix == ".json"}
+    for path in files:
+        match = _LEGACY_FILE_PATTERN.match(path.name)
+        if not match:
+            counts["skipped"] += 1
+            continue
+        stamp = datetime.strptime(match.group("stamp"), "%Y%m%d_%H%M%S").isoformat()
+        try:
+            if match.group("ext") == "json":
+                record = json.loads(path.read_text(encoding="utf-8"))
+                record.setdefault("case_id", match.group("case_id"))
+                record.setdefault("timestamp", stamp)
+                record["legacy_file"] = path.name
+            elif path.stem in json_stems:
+                # El JSON del mismo análisis ya lleva el resultado; el Markdown es solo su vista
+                if delete:
+                    path.unlink()
+                    counts["deleted"] += 1
+                continue
+            else:
+                record = {
+                    "case_id": match.group("case_id"),
+                    "timestamp": stamp,
+                    "legacy_markdown": path.read_text(encoding="utf-8"),
+                    "legacy_file": path.name,
+                }
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ No se pudo migrar {path.name}: {e}")
+            counts["skipped"] += 1
+            continue
+        key = idempotency_key(record["case_id"], record.get("status", ""), f"{record['timestamp']}|{path.name}")
+        counts["archived" if archive.append(record, key=key) else "already_archived"] += 1
+        if delete:
+            path.unlink()
+            counts["deleted"] += 1
+    return counts
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Archivo segmentado de resultados de análisis")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="Importa los .json/.md sueltos de analysis_results/")
+    migrate.add_argument("source_dir", type=Path)
+    migrate.add_argument("--archive-dir", type=Path, default=None,
+                         help="Directorio del archivo (por defecto <source_dir>/archive)")
+    migrate.add_argument("--delete", action="store_true", help="Elimina los archivos una vez archivados")
+    args = parser.parse_args()
+
+    result_archive = ResultArchive(args.archive_dir or args.source_dir / "archive")
+    print(json.dumps(migrate_legacy_directory(result_archive, args.source_dir, delete=args.delete), indent=2))
+    print(json.dumps(result_archive.stats(), indent=2))
+    result_archive.close()
@@ -0,0 +1,357 @@
+"""
+Outbox transaccional de resultados de análisis respaldado por SQLite.
+
+Cada AnalysisResult terminado se registra una sola vez en el outbox antes de
+intentar guardarlo en ningún destino (Markdown, JSON, Supabase). Un drainer
+de fondo entrega cada resultado a todos sus destinos de forma concurrente y
+reintenta los que fallan con backoff exponencial, de modo que un fallo de
+Supabase ya no hace perder un resultado que costó minutos de LLM. Un
+reinicio tampoco lo pierde: las entregas pendientes siguen en el outbox.
+
+Cada resultado tiene una clave de idempotencia (derivada de case_id, status
+y timestamp) que se pasa a los destinos para que un reintento no duplique
+el informe.
+
+Los resultados entregados a todos sus destinos se eliminan del outbox (con su
+payload) pasados OUTBOX_RETENTION_DAYS; el drainer los poda cada
+OUTBOX_PRUNE_INTERVAL_SECONDS.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_BACKOFF_BASE_SECONDS = float(os.getenv("OUTBOX_BACKOFF_BASE_SECONDS", "2"))
+OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "600"))
+OUTBOX_POLL_INTERVAL_SECONDS = float(os.getenv("OUTBOX_POLL_INTERVAL_SECONDS", "5"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+# Días que se conservan los resultados ya entregados a todos sus destinos; 0 = indefinidamente
+OUTBOX_RETENTION_DAYS = float(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+OUTBOX_PRUNE_INTERVAL_SECONDS = float(os.getenv("OUTBOX_PRUNE_INTERVAL_SECONDS", "3600"))
+# Tiempo máximo que el apagado espera a las entregas en curso antes de cancelarlas
+OUTBOX_SHUTDOWN_TIMEOUT_SECONDS = float(os.getenv("OUTBOX_SHUTDOWN_TIMEOUT_SECONDS", "30"))
+
+DELIVERY_STATUSES = ("pending", "delivered", "dead")
+
+# Un destino recibe (payload, clave de idempotencia, número de intento) y devuelve una
+# referencia opcional de lo guardado (ruta, id...). Debe levantar una excepción si falla.
+Sink = Callable[[Dict[str, Any], str, int], Awaitable[Optional[str]]]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id TEXT PRIMARY KEY,
+    case_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    outbox_id TEXT NOT NULL REFERENCES outbox (id),
+    sink TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    reference TEXT,
+    delivered_at TEXT,
+    PRIMARY KEY (outbox_id, sink)
+);
+CREATE INDEX IF NOT EXISTS idx_deliveries_due ON deliveries (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_outbox_created_at ON outbox (created_at);
+"""
+
+
+def idempotency_key(case_id: str, status: str, timestamp: str) -> str:
+    """Clave estable de un resultado: el mismo resultado produce siempre la misma clave."""
+    return hashlib.sha256(f"{case_id}|{status}|{timestamp}".encode("utf-8")).hexdigest()
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Espera antes del siguiente intento tras `attempts` fallos (exponencial con tope)."""
+    return min(OUTBOX_BACKOFF_MAX_SECONDS, OUTBOX_BACKOFF_BASE_SECONDS * (2 ** max(0, attempts - 1)))
+
+
+class ResultOutbox:
+    """Almacén del outbox en SQLite, seguro para uso desde varios threads."""
+
+    def __init__(
+        self,
+        db_path: Path,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        retention_days: float = OUTBOX_RETENTION_DAYS
+    ):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max(1, max_attempts)
+        self.retention_days = retention_days
+        self._pruned = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def record(self, key: str, case_id: str, payload: Dict[str, Any], sinks: List[str]) -> bool:
+        """
+        Registra un resultado y una entrega pendiente por destino, en una sola transacción.
+        Retorna False si el resultado ya estaba registrado (misma clave).
+        """
+        now = datetime.now().isoformat()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO outbox (id, case_id, payload, created_at) VALUES (?, ?, ?, ?)",
+                    (key, case_id, json.dumps(payload, ensure_ascii=False), now)
+                )
+                if cursor.rowcount:
+                    self._conn.executemany(
+                        "INSERT INTO deliveries (outbox_id, sink, status, next_attempt_at) VALUES (?, ?, 'pending', ?)",
+                        [(key, sink, time.time()) for sink in sinks]
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return bool(cursor.rowcount)
+
+    def due(self, limit: int = OUTBOX_BATCH_SIZE) -> List[Dict[str, Any]]:
+        """Entregas pendientes cuyo próximo intento ya venció, con el payload del resultado."""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT d.outbox_id, d.sink, d.attempts, o.case_id, o.payload
+                FROM deliveries d JOIN outbox o ON o.id = d.outbox_id
+                WHERE d.status = 'pending' AND d.next_attempt_at <= ?
+                ORDER BY d.next_attempt_at LIMIT ?
+                """,
+                (time.time(), limit)
+            ).fetchall()
+        return [{**dict(row), "payload": json.loads(row["payload"])} for row in rows]
+
+    def mark_delivered(self, outbox_id: str, sink: str, reference: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE deliveries SET status = 'delivered', attempts = attempts + 1,
+                    reference = ?, last_error = NULL, delivered_at = ?
+                WHERE outbox_id = ? AND sink = ?
+                """,
+                (reference, datetime.now().isoformat(), outbox_id, sink)
+            )
+
+    def mark_failed(self, outbox_id: str, sink: str, attempts: int, error: str) -> str:
+        """Registra un intento fallido; programa el siguiente o, agotados los intentos, lo marca 'dead'."""
+        attempts += 1
+        status = "dead" if attempts >= self.max_attempts else "pending"
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE deliveries SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ?
+                WHERE outbox_id = ? AND sink = ?
+                """,
+                (status, attempts, error, time.time() + backoff_seconds(attempts), outbox_id, sink)
+            )
+        return status
+
+    def retry_dead(self, sink: Optional[str] = None) -> int:
+        """Vuelve a poner en cola las entregas 'dead' (p. ej. tras resolver una caída prolongada)."""
+        query = "UPDATE deliveries SET status = 'pending', attempts = 0, next_attempt_at = ? WHERE status = 'dead'"
+        params: List[Any] = [time.time()]
+        if sink:
+            query += " AND sink = ?"
+            params.append(sink)
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+        return cursor.rowcount
+
+    def prune(self) -> int:
+        """
+        Elimina los resultados (y sus entregas) entregados a todos sus destinos y registrados
+        hace más de retention_days. Retorna cuántos resultados se eliminaron.
+        """
+        if self.retention_days <= 0:
+            return 0
+        cutoff = datetime.fromtimestamp(time.time() - self.retention_days * 86400).isoformat()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [
+                    (row["id"],) for row in self._conn.execute(
+                        """
+                        SELECT o.id FROM outbox o
+                        WHERE o.created_at < ? AND NOT EXISTS (
+                            SELECT 1 FROM deliveries d WHERE d.outbox_id = o.id AND d.status != 'delivered'
+                        )
+                        """,
+                        (cutoff,)
+                    ).fetchall()
+                ]
+                self._conn.executemany("DELETE FROM deliveries WHERE outbox_id = ?", ids)
+                self._conn.executemany("DELETE FROM outbox WHERE id = ?", ids)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._pruned += len(ids)
+        return len(ids)
+
+    def stats(self) -> Dict[str, Any]:
+        """Entregas por destino y estado, antigüedad de la pendiente más vieja y últimos errores."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sink, status, COUNT(*) AS total FROM deliveries GROUP BY sink, status"
+            ).fetchall()
+            oldest = self._conn.execute(
+                """
+                SELECT MIN(o.created_at) AS created_at FROM deliveries d JOIN outbox o ON o.id = d.outbox_id
+                WHERE d.status = 'pending'
+                """
+            ).fetchone()
+            errors = self._conn.execute(
+                """
+                SELECT d.outbox_id, o.case_id, d.sink, d.status, d.attempts, d.last_error
+                FROM deliveries d JOIN outbox o ON o.id = d.outbox_id
+                WHERE d.status != 'delivered' AND d.last_error IS NOT NULL
+                ORDER BY d.next_attempt_at DESC LIMIT 10
+                """
+            ).fetchall()
+            results = self._conn.execute("SELECT COUNT(*) AS total FROM outbox").fetchone()
+            pruned = self._pruned
+        sinks: Dict[str, Dict[str, int]] = {}
+        for row in rows:
+            sinks.setdefault(row["sink"], {status: 0 for status in DELIVERY_STATUSES})[row["status"]] = row["total"]
+        return {
+            "results": results["total"],
+            "pruned": pruned,
+            "retention_days": self.retention_days,
+            "sinks": sinks,
+            "oldest_pending_created_at": oldest["created_at"],
+            "recent_errors": [dict(row) for row in errors],
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class OutboxDrainer:
+    """Task de fondo que entrega las entregas pendientes del outbox a sus destinos."""
+
+    def __init__(
+        self,
+        outbox: ResultOutbox,
+        sinks: Dict[str, Sink],
+        poll_interval: float = OUTBOX_POLL_INTERVAL_SECONDS,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        prune_interval: float = OUTBOX_PRUNE_INTERVAL_SECONDS
+    ):
+        self.outbox = outbox
+        self.sinks = sinks
+        self.poll_interval = poll_interval
+        self.batch_size = max(1, batch_size)
+        self.prune_interval = prune_interval
+        self._next_prune_at = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._stats = {"delivered": 0, "failed_attempts": 0, "dead": 0, "pruned": 0}
+
+    def start(self) -> None:
+        """Inicia el task de fondo (debe llamarse dentro del event loop, p. ej. en el startup)."""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"📮 Drainer del outbox iniciado (destinos: {', '.join(self.sinks)})")
+
+    def notify(self) -> None:
+        """Despierta al drainer tras registrar un resultado nuevo."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _prune_if_due(self) -> None:
+        if time.time() < self._next_prune_at:
+            return
+        self._next_prune_at = time.time() + self.prune_interval
+        try:
+            pruned = await asyncio.to_thread(self.outbox.prune)
+        except Exception as e:
+            logger.error(f"❌ Error al podar el outbox: {e}")
+            return
+        if pruned:
+            self._stats["pruned"] += pruned
+            logger.info(f"🧹 Outbox: {pruned} resultados entregados eliminados por retención")
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            await self._prune_if_due()
+            try:
+                deliveries = await asyncio.to_thread(self.outbox.due, self.batch_size)
+            except Exception as e:
+                logger.error(f"❌ Error al leer el outbox: {e}")
+                deliveries = []
+            if deliveries:
+                # Todos los destinos de todos los resultados vencidos, en paralelo
+                await asyncio.gather(*[self._deliver(delivery) for delivery in deliveries])
+                if len(deliveries) == self.batch_size or self._stopping:
+                    continue
+            self._wakeup.clear()  # type: ignore[union-attr]
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)  # type: ignore[union-attr]
+            except asyncio.TimeoutError:
+                pass
+
+    async def _deliver(self, delivery: Dict[str, Any]) -> None:
+        outbox_id, sink_name = delivery["outbox_id"], delivery["sink"]
+        sink = self.sinks.get(sink_name)
+        try:
+            if sink is None:
+                raise RuntimeError(f"Destino '{sink_name}' no configurado")
+            reference = await sink(delivery["payload"], outbox_id, delivery["attempts"] + 1)
+        except Exception as e:
+            status = await asyncio.to_thread(
+                self.outbox.mark_failed, outbox_id, sink_name, delivery["attempts"], f"{type(e).__name__}: {e}"
+            )
+            self._stats["failed_attempts"] += 1
+            if status == "dead":
+                self._stats["dead"] += 1
+                logger.error(f"☠️ Entrega a '{sink_name}' abandonada - case_id: {delivery['case_id']}: {e}")
+            else:
+                logger.warning(
+                    f"⚠️ Entrega a '{sink_name}' falló (intento {delivery['attempts'] + 1}) - "
+                    f"case_id: {delivery['case_id']}: {e}"
+                )
+            return
+        await asyncio.to_thread(self.outbox.mark_delivered, outbox_id, sink_name, reference)
+        self._stats["delivered"] += 1
+
+    async def close(self, timeout: float = OUTBOX_SHUTDOWN_TIMEOUT_SECONDS) -> None:
+        """
+        Detiene el drainer: deja de tomar entregas y espera (hasta `timeout`) a que terminen
+        las que están en curso. Las pendientes quedan en el outbox para el próximo arranque.
+        """
+        if self._task is None:
+            return
+        self._stopping = True
+        self.notify()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Entregas del outbox aún en curso tras {timeout:g}s - se cancelan")
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self._stopping = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "running": self._task is not None}
@@ -0,0 +1,186 @@
+"""
+Escritura no bloqueante y por lotes en Supabase.
+
+El cliente supabase-py es síncrono: cada insert bloquearía el event loop
+durante un round trip completo. SupabaseBatchWriter recibe las filas en una
+cola en memoria (write-behind) y un task de fondo las agrupa en lotes que
+inserta con una sola llamada, ejecutada en un thread con asyncio.to_thread.
+El handler solo encola la fila, así que su latencia no depende de Supabase.
+
+Si un lote falla, sus filas se reintentan una a una para que una fila
+inválida no haga perder las demás.
+
+Con `key_column` (columna con restricción UNIQUE que guarda la clave de
+idempotencia de cada fila) las filas se insertan con ON CONFLICT DO NOTHING,
+así que ni un reintento del outbox ni el reintento fila a fila tras un lote
+que llegó a confirmarse (timeout o conexión cortada tras el commit) duplican
+filas. Las que ya existían se resuelven con la fila guardada, leída con un
+único select por lote.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SUPABASE_BATCH_SIZE = int(os.getenv("SUPABASE_BATCH_SIZE", "20"))
+SUPABASE_FLUSH_INTERVAL_SECONDS = float(os.getenv("SUPABASE_FLUSH_INTERVAL_SECONDS", "1.0"))
+SUPABASE_WRITE_QUEUE_MAX = int(os.getenv("SUPABASE_WRITE_QUEUE_MAX", "1000"))
+
+# Marca de fin de la cola para detener el task de fondo tras vaciarla
+_STOP = object()
+
+
+class SupabaseBatchWriter:
+    """Buffer write-behind que inserta filas en una tabla de Supabase en lotes."""
+
+    def __init__(
+        self,
+        client_getter: Callable[[], Any],
+        table: str,
+        batch_size: int = SUPABASE_BATCH_SIZE,
+        flush_interval: float = SUPABASE_FLUSH_INTERVAL_SECONDS,
+        max_queue: int = SUPABASE_WRITE_QUEUE_MAX,
+        key_column: Optional[str] = None
+    ):
+        # client_getter devuelve el cliente Supabase (o None si no está disponible)
+        self.client_getter = client_getter
+        self.table = table
+        # Columna UNIQUE con la clave de idempotencia de cada fila (None = insert simple)
+        self.key_column = key_column
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "rows_written": 0, "rows_failed": 0, "batches": 0, "batch_fallbacks": 0, "rows_already_written": 0
+        }
+        self._last_error: Optional[str] = None
+        self._last_flush_at: Optional[float] = None
+
+    def start(self) -> None:
+        """Inicia el task de fondo (debe llamarse dentro del event loop, p. ej. en el startup)."""
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"🗄️ Escritura por lotes en '{self.table}' iniciada (lote={self.batch_size}, intervalo={self.flush_interval}s)")
+
+    async def enqueue(self, row: Dict[str, Any]) -> asyncio.Future:
+        """
+        Encola una fila y devuelve un Future que se resuelve con la fila insertada
+        (o con la excepción) cuando su lote se escribe. Con la cola llena espera (backpressure).
+        """
+        if self._queue is None:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((row, future))  # type: ignore[union-attr]
+        return future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()  # type: ignore[union-attr]
+            if item is _STOP:
+                return
+            batch = [item]
+            stop_after_batch = False
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)  # type: ignore[union-attr]
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stop_after_batch = True
+                    break
+                batch.append(item)
+            await self._write_batch(batch)
+            if stop_after_batch:
+                return
+
+    def _insert(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Inserta las filas y retorna la fila guardada de cada una, en el mismo orden."""
+        client = self.client_getter()
+        if client is None:
+            raise RuntimeError("Cliente Supabase no disponible")
+        if not self.key_column:
+            response = client.table(self.table).insert(rows).execute()
+            if not response.data:
+                raise RuntimeError("Supabase no devolvió datos tras el insert")
+            return response.data
+
+        # ON CONFLICT DO NOTHING: solo vuelven las filas nuevas; las ya existentes se leen por su clave
+        response = client.table(self.table).upsert(
+            rows, on_conflict=self.key_column, ignore_duplicates=True
+        ).execute()
+        saved = {row.get(self.key_column): row for row in response.data or []}
+        missing = [row[self.key_column] for row in rows if row.get(self.key_column) not in saved]
+        if missing:
+            existing = self._select_existing(missing)
+            self._stats["rows_already_written"] += len(existing)
+            saved.update(existing)
+        not_saved = [row.get(self.key_column) for row in rows if row.get(self.key_column) not in saved]
+        if not_saved:
+            raise RuntimeError(f"Supabase no devolvió las filas con clave {', '.join(map(str, not_saved))}")
+        return [saved[row[self.key_column]] for row in rows]
+
+    def _select_existing(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Filas de la tabla que ya tienen alguna de las claves dadas, por clave (un solo select)."""
+        client = self.client_getter()
+        response = client.table(self.table).select("*").in_(self.key_column, keys).execute()  # type: ignore[union-attr]
+        return {row[self.key_column]: row for row in response.data or [] if row.get(self.key_column)}
+
+    async def _write_batch(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]) -> None:
+        rows = [row for row, _ in batch]
+        try:
+            inserted = await asyncio.to_thread(self._insert, rows)
+            self._stats["batches"] += 1
+            self._stats["rows_written"] += len(rows)
+            for (_, future), data in zip(batch, inserted):
+                if not future.done():
+                    future.set_result(data)
+        except Exception as e:
+            if len(batch) == 1:
+                self._fail(batch[0][1], e)
+            else:
+                # Reintentar fila a fila para aislar la que provoca el error; con key_column
+                # las filas que el lote llegó a confirmar no se duplican
+                logger.warning(f"⚠️ Falló el lote de {len(batch)} filas en '{self.table}' ({e}) - reintentando una a una")
+                self._stats["batch_fallbacks"] += 1
+                for item in batch:
+                    await self._write_batch([item])
+        finally:
+            self._last_flush_at = time.time()
+
+    def _fail(self, future: asyncio.Future, error: Exception) -> None:
+        self._stats["rows_failed"] += 1
+        self._last_error = str(error)
+        logger.error(f"❌ Error al insertar en '{self.table}': {error}")
+        if not future.done():
+            future.set_exception(error)
+
+    async def close(self) -> None:
+        """Escribe las filas pendientes y detiene el task de fondo."""
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)  # type: ignore[union-attr]
+        await self._task
+        self._task = None
+        self._queue = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "batch_size": self.batch_size,
+            "flush_interval_s": self.flush_interval,
+            "last_error": self._last_error,
+            "last_flush_at": self._last_flush_at,
+        }
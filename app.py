@@ -11,13 +11,25 @@ import asyncio
 import httpx
 import logging
 from typing import List, Optional, Dict, Any
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Header, HTTPException, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from datetime import datetime
 from pathlib import Path
 import json
-from supabase import create_client, Client
+from supabase import Client
+
+from analysis_service.admission import AdmissionController
+from analysis_service.checklist_cache import ChecklistCache
+from analysis_service.crew_executor import CrewExecutor
+from analysis_service.informe_index import InformeIndex, compute_etag, etag_matches
+from analysis_service.informes_query import INFORMES_DEFAULT_LIMIT, InformesQuery, fetch_first_chunk, stream_informes
+from analysis_service.job_queue import JobQueue, JOB_STATUSES
+from analysis_service.result_archive import ResultArchive
+from analysis_service.result_outbox import OutboxDrainer, ResultOutbox, idempotency_key
+from analysis_service.supabase_writer import SupabaseBatchWriter
+from cadastro_crew.resources import get_supabase_client, loaded_resources
 
 # Cargar variables de entorno
 load_dotenv()
@@ -37,16 +49,20 @@ SERVICE_PORT = int(os.getenv("CREWAI_SERVICE_PORT", "8002"))
 # Directorio para guardar resultados
 RESULTS_DIR = Path("analysis_results")
 LOGS_DIR = Path("logs")
+# Directorio para el estado persistente del servicio (cola de jobs, etc.)
+STATE_DIR = Path(os.getenv("CREWAI_STATE_DIR", "state"))
 
 # Crear directorios si no existen
 RESULTS_DIR.mkdir(parents=True, exist_ok=True)
 LOGS_DIR.mkdir(parents=True, exist_ok=True)
+STATE_DIR.mkdir(parents=True, exist_ok=True)
 
 # Inicializar cliente Supabase
 supabase: Optional[Client] = None
 if SUPABASE_URL and SUPABASE_SERVICE_KEY:
     try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+        # Cliente compartido con las herramientas de la crew que corren en este proceso
+        supabase = get_supabase_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
         logger.info("✅ Cliente Supabase inicializado correctamente")
     except Exception as e:
         logger.error(f"❌ Error al inicializar cliente Supabase: {e}")
@@ -63,6 +79,35 @@ try:
 except ImportError as e:
     logger.warning(f"⚠️ CrewAI no disponible - modo simulación: {e}")
 
+# Pool acotado de workers para ejecutar la crew fuera del event loop
+crew_executor = CrewExecutor()
+
+# Cola persistente de jobs de análisis y workers que la consumen
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", str(crew_executor.max_concurrency)))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "5"))
+job_queue = JobQueue(STATE_DIR / "jobs.db")
+job_wakeup = asyncio.Event()
+job_worker_tasks: List[asyncio.Task] = []
+
+# Control de admisión global y por pipe_id
+admission = AdmissionController()
+
+# Inserts en informe_cadastro fuera del event loop y agrupados en lotes
+informe_writer = SupabaseBatchWriter(
+    client_getter=lambda: supabase,
+    table="informe_cadastro",
+    key_column="idempotency_key"
+)
+
+# Archivo segmentado de resultados (reemplaza los .md/.json sueltos en RESULTS_DIR)
+result_archive = ResultArchive(Path(os.getenv("RESULT_ARCHIVE_DIR", str(RESULTS_DIR / "archive"))))
+
+# Índice local del último informe por case_id para /informe/{case_id}
+informe_index = InformeIndex(STATE_DIR / "informe_index.db")
+
+# Outbox durable de resultados (el drainer se crea junto a los destinos, más abajo)
+result_outbox = ResultOutbox(STATE_DIR / "outbox.db")
+
 app = FastAPI(
     title=SERVICE_NAME,
     description="Servicio modular de análisis CrewAI - Solo análisis, sin dependencias externas"
@@ -90,19 +135,12 @@ class AnalysisResult(BaseModel):
     crewai_available: bool
     analysis_details: Optional[Dict[str, Any]] = None
 
-async def download_checklist_content(checklist_url: str) -> str:
-    """Descarga el contenido del checklist desde la URL."""
-    try:
-        logger.info(f"📥 Descargando checklist desde: {checklist_url}")
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(checklist_url)
-            response.raise_for_status()
-            
-            # Si es un PDF, extraer texto (simplificado para este ejemplo)
-            if checklist_url.lower().endswith('.pdf'):
-                logger.info("📄 Archivo PDF detectado - usando contenido simulado...")
-                return """
+def checklist_text_from_response(checklist_url: str, response: httpx.Response) -> str:
+    """Convierte la respuesta HTTP del checklist en su contenido textual."""
+    # Si es un PDF, extraer texto (simplificado para este ejemplo)
+    if checklist_url.lower().endswith('.pdf'):
+        logger.info("📄 Archivo PDF detectado - usando contenido simulado...")
+        return """
 CHECKLIST DE CADASTRO PESSOA JURÍDICA
 
 1. DOCUMENTOS OBRIGATÓRIOS:
@@ -118,15 +156,45 @@ CHECKLIST DE CADASTRO PESSOA JURÍDICA
    - Assinaturas devem estar presentes
    - Informações devem ser consistentes entre documentos
                 """
-            else:
-                content = response.text
-                logger.info(f"📄 Contenido del checklist descargado: {len(content)} caracteres")
-                return content
-                
+    content = response.text
+    logger.info(f"📄 Contenido del checklist descargado: {len(content)} caracteres")
+    return content
+
+# Caché del checklist (memoria + disco, revalidación con ETag/If-Modified-Since)
+checklist_cache = ChecklistCache(transform=checklist_text_from_response)
+
+async def download_checklist_content(checklist_url: str) -> str:
+    """Obtiene el contenido del checklist desde la caché, descargándolo solo si hace falta."""
+    try:
+        return await checklist_cache.get(checklist_url)
     except Exception as e:
         logger.error(f"❌ Error al descargar checklist: {e}")
         return f"Error al descargar checklist desde {checklist_url}: {e}"
 
+def load_previous_incremental_state(case_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Recupera de informe_cadastro el estado incremental (hash y resultados de
+    validación/extracción de cada documento) del último análisis exitoso del caso.
+    """
+    if not supabase:
+        return None
+    try:
+        response = (
+            supabase.table("informe_cadastro")
+            .select("incremental:analysis_details->incremental")
+            .eq("case_id", case_id)
+            .eq("status", "success")
+            .order("created_at", desc=True)
+            .limit(1)
+            .execute()
+        )
+        if response.data and response.data[0].get("incremental"):
+            logger.info(f"♻️ Estado incremental previo encontrado para case_id: {case_id}")
+            return response.data[0]["incremental"]
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo cargar el estado incremental de case_id {case_id}: {e}")
+    return None
+
 async def analyze_documents_with_crewai(request: CrewAIAnalysisRequest) -> AnalysisResult:
     """Analiza documentos usando CrewAI."""
     # Inicializar variables para evitar problemas de scope
@@ -176,21 +244,9 @@ async def analyze_documents_with_crewai(request: CrewAIAnalysisRequest) -> Analy
                 analysis_details=simulated_analysis
             )
             
-            # 💾 GUARDAR RESULTADOS SIMULADOS EN ARCHIVOS
+            # 💾 GUARDAR RESULTADOS SIMULADOS (outbox → archivo de resultados y Supabase)
             logger.info(f"💾 Guardando resultados del análisis simulado...")
-            
-            # Guardar en Markdown
-            markdown_path = await save_analysis_result_to_markdown(simulated_result)
-            if markdown_path:
-                logger.info(f"📄 Resultado Simulado Markdown: {markdown_path}")
-            
-            # Guardar en JSON
-            json_path = await save_analysis_result_to_json(simulated_result)
-            if json_path:
-                logger.info(f"📄 Resultado Simulado JSON: {json_path}")
-            
-            # Guardar en Supabase
-            await save_analysis_result_to_supabase(simulated_result)
+            await persist_analysis_result(simulated_result)
             
             return simulated_result
         
@@ -206,30 +262,41 @@ async def analyze_documents_with_crewai(request: CrewAIAnalysisRequest) -> Analy
             "documents": request.documents
         }
         
-        logger.info(f"🚀 Ejecutando CrewAI con {len(request.documents)} documentos...")
+        # Estado del último informe del caso para recalcular solo los documentos que cambiaron
+        previous_state = await asyncio.to_thread(load_previous_incremental_state, request.case_id)
         
-        # Crear instancia de la crew
-        crew = CadastroCrew(inputs=crew_inputs)
+        logger.info(f"🚀 Ejecutando CrewAI con {len(request.documents)} documentos...")
         
-        # Ejecutar la crew
-        result = crew.run()
+        # Ejecutar la crew en el pool de workers para no bloquear el event loop
+        crew_run = await crew_executor.run(crew_inputs, previous_state=previous_state)
+        crew_result_str = crew_run["result"]
+        run_details = crew_run.get("run_details", {})
+        structured = crew_run.get("structured") or {}
+        parecer = structured.get("parecer")
         
         logger.info(f"✅ Análisis CrewAI completado para case_id: {request.case_id}")
         
-        # Procesar resultado de CrewAI
-        crew_result_str = str(result)
-        
-        # Extraer score de riesgo del resultado
-        risk_score, risk_score_numeric = await extract_risk_score_from_analysis(crew_result_str)
-        
-        # Generar resumen para sistemas externos
-        summary_report = await generate_summary_report(crew_result_str, risk_score)
+        if parecer:
+            # Veredicto estructurado validado por la crew (ParecerRisco)
+            risk_score, risk_score_numeric = parecer["scoreRisco"], parecer["scoreRiscoNumerico"]
+            summary_report = format_structured_summary(parecer)
+        else:
+            # Fallback: el parecer no pudo validarse; extraer score y resumen del texto del informe
+            logger.warning(f"⚠️ Parecer estructurado no disponible para case_id {request.case_id} - usando extracción por texto")
+            risk_score, risk_score_numeric = await extract_risk_score_from_analysis(crew_result_str)
+            summary_report = await generate_summary_report(crew_result_str, risk_score)
         
         analysis_details = {
             "crew_result": crew_result_str,
             "execution_time": datetime.now().isoformat(),
             "documents_processed": len(request.documents),
-            "checklist_used": request.checklist_url
+            "checklist_used": request.checklist_url,
+            # Outputs estructurados de la crew: dossier cadastral y parecer de riesgo
+            "dossie_cadastral": structured.get("dossie"),
+            "parecer_risco": parecer,
+            "risk_score_source": "structured" if parecer else "text",
+            # Metadatos de la ejecución de la crew (tiempos por tarea, pre-carga, cachés)
+            **run_details
         }
         
         analysis_result = AnalysisResult(
@@ -247,21 +314,9 @@ async def analyze_documents_with_crewai(request: CrewAIAnalysisRequest) -> Analy
             analysis_details=analysis_details
         )
         
-        # 💾 GUARDAR RESULTADOS EN ARCHIVOS
+        # 💾 GUARDAR RESULTADOS (outbox → archivo de resultados y Supabase)
         logger.info(f"💾 Guardando resultados del análisis...")
-        
-        # Guardar en Markdown
-        markdown_path = await save_analysis_result_to_markdown(analysis_result)
-        if markdown_path:
-            logger.info(f"📄 Resultado Markdown: {markdown_path}")
-        
-        # Guardar en JSON
-        json_path = await save_analysis_result_to_json(analysis_result)
-        if json_path:
-            logger.info(f"📄 Resultado JSON: {json_path}")
-        
-        # Guardar en Supabase
-        await save_analysis_result_to_supabase(analysis_result)
+        await persist_analysis_result(analysis_result)
         
         return analysis_result
         
@@ -291,12 +346,23 @@ async def analyze_documents_with_crewai(request: CrewAIAnalysisRequest) -> Analy
             analysis_details=error_details
         )
 
+def enforce_admission(pipe_id: Optional[str]) -> None:
+    """Ocupa un slot de admisión o responde 429 con Retry-After."""
+    decision = admission.try_acquire(pipe_id)
+    if not decision.admitted:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Límite de análisis alcanzado ({decision.reason}) para pipe_id: {pipe_id}",
+            headers={"Retry-After": str(decision.retry_after)}
+        )
+
 # 🔗 ENDPOINT PRINCIPAL PARA COMUNICACIÓN HTTP DIRECTA
 @app.post("/analyze")
-async def analyze_documents_endpoint(request: CrewAIAnalysisRequest, background_tasks: BackgroundTasks):
+async def analyze_documents_endpoint(request: CrewAIAnalysisRequest):
     """
     Endpoint principal para análisis de documentos.
     Recibe llamadas HTTP directas del servicio de ingestión.
+    La solicitud se guarda en la cola persistente de jobs antes de responder.
     MANTIENE LA MODULARIDAD: Se enfoca solo en análisis CrewAI.
     """
     try:
@@ -304,20 +370,31 @@ async def analyze_documents_endpoint(request: CrewAIAnalysisRequest, background_
         logger.info(f"📄 Documentos a analizar: {len(request.documents)}")
         logger.info(f"🔗 Pipe ID: {request.pipe_id}")
         
-        # Procesar análisis en background para respuesta rápida
-        background_tasks.add_task(analyze_documents_with_crewai, request)
+        # Control de admisión: rechazar rápido si el pipe o el servicio están saturados
+        enforce_admission(request.pipe_id)
+        
+        # Encolar el análisis en la cola persistente para respuesta rápida
+        try:
+            job = await asyncio.to_thread(job_queue.enqueue, request.case_id, request.pipe_id, request.model_dump())
+        except Exception:
+            admission.cancel(request.pipe_id)
+            raise
+        job_wakeup.set()
         
         return {
             "status": "accepted",
-            "message": f"Análisis iniciado para case_id: {request.case_id}",
+            "message": f"Análisis encolado para case_id: {request.case_id}",
             "case_id": request.case_id,
+            "job_id": job["id"],
             "documents_count": len(request.documents),
-            "processing": "background",
+            "processing": "queue",
             "service": "crewai_analysis_service",
             "communication": "http_direct",
             "crewai_available": CREWAI_AVAILABLE
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"❌ Error al procesar solicitud de análisis: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -331,8 +408,13 @@ async def analyze_documents_sync(request: CrewAIAnalysisRequest):
     try:
         logger.info(f"🔗 Solicitud de análisis SÍNCRONA recibida para case_id: {request.case_id}")
         
+        enforce_admission(request.pipe_id)
+        
         # Ejecutar análisis de forma síncrona
-        result = await analyze_documents_with_crewai(request)
+        try:
+            result = await analyze_documents_with_crewai(request)
+        finally:
+            admission.release(request.pipe_id)
         
         return {
             "status": "completed",
@@ -342,10 +424,112 @@ async def analyze_documents_sync(request: CrewAIAnalysisRequest):
             "crewai_available": CREWAI_AVAILABLE
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"❌ Error en análisis síncrono: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/jobs")
+async def list_jobs(status: Optional[str] = None, case_id: Optional[str] = None, limit: int = 50):
+    """Lista los jobs de análisis de la cola persistente."""
+    if status and status not in JOB_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Estado inválido: {status}. Valores válidos: {', '.join(JOB_STATUSES)}")
+    limit = max(1, min(limit, 500))
+    jobs = await asyncio.to_thread(job_queue.list, status, case_id, limit)
+    return {
+        "status": "success",
+        "counts": await asyncio.to_thread(job_queue.counts),
+        "count": len(jobs),
+        "jobs": jobs
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Consulta el estado de un job de análisis."""
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"No se encontró job: {job_id}")
+    return {
+        "status": "success",
+        "job": job
+    }
+
+async def process_analysis_job(job: Dict[str, Any]) -> None:
+    """Ejecuta el análisis de un job y registra su estado final."""
+    job_id = job["id"]
+    logger.info(f"⚙️ Procesando job {job_id} para case_id: {job['case_id']} (intento {job['attempts']})")
+    try:
+        request = CrewAIAnalysisRequest(**job["payload"])
+        result = await analyze_documents_with_crewai(request)
+        final_status = "failed" if result.status == "error" else "done"
+        job_result = {
+            "status": result.status,
+            "risk_score": result.risk_score,
+            "risk_score_numeric": result.risk_score_numeric,
+            "timestamp": result.timestamp
+        }
+        error = result.message if final_status == "failed" else None
+        await asyncio.to_thread(job_queue.finish, job_id, final_status, job_result, error)
+        logger.info(f"✅ Job {job_id} finalizado con estado: {final_status}")
+    except Exception as e:
+        logger.error(f"❌ Error al procesar job {job_id}: {e}")
+        await asyncio.to_thread(job_queue.finish, job_id, "failed", None, str(e))
+    finally:
+        admission.release(job["pipe_id"])
+
+async def job_worker_loop(worker_id: int) -> None:
+    """Worker que consume la cola persistente de jobs."""
+    logger.info(f"👷 Worker de jobs {worker_id} iniciado")
+    while True:
+        job_wakeup.clear()
+        try:
+            job = await asyncio.to_thread(job_queue.claim_next)
+        except Exception as e:
+            logger.error(f"❌ Worker {worker_id}: error al tomar job de la cola: {e}")
+            job = None
+        
+        if job is None:
+            try:
+                await asyncio.wait_for(job_wakeup.wait(), timeout=JOB_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        
+        await process_analysis_job(job)
+
+@app.on_event("startup")
+async def start_job_workers():
+    """Precalienta el pool de la crew, recupera jobs interrumpidos e inicia los workers de la cola."""
+    if CREWAI_AVAILABLE:
+        asyncio.create_task(crew_executor.prewarm())
+    await asyncio.to_thread(job_queue.recover)
+    # Los jobs pendientes siguen ocupando su slot de admisión tras un reinicio
+    for pipe_id in await asyncio.to_thread(job_queue.active_pipe_ids):
+        admission.restore(pipe_id)
+    for worker_id in range(max(1, JOB_WORKERS)):
+        job_worker_tasks.append(asyncio.create_task(job_worker_loop(worker_id)))
+    informe_writer.start()
+    outbox_drainer.start()
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    """Detiene los workers de jobs y el pool de la crew al apagar el servicio."""
+    for task in job_worker_tasks:
+        task.cancel()
+    await asyncio.gather(*job_worker_tasks, return_exceptions=True)
+    job_worker_tasks.clear()
+    crew_executor.shutdown()
+    job_queue.close()
+    # El drainer deja de tomar entregas y espera las que están en curso (cuyas filas escribe
+    # informe_writer) antes de cerrar el writer; las pendientes quedan en el outbox
+    await outbox_drainer.close()
+    await informe_writer.close()
+    result_outbox.close()
+    result_archive.close()
+    informe_index.close()
+    await checklist_cache.close()
+
 @app.get("/health")
 async def health_check():
     """Endpoint de salud."""
@@ -353,11 +537,13 @@ async def health_check():
         "status": "healthy",
         "service": "crewai_analysis_service",
         "crewai_available": CREWAI_AVAILABLE,
+        "crew_queue_depth": crew_executor.stats()["queue_depth"],
         "architecture": "modular",
         "communication": "http_direct",
         "endpoints": {
             "async_analysis": "POST /analyze",
             "sync_analysis": "POST /analyze/sync",
+            "jobs": "GET /jobs",
             "health": "GET /health"
         },
         "timestamp": datetime.now().isoformat()
@@ -373,8 +559,10 @@ async def root():
         "crewai_available": CREWAI_AVAILABLE,
         "version": "modular_v2.0",
         "endpoints": {
-            "async_analysis": "POST /analyze - Análisis en background",
+            "async_analysis": "POST /analyze - Análisis encolado (cola persistente)",
             "sync_analysis": "POST /analyze/sync - Análisis síncrono",
+            "jobs": "GET /jobs - Jobs de análisis en cola",
+            "job": "GET /jobs/{job_id} - Estado de un job",
             "health": "GET /health - Estado del servicio",
             "root": "GET / - Información del servicio"
         }
@@ -389,6 +577,16 @@ async def service_status():
         "port": SERVICE_PORT,
         "crewai_available": CREWAI_AVAILABLE,
         "supabase_connected": supabase is not None,
+        "crew_executor": crew_executor.stats(),
+        "job_queue": job_queue.counts(),
+        "admission": admission.snapshot(),
+        "checklist_cache": checklist_cache.stats(),
+        "informe_writer": informe_writer.stats(),
+        "outbox_drainer": outbox_drainer.stats(),
+        "result_archive": result_archive.stats(),
+        "informe_index": informe_index.stats(),
+        # Recursos compartidos cargados en este proceso (en modo "process" los workers tienen los suyos)
+        "shared_resources": loaded_resources(),
         "communication": "http_direct",
         "architecture": "modular",
         "timestamp": datetime.now().isoformat(),
@@ -401,49 +599,126 @@ async def service_status():
         "endpoints": {
             "analyze": "/analyze (POST) - Análisis asíncrono",
             "analyze_sync": "/analyze/sync (POST) - Análisis síncrono", 
+            "jobs": "/jobs (GET) - Jobs de análisis en cola",
+            "job": "/jobs/{job_id} (GET) - Estado de un job",
             "health": "/health (GET) - Health check",
             "status": "/status (GET) - Estado del servicio",
-            "informes": "/informes (GET) - Consultar informes guardados",
-            "informe": "/informe/{case_id} (GET) - Consultar informe específico"
+            "informes": "/informes (GET) - Consultar informes guardados (paginado: limit, cursor, fields, filtros)",
+            "informe": "/informe/{case_id} (GET) - Consultar informe específico",
+            "outbox": "/outbox (GET) - Entregas de resultados pendientes y fallidas",
+            "archive": "/archive/{case_id} (GET) - Último resultado archivado (JSON o Markdown)"
         }
     }
 
+@app.get("/outbox")
+async def outbox_status():
+    """Estado del outbox de resultados: entregas por destino y estado, y últimos errores."""
+    return {
+        **await asyncio.to_thread(result_outbox.stats),
+        "drainer": outbox_drainer.stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.post("/outbox/retry")
+async def retry_dead_deliveries(sink: Optional[str] = None):
+    """Vuelve a encolar las entregas abandonadas tras agotar los reintentos."""
+    requeued = await asyncio.to_thread(result_outbox.retry_dead, sink)
+    outbox_drainer.notify()
+    return {"requeued": requeued, "sink": sink}
+
+@app.get("/archive/{case_id}")
+async def get_archived_result(case_id: str, format: str = "json", history: bool = False):
+    """Último resultado archivado de un caso (format=json|markdown); history=true lista sus versiones."""
+    if history:
+        return {"case_id": case_id, "history": await asyncio.to_thread(result_archive.history, case_id)}
+    record = await asyncio.to_thread(result_archive.latest, case_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"No hay resultados archivados para case_id: {case_id}")
+    if format == "markdown":
+        markdown = record.get("legacy_markdown") or render_analysis_markdown(AnalysisResult(**record))
+        return PlainTextResponse(markdown, media_type="text/markdown; charset=utf-8")
+    return record
+
 @app.get("/informes")
-async def get_all_informes():
-    """Consulta todos los informes guardados en la tabla informe_cadastro."""
+async def get_all_informes(
+    limit: int = INFORMES_DEFAULT_LIMIT,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    status: Optional[str] = None,
+    risk_score: Optional[str] = None,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None
+):
+    """
+    Consulta los informes de la tabla informe_cadastro, del más reciente al más antiguo.
+    Paginado por cursor (usar `next_cursor` de la respuesta como `cursor`), con proyección
+    de columnas (`fields=`, por defecto sin `informe` ni `analysis_details`; `*` para todas)
+    y filtros por status, risk_score y rango de created_at. La respuesta se emite en streaming;
+    si Supabase falla a mitad, termina con status "partial" y un next_cursor para reanudar.
+    """
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Cliente Supabase no disponible")
     try:
-        if not supabase:
-            raise HTTPException(status_code=500, detail="Cliente Supabase no disponible")
-        
-        response = supabase.table("informe_cadastro").select("*").order("created_at", desc=True).execute()
-        
-        return {
-            "status": "success",
-            "count": len(response.data),
-            "informes": response.data
-        }
-        
+        query = InformesQuery(
+            limit=limit,
+            cursor=cursor,
+            fields=fields,
+            status=status,
+            risk_score=risk_score,
+            created_from=created_from,
+            created_to=created_to
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        first_rows = await fetch_first_chunk(lambda: supabase, query)
     except Exception as e:
         logger.error(f"❌ Error al consultar informes: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(stream_informes(lambda: supabase, query, first_rows), media_type="application/json")
 
 @app.get("/informe/{case_id}")
-async def get_informe_by_case_id(case_id: str):
-    """Consulta el informe específico de un case_id."""
+async def get_informe_by_case_id(case_id: str, if_none_match: Optional[str] = Header(None)):
+    """
+    Consulta el informe más reciente de un case_id.
+    Se sirve desde el índice local (Supabase solo ante un fallo del índice) con ETag:
+    un If-None-Match que coincide recibe 304 sin cuerpo.
+    """
     try:
-        if not supabase:
-            raise HTTPException(status_code=500, detail="Cliente Supabase no disponible")
-        
-        response = supabase.table("informe_cadastro").select("*").eq("case_id", case_id).order("created_at", desc=True).execute()
-        
-        if not response.data:
+        entry = await asyncio.to_thread(informe_index.lookup, case_id)
+        if entry is None:
+            if not supabase:
+                raise HTTPException(status_code=500, detail="Cliente Supabase no disponible")
+            
+            # Si un informe nuevo se indexa mientras dura el select, lo leído no lo pisa
+            generation = await asyncio.to_thread(informe_index.generation, case_id)
+            response = await asyncio.to_thread(
+                lambda: supabase.table("informe_cadastro").select("*").eq("case_id", case_id).order("created_at", desc=True).limit(1).execute()
+            )
+            informe = response.data[0] if response.data else None  # Más reciente
+            etag = await asyncio.to_thread(informe_index.put, case_id, informe, generation)
+            entry = {"informe": informe, "etag": etag}
+            if await asyncio.to_thread(informe_index.generation, case_id) != generation:
+                # El caso cambió durante el select: se sirve la entrada más nueva si ya está indexada
+                entry = await asyncio.to_thread(informe_index.lookup, case_id) or {
+                    "informe": informe, "etag": compute_etag(informe) if informe is not None else None
+                }
+        
+        if entry["informe"] is None:
             raise HTTPException(status_code=404, detail=f"No se encontró informe para case_id: {case_id}")
         
-        return {
-            "status": "success",
-            "case_id": case_id,
-            "informe": response.data[0]  # Más reciente
-        }
+        headers = {"ETag": entry["etag"], "Cache-Control": "no-cache"}
+        if etag_matches(if_none_match, entry["etag"]):
+            return Response(status_code=304, headers=headers)
+        
+        return JSONResponse(
+            content={
+                "status": "success",
+                "case_id": case_id,
+                "informe": entry["informe"]
+            },
+            headers=headers
+        )
         
     except HTTPException:
         raise
@@ -451,16 +726,10 @@ async def get_informe_by_case_id(case_id: str):
         logger.error(f"❌ Error al consultar informe para case_id {case_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-async def save_analysis_result_to_markdown(result: "AnalysisResult") -> str:
-    """Guarda el resultado del análisis en un archivo Markdown."""
-    try:
-        # Crear nombre de archivo con timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"analysis_{result.case_id}_{timestamp}.md"
-        filepath = RESULTS_DIR / filename
-        
-        # Crear contenido Markdown
-        markdown_content = f"""# 📊 Análisis CrewAI - Case ID: {result.case_id}
+def render_analysis_markdown(result: "AnalysisResult") -> str:
+    """Genera la vista Markdown (lectura humana) de un resultado de análisis."""
+    # Crear contenido Markdown
+    markdown_content = f"""# 📊 Análisis CrewAI - Case ID: {result.case_id}
 
 ## 📋 Información General
 - **Case ID**: {result.case_id}
@@ -474,11 +743,11 @@ async def save_analysis_result_to_markdown(result: "AnalysisResult") -> str:
 
 ## 🔍 Detalles del Análisis
 """
-        
-        if result.analysis_details:
-            # Si es análisis real de CrewAI
-            if result.crewai_available and "crew_result" in result.analysis_details:
-                markdown_content += f"""
+    
+    if result.analysis_details:
+        # Si es análisis real de CrewAI
+        if result.crewai_available and "crew_result" in result.analysis_details:
+            markdown_content += f"""
 ### 🤖 Resultado de CrewAI
 ```
 {result.analysis_details.get('crew_result', 'No disponible')}
@@ -489,96 +758,78 @@ async def save_analysis_result_to_markdown(result: "AnalysisResult") -> str:
 - **Documentos Procesados**: {result.analysis_details.get('documents_processed', 0)}
 - **Checklist Utilizado**: {result.analysis_details.get('checklist_used', 'No disponible')}
 """
-            
-            # Si es análisis simulado
-            elif not result.crewai_available and isinstance(result.analysis_details, dict):
-                details = result.analysis_details
-                markdown_content += f"""
+        
+        # Si es análisis simulado
+        elif not result.crewai_available and isinstance(result.analysis_details, dict):
+            details = result.analysis_details
+            markdown_content += f"""
 ### 📊 Análisis Simulado
 - **Score de Cumplimiento**: {details.get('compliance_score', 'N/A')}%
 
 #### 📋 Documentos Faltantes
 """
-                for doc in details.get('missing_documents', []):
-                    markdown_content += f"- {doc}\n"
-                
-                markdown_content += "\n#### 📄 Análisis de Documentos\n"
-                for doc_analysis in details.get('document_analysis', []):
-                    status_emoji = "✅" if doc_analysis.get('status') == 'compliant' else "⚠️"
-                    markdown_content += f"""
+            for doc in details.get('missing_documents', []):
+                markdown_content += f"- {doc}\n"
+            
+            markdown_content += "\n#### 📄 Análisis de Documentos\n"
+            for doc_analysis in details.get('document_analysis', []):
+                status_emoji = "✅" if doc_analysis.get('status') == 'compliant' else "⚠️"
+                markdown_content += f"""
 - **{doc_analysis.get('document', 'N/A')}**
   - Tag: {doc_analysis.get('tag', 'N/A')}
   - Estado: {status_emoji} {doc_analysis.get('status', 'N/A')}
   - Confianza: {doc_analysis.get('confidence', 0):.2%}
 """
-                
-                markdown_content += "\n#### 💡 Recomendaciones\n"
-                for rec in details.get('recommendations', []):
-                    markdown_content += f"- {rec}\n"
             
-            # Si hay error
-            elif "error" in result.analysis_details:
-                markdown_content += f"""
+            markdown_content += "\n#### 💡 Recomendaciones\n"
+            for rec in details.get('recommendations', []):
+                markdown_content += f"- {rec}\n"
+        
+        # Si hay error
+        elif "error" in result.analysis_details:
+            markdown_content += f"""
 ### ❌ Error en el Análisis
 ```
 {result.analysis_details.get('error', 'Error desconocido')}
 ```
 """
-        
-        markdown_content += f"""
+    
+    markdown_content += f"""
 
 ---
 *Análisis generado por {SERVICE_NAME} el {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}*
 """
-        
-        # Guardar archivo
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(markdown_content)
-        
-        logger.info(f"💾 Resultado guardado en: {filepath}")
-        return str(filepath)
-        
-    except Exception as e:
-        logger.error(f"❌ Error al guardar resultado en Markdown: {e}")
-        return ""
+    
+    return markdown_content
 
-async def save_analysis_result_to_json(result: "AnalysisResult") -> str:
-    """Guarda el resultado del análisis en un archivo JSON para futura migración a Supabase."""
-    try:
-        # Crear nombre de archivo con timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"analysis_{result.case_id}_{timestamp}.json"
-        filepath = RESULTS_DIR / filename
-        
-        # Preparar datos para JSON (estructura compatible con futura tabla Supabase)
-        json_data = {
-            "case_id": result.case_id,
-            "status": result.status,
-            "message": result.message,
-            "timestamp": result.timestamp,
-            "documents_analyzed": result.documents_analyzed,
-            "crewai_available": result.crewai_available,
-            "analysis_details": result.analysis_details,
-            "created_at": datetime.now().isoformat(),
-            "service_version": "modular_v2.0",
-            "architecture": "modular"
-        }
-        
-        # Guardar archivo JSON
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(json_data, f, indent=2, ensure_ascii=False)
-        
-        logger.info(f"💾 Resultado JSON guardado en: {filepath}")
-        return str(filepath)
-        
-    except Exception as e:
-        logger.error(f"❌ Error al guardar resultado en JSON: {e}")
-        return ""
+def build_archive_record(result: "AnalysisResult") -> Dict[str, Any]:
+    """Registro del resultado para el archivo de resultados (lo que antes iba al JSON suelto)."""
+    return {
+        **result.model_dump(),
+        "created_at": datetime.now().isoformat(),
+        "service_version": "modular_v2.0",
+        "architecture": "modular"
+    }
 
-async def save_analysis_result_to_supabase(result: "AnalysisResult") -> bool:
+async def save_analysis_result_to_archive(result: "AnalysisResult", idempotency_key: Optional[str] = None) -> str:
+    """Añade el resultado al archivo segmentado y retorna el segmento que lo contiene."""
+    if await asyncio.to_thread(result_archive.append, build_archive_record(result), idempotency_key):
+        logger.info(f"💾 Resultado archivado - case_id: {result.case_id} ({result_archive.active_segment})")
+    return result_archive.active_segment
+
+async def save_analysis_result_to_supabase(
+    result: "AnalysisResult",
+    idempotency_key: str,
+    attempt: int = 1
+) -> str:
     """
-    Guarda el resultado del análisis en la tabla informe_cadastro de Supabase.
+    Guarda el resultado del análisis en la tabla informe_cadastro de Supabase y retorna el id de la fila.
     MODULAR: Solo guarda en Supabase, no actualiza sistemas externos.
+    El insert se encola en informe_writer y se escribe por lotes fuera del event loop.
+    La clave de idempotencia va en la columna UNIQUE idempotency_key y el writer inserta con
+    ON CONFLICT DO NOTHING: si un intento anterior llegó a escribirse (aunque no quedara
+    registrado, p. ej. por un reinicio entre el insert y mark_delivered, o tras un retry_dead)
+    se retorna la fila existente en lugar de duplicarla. Levanta una excepción si no se pudo guardar.
     
     Estructura de tabla 'informe_cadastro':
     - id (uuid, primary key)
@@ -591,41 +842,76 @@ async def save_analysis_result_to_supabase(result: "AnalysisResult") -> bool:
     - crewai_available (boolean) - Si CrewAI estaba disponible
     - analysis_details (jsonb) - Detalles adicionales del análisis en formato JSON
     - status (text) - Estado del análisis
+    - idempotency_key (text, unique) - Clave de idempotencia del resultado (ver README_INFORME_CADASTRO.md)
     - created_at (timestamptz) - Fecha de creación
     - updated_at (timestamptz) - Fecha de última actualización
     """
+    if not supabase:
+        raise RuntimeError("Cliente Supabase no está disponible")
+    
+    analysis_details = {**(result.analysis_details or {}), "idempotency_key": idempotency_key}
+    
+    # Preparar datos para insertar en la tabla informe_cadastro
+    data = {
+        "case_id": result.case_id,
+        "informe": result.full_analysis_report or result.message,
+        "risk_score": result.risk_score,
+        "risk_score_numeric": result.risk_score_numeric,
+        "summary_report": result.summary_report,
+        "documents_analyzed": result.documents_analyzed,
+        "crewai_available": result.crewai_available,
+        "analysis_details": analysis_details,
+        "status": result.status,
+        "idempotency_key": idempotency_key
+    }
+    
+    # Encolar el insert (write-behind) y esperar a que se escriba su lote
+    row = await (await informe_writer.enqueue(data))
+    # El índice local sirve este informe a /informe/{case_id} sin consultar Supabase
+    await asyncio.to_thread(informe_index.put, result.case_id, row)
+    logger.info(f"✅ Informe guardado en Supabase - case_id: {result.case_id}, id: {row.get('id')}")
+    logger.info(f"🔔 Webhook de Supabase se activará automáticamente para actualizar sistemas externos")
+    return str(row.get("id"))
+
+# Destinos del outbox: reciben el resultado serializado y levantan una excepción si fallan
+async def _archive_sink(payload: Dict[str, Any], key: str, attempt: int) -> str:
+    return await save_analysis_result_to_archive(AnalysisResult(**payload), idempotency_key=key)
+
+async def _supabase_sink(payload: Dict[str, Any], key: str, attempt: int) -> str:
+    return await save_analysis_result_to_supabase(AnalysisResult(**payload), idempotency_key=key, attempt=attempt)
+
+RESULT_SINKS = {
+    "archive": _archive_sink,
+    "supabase": _supabase_sink,
+}
+# Entregas 'markdown'/'json' que quedaron pendientes en el outbox antes del archivo segmentado;
+# van al archivo, que descarta la segunda por tener la misma clave
+outbox_drainer = OutboxDrainer(
+    result_outbox,
+    {**RESULT_SINKS, "markdown": _archive_sink, "json": _archive_sink}
+)
+
+async def persist_analysis_result(result: "AnalysisResult") -> str:
+    """
+    Registra el resultado en el outbox (una sola vez) y despierta al drainer, que lo
+    entrega al archivo de resultados y a Supabase en paralelo con reintentos. Retorna la clave
+    de idempotencia del resultado.
+    """
+    key = idempotency_key(result.case_id, result.status, result.timestamp)
+    # Sin Supabase configurado no se registra una entrega que nunca podría completarse
+    sinks = [name for name in RESULT_SINKS if name != "supabase" or supabase is not None]
     try:
-        if not supabase:
-            logger.error("❌ Cliente Supabase no está disponible")
-            return False
-        
-        # Preparar datos para insertar en la tabla informe_cadastro
-        data = {
-            "case_id": result.case_id,
-            "informe": result.full_analysis_report or result.message,
-            "risk_score": result.risk_score,
-            "risk_score_numeric": result.risk_score_numeric,
-            "summary_report": result.summary_report,
-            "documents_analyzed": result.documents_analyzed,
-            "crewai_available": result.crewai_available,
-            "analysis_details": result.analysis_details,
-            "status": result.status
-        }
-        
-        # Insertar en Supabase
-        response = supabase.table("informe_cadastro").insert(data).execute()
-        
-        if response.data:
-            logger.info(f"✅ Informe guardado en Supabase - case_id: {result.case_id}, id: {response.data[0].get('id')}")
-            logger.info(f"🔔 Webhook de Supabase se activará automáticamente para actualizar sistemas externos")
-            return True
-        else:
-            logger.error(f"❌ Error al guardar informe en Supabase - No se recibieron datos")
-            return False
-        
+        recorded = await asyncio.to_thread(
+            result_outbox.record, key, result.case_id, result.model_dump(), sinks
+        )
+        if recorded:
+            # Hasta que se inserte el nuevo informe, /informe/{case_id} vuelve a consultar Supabase
+            await asyncio.to_thread(informe_index.invalidate, result.case_id)
+            logger.info(f"📮 Resultado registrado en el outbox - case_id: {result.case_id}, clave: {key[:12]}")
+        outbox_drainer.notify()
     except Exception as e:
-        logger.error(f"❌ Error al guardar informe en Supabase: {e}")
-        return False
+        logger.error(f"❌ Error al registrar el resultado en el outbox - case_id: {result.case_id}: {e}")
+    return key
 
 async def extract_risk_score_from_analysis(crew_result: str) -> tuple[str, int]:
     """
@@ -677,6 +963,13 @@ async def extract_risk_score_from_analysis(crew_result: str) -> tuple[str, int]:
         logger.error(f"❌ Error al extraer score de riesgo: {e}")
         return "Médio", 50
 
+def format_structured_summary(parecer: Dict[str, Any]) -> str:
+    """Resumen para sistemas externos a partir del parecer estructurado (mismo formato y límite que generate_summary_report)."""
+    summary = f"Score de Risco: {parecer['scoreRisco']} | {parecer.get('sumario') or ''}".strip(" |")
+    if len(summary) > 450:
+        summary = summary[:447] + "..."
+    return summary
+
 async def generate_summary_report(crew_result: str, risk_score: str) -> str:
     """
     Genera un resumen conciso del análisis para sistemas externos.
@@ -1,12 +1,13 @@
 import yaml
 from pathlib import Path
 from crewai import Agent
-from crewai_tools import SerperDevTool
 
 # Importar ferramentas customizadas
 from .tools.llama_cloud_parsing_tool import LlamaParseDirectTool # Importar a ferramenta de parseo
 from .tools import KnowledgeBaseQueryTool
 from .tools import SupabaseDocumentContentTool # Nova ferramenta
+from .tools import CachedSerperDevTool # SerperDevTool com cache persistente
+from .llm_cache import build_agent_llm # LLM com cache de respostas (record/replay)
 
 # Carregar configurações dos agentes do arquivo YAML
 agents_config_path = Path(__file__).parent / 'config/agents.yaml'
@@ -29,7 +30,7 @@ class CadastroAgents:
         # Isto garante que são criadas APÓS load_dotenv() em main.py ter sido chamado,
         # assumindo que CadastroAgents() é chamado depois disso.
         print("INFO (CadastroAgents): Inicializando ferramentas...")
-        self.serper_tool = SerperDevTool()
+        self.serper_tool = CachedSerperDevTool()
         self.kb_tool = KnowledgeBaseQueryTool()
         self.supabase_doc_tool = SupabaseDocumentContentTool()
         
@@ -45,6 +46,13 @@ class CadastroAgents:
             
         print("INFO (CadastroAgents): Ferramentas inicializadas.")
 
+        # LLM partilhado pelos agentes; None (LLM padrão da CrewAI) quando LLM_CACHE_MODE=off
+        self.llm = build_agent_llm()
+
+    def llm_cache_stats(self):
+        """Contadores da cache de respostas do LLM (None se a cache estiver desativada)."""
+        return dict(self.llm.stats) if self.llm is not None else None
+
     def triagem_validador_agente(self) -> Agent:
         config = agents_config['triagem_agente']
         tools = [self.supabase_doc_tool, self.kb_tool]
@@ -58,7 +66,7 @@ class CadastroAgents:
             verbose=config.get('verbose', True),
             allow_delegation=config.get('allow_delegation', False),
             tools=tools,
-            # llm=seu_llm_configurado # Opcional: se quiser um LLM específico para este agente
+            llm=self.llm, # None = LLM padrão; CachedLLM quando LLM_CACHE_MODE != off
         )
 
     def extrator_info_agente(self) -> Agent:
@@ -74,7 +82,7 @@ class CadastroAgents:
             verbose=config.get('verbose', True),
             allow_delegation=config.get('allow_delegation', False),
             tools=tools,
-            # llm=seu_llm_configurado
+            llm=self.llm,
         )
 
     def analista_risco_agente(self) -> Agent:
@@ -90,7 +98,7 @@ class CadastroAgents:
             verbose=config.get('verbose', True),
             allow_delegation=config.get('allow_delegation', False),
             tools=tools,
-            # llm=seu_llm_configurado
+            llm=self.llm,
         )
 
 # Exemplo de como você poderia usar esta classe em seu crew.py:
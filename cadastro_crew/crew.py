@@ -1,12 +1,38 @@
 # from crewai import Agent, Crew, Process, Task # Agent, Task ya no son directamente usados aquí por la clase @CrewBase
 from crewai import Crew, Process, Agent, Task # Mantener Crew y Process para la segunda clase, Agent y Task para la nueva
-from crewai.project import CrewBase, agent, crew, task
+from crewai.project import CrewBase, agent, crew, task, before_kickoff
 # from crewai.agents.agent_builder.base_agent import BaseAgent # No es necesario para @agent
 # from typing import List # No es necesario para @agent
 
+import asyncio
+import json
+import os
+import time
+
 # Importar agentes e tarefas definidos localmente
 from .agents import CadastroAgents
 from .tasks import CadastroTasks
+from .scheduler import TaskGraphExecutor, TaskNode, combine_timing_reports
+from .prefetch import NO_PREFETCH_PLACEHOLDER, format_parsed_documents, prefetch_documents, prefetch_report
+from .incremental import (
+    build_incremental_state, merge_dossies, merge_validations, per_document_outputs, plan_incremental
+)
+from .token_budget import CREW_TOKEN_BUDGET_ENABLED, apply_token_budget
+from .models import DossieCadastral, ParecerRisco, ValidacaoDocumento, parse_model_output, structured_output
+from .tools.http_download import close_async_client
+
+from crewai.tasks.task_output import TaskOutput
+
+# Executar em paralelo as tarefas independentes (validação e extração)
+CREW_PARALLEL_TASKS = os.getenv("CREW_PARALLEL_TASKS", "true").lower() == "true"
+CREW_MAX_PARALLEL_TASKS = int(os.getenv("CREW_MAX_PARALLEL_TASKS", "2"))
+
+# Pré-carregar e parsear todos os documentos antes do kickoff
+CREW_PREFETCH_DOCUMENTS = os.getenv("CREW_PREFETCH_DOCUMENTS", "true").lower() == "true"
+PREFETCH_MAX_CONCURRENCY = int(os.getenv("PREFETCH_MAX_CONCURRENCY", "4"))
+
+# Validação e extração por documento, reutilizando os resultados dos documentos que não mudaram
+CREW_INCREMENTAL_ANALYSIS = os.getenv("CREW_INCREMENTAL_ANALYSIS", "true").lower() == "true"
 
 # Opcional: para carregar variáveis de ambiente se não estiverem já carregadas
 # from dotenv import load_dotenv
@@ -89,6 +115,13 @@ class CadastroCrewCliRunner():
         self.agente_extrator_instance = self._agents_manager.extrator_info_agente()
         self.agente_risco_instance = self._agents_manager.analista_risco_agente()
 
+    @before_kickoff
+    def preencher_inputs_padrao(self, inputs):
+        """A CLI não executa o pré-carregamento: as tarefas usam as ferramentas diretamente."""
+        inputs = dict(inputs or {})
+        inputs.setdefault("documentos_parseados", NO_PREFETCH_PLACEHOLDER)
+        return inputs
+
     @agent
     def triagem_validador(self) -> Agent:
         return self.agente_triagem_instance
@@ -146,7 +179,7 @@ class CadastroCrew:
     """
     Orquestra o "Crew de Cadastro" para validação documental, extração de dados e análise de risco.
     """
-    def __init__(self, inputs=None):
+    def __init__(self, inputs=None, agents_manager=None, previous_state=None):
         """
         Inicializa o crew com os inputs necessários.
         O dicionário `inputs` deve conter chaves como:
@@ -156,35 +189,166 @@ class CadastroCrew:
         - current_date: str (data atual YYYY-MM-DD)
         - E potencialmente outros campos que as tasks esperam, como dados_pj.cnpj, lista_cpfs_socios
           se já forem conhecidos antes da execução da tarefa de extração.
+
+        `agents_manager` permite reutilizar um CadastroAgents já inicializado
+        (ferramentas e modelos pré-carregados num worker) entre vários casos.
+
+        `previous_state` é o estado incremental gravado pela análise anterior do
+        mesmo caso (ver incremental.py); permite recalcular só os documentos que mudaram.
         """
         self.inputs = inputs if inputs else {}
+        self.agents_manager = agents_manager
+        self.previous_state = previous_state
+        # Metadados da última execução (tempos por tarefa, etc.)
+        self.run_details = {}
+        # Outputs estruturados da última execução ({"dossie": dict|None, "parecer": dict|None})
+        self.structured_output = {"dossie": None, "parecer": None}
+        # Relatório final em Markdown (relatorioMarkdown do parecer, ou o texto bruto da tarefa de risco)
+        self.report = None
+
+    def _prefetch_documents(self, agents_manager):
+        """
+        Resolve e parseia concorrentemente todos os documentos do caso antes do kickoff.
+        Retorna a lista de resultados por documento, ou None se o pré-carregamento estiver desativado.
+        """
+        documents = self.inputs.get("documents") or []
+        if not CREW_PREFETCH_DOCUMENTS or not documents:
+            return None
+
+        print(f"INFO: Pré-carregando {len(documents)} documentos do caso '{self.inputs.get('case_id')}'...")
+        async def prefetch():
+            try:
+                return await prefetch_documents(
+                    case_id=self.inputs.get("case_id"),
+                    documents=documents,
+                    document_tool=agents_manager.supabase_doc_tool,
+                    parse_tool=agents_manager.llama_parse_tool,
+                    max_concurrency=PREFETCH_MAX_CONCURRENCY
+                )
+            finally:
+                # As conexões de download partilhadas pelo caso pertencem a este event loop
+                await close_async_client()
+
+        start = time.perf_counter()
+        results = asyncio.run(prefetch())
+        self.run_details["document_prefetch"] = prefetch_report(results, time.perf_counter() - start)
+        if agents_manager.llama_parse_tool is not None:
+            self.run_details["document_prefetch"]["parse_cache"] = agents_manager.llama_parse_tool.parse_cache_stats()
+        print(f"INFO: Pré-carregamento concluído em {self.run_details['document_prefetch']['wall_time_s']}s")
+        return results
+
+    @staticmethod
+    def _reuse_output(task, agent, raw_output: str) -> None:
+        """Marca a tarefa como já executada com um output conhecido (para o contexto da análise de risco)."""
+        task.output = TaskOutput(
+            description=task.description,
+            raw=raw_output,
+            agent=agent.role,
+            pydantic=parse_model_output(raw_output, task.output_pydantic) if task.output_pydantic else None
+        )
+
+    def _budget_documents(self, documents, inputs):
+        """Orçamento de tokens: só os trechos relevantes dos documentos longos chegam aos agentes."""
+        if not CREW_TOKEN_BUDGET_ENABLED or not documents:
+            return documents
+        documents, self.run_details["token_budget"] = apply_token_budget(documents, inputs.get("checklist"))
+        budget = self.run_details["token_budget"]
+        print(
+            f"INFO: Orçamento de tokens: {budget['tokens_before']} -> {budget['tokens_after']} "
+            f"({budget['documents_condensed']} documentos condensados)"
+        )
+        return documents
+
+    def _run_graph(self, nodes, inputs, graphs):
+        graph = TaskGraphExecutor(
+            nodes=nodes,
+            max_parallel=CREW_MAX_PARALLEL_TASKS if CREW_PARALLEL_TASKS else 1,
+            verbose=True
+        )
+        graphs.append(graph)
+        return graph.run(inputs)
+
+    def _run_documents(self, agents_manager, tasks_manager, prefetch_results, plan, inputs, graphs):
+        """
+        Fase 1 do modo por documento: valida e extrai, cada documento num nó próprio, só os
+        documentos que o plano manda recalcular. Retorna {tarefa: {documento: {"structured", "raw"}}}.
+        """
+        recompute = {task: set(names) for task, names in plan["recompute"].items()}
+        to_run = [
+            doc for doc in prefetch_results
+            if doc["name"] in recompute["validacao_documental"] | recompute["extracao_dados"]
+        ]
+        document_tasks = {"validacao_documental": {}, "extracao_dados": {}}
+        nodes = []
+        for doc in self._budget_documents(to_run, inputs):
+            doc_inputs = {"documento_nome": doc["name"], "documentos_parseados": format_parsed_documents([doc])}
+            # Um agente por nó: o Agent da CrewAI guarda o executor da tarefa em curso
+            if doc["name"] in recompute["validacao_documental"]:
+                agente = agents_manager.triagem_validador_agente()
+                task = tasks_manager.tarefa_validacao_documento(agente)
+                document_tasks["validacao_documental"][doc["name"]] = task
+                nodes.append(TaskNode(f"validacao_documental:{doc['name']}", agente, task, inputs=doc_inputs))
+            if doc["name"] in recompute["extracao_dados"]:
+                agente = agents_manager.extrator_info_agente()
+                task = tasks_manager.tarefa_extracao_documento(agente)
+                document_tasks["extracao_dados"][doc["name"]] = task
+                nodes.append(TaskNode(f"extracao_dados:{doc['name']}", agente, task, inputs=doc_inputs))
+        if nodes:
+            self._run_graph(nodes, inputs, graphs)
+
+        models = {"validacao_documental": ValidacaoDocumento, "extracao_dados": DossieCadastral}
+        return {
+            name: {
+                doc_name: {"structured": structured_output(task.output, models[name]), "raw": task.output.raw}
+                for doc_name, task in tasks.items()
+            }
+            for name, tasks in document_tasks.items()
+        }
 
     def run(self):
         """
         Monta e executa o Crew.
-        Retorna o resultado da execução do Crew.
+        Retorna o resultado da execução do Crew (o output da tarefa de análise de risco).
+        Os tempos de cada tarefa ficam disponíveis em `self.run_details["task_timings"]`.
+
+        Com todos os documentos pré-carregados, a validação e a extração correm por documento
+        (só para os documentos novos ou alterados, ver incremental.py) e os seus resultados são
+        consolidados antes da análise de risco. Sem pré-carregamento, as três tarefas correm
+        sobre o caso inteiro.
         """
         # Instanciar os gerenciadores de agentes e tarefas
-        agents_manager = CadastroAgents()
+        # (reutiliza as ferramentas do worker quando um CadastroAgents foi fornecido)
+        agents_manager = self.agents_manager or CadastroAgents()
         tasks_manager = CadastroTasks()
 
+        # Etapa de pré-carregamento: o conteúdo parseado vai para os inputs das tarefas
+        inputs = dict(self.inputs)
+        prefetch_results = self._prefetch_documents(agents_manager)
+
+        # Reanálise incremental: comparar os documentos com os da análise anterior
+        # (o plano usa o conteúdo integral, para não depender do orçamento de tokens)
+        if CREW_INCREMENTAL_ANALYSIS:
+            plan = plan_incremental(self.previous_state, prefetch_results, inputs)
+        else:
+            plan = {"mode": "case", "recompute": None, "reason": "reanálise incremental desativada"}
+        print(f"INFO: Plano incremental: {plan['mode']} {plan['recompute'] or ''} ({plan['reason']})")
+
         # Criar os agentes
         agente_triagem = agents_manager.triagem_validador_agente()
         agente_extrator = agents_manager.extrator_info_agente()
         agente_risco = agents_manager.analista_risco_agente()
 
         # Criar as tarefas
-        # A ordem e o contexto são importantes aqui
         # Tarefa 1: Validação Documental
         task_validacao = tasks_manager.tarefa_validacao_documental(agente_triagem)
 
         # Tarefa 2: Extração de Dados
-        # Esta tarefa pode depender do resultado da validação (implicitamente, pois usa os mesmos documentos)
-        # ou explicitamente se a validação gerar um output que a extração precise.
-        # Por agora, vamos assumir uma dependência sequencial simples.
+        # A validação e a extração dependem apenas dos documentos de entrada, por isso
+        # correm em paralelo. Com CREW_PARALLEL_TASKS=false volta-se à dependência
+        # sequencial original (a extração recebe a validação como contexto).
         task_extracao = tasks_manager.tarefa_extracao_dados(
             agente_extrator,
-            context_tasks=[task_validacao] # Resultado da validação pode ser útil
+            context_tasks=None if CREW_PARALLEL_TASKS else [task_validacao]
         )
 
         # Tarefa 3: Análise de Risco e Inconsistências
@@ -195,32 +359,65 @@ class CadastroCrew:
             context_tasks=[task_validacao, task_extracao] 
         )
 
-        # Montar o Crew
-        crew = Crew(
-            agents=[
-                agente_triagem,
-                agente_extrator,
-                agente_risco
-            ],
-            tasks=[
-                task_validacao,
-                task_extracao,
-                task_analise
-            ],
-            process=Process.sequential,  # Processo sequencial por padrão
-            verbose=True, # MODIFICADO DE 2 A True
-            # memory=True, # Descomente se quiser habilitar memória de curto prazo entre tarefas
-            # cache=True, # Descomente para habilitar cache de LLM para execuções repetidas
-            # max_rpm=100, # Limite de requisições por minuto (se aplicável ao seu LLM)
-            # manager_llm=seu_llm_configurado # LLM para o gerente do Crew (se usar processo hierárquico)
-        )
-
-        # Executar o Crew com os inputs fornecidos na inicialização da classe CadastroCrew
+        # Executar os grafos com os inputs fornecidos na inicialização da classe CadastroCrew
         # Os inputs serão automaticamente disponibilizados para as tasks que os referenciam.
         print("INFO: Iniciando o kickoff do CadastroCrew...")
         print(f"INFO: Inputs para o kickoff: {self.inputs}")
-        
-        result = crew.kickoff(inputs=self.inputs)
+
+        graphs = []
+        self.run_details["incremental"] = {"plan": plan}
+        try:
+            if plan["mode"] == "per_document":
+                # Fase 1: validação e extração dos documentos alterados; os outputs dos restantes
+                # vêm da análise anterior e tudo é consolidado sem LLM, na ordem dos documentos
+                new_outputs = self._run_documents(
+                    agents_manager, tasks_manager, prefetch_results, plan, inputs, graphs
+                )
+                document_outputs = per_document_outputs(self.previous_state, prefetch_results, plan, new_outputs)
+                self.run_details["incremental"] = build_incremental_state(
+                    prefetch_results, inputs, document_outputs, plan
+                )
+                self._reuse_output(
+                    task_validacao, agente_triagem,
+                    merge_validations(prefetch_results, document_outputs["validacao_documental"])
+                )
+                self._reuse_output(
+                    task_extracao, agente_extrator,
+                    json.dumps(merge_dossies(prefetch_results, document_outputs["extracao_dados"]), ensure_ascii=False, indent=2)
+                )
+                # Fase 2: a análise de risco recebe a validação e o dossiê consolidados como contexto
+                outputs = self._run_graph([TaskNode("analise_risco", agente_risco, task_analise)], inputs, graphs)
+            else:
+                documents_for_agents = self._budget_documents(prefetch_results, inputs)
+                inputs["documentos_parseados"] = (
+                    format_parsed_documents(documents_for_agents) if documents_for_agents else NO_PREFETCH_PLACEHOLDER
+                )
+                # Montar o grafo de dependências entre as tarefas
+                outputs = self._run_graph([
+                    TaskNode("validacao_documental", agente_triagem, task_validacao),
+                    TaskNode(
+                        "extracao_dados", agente_extrator, task_extracao,
+                        depends_on=[] if CREW_PARALLEL_TASKS else ["validacao_documental"]
+                    ),
+                    TaskNode("analise_risco", agente_risco, task_analise, depends_on=["validacao_documental", "extracao_dados"]),
+                ], inputs, graphs)
+        finally:
+            self.run_details["task_timings"] = combine_timing_reports([graph.timing_report() for graph in graphs])
+            self.run_details["kb_embedding_cache"] = agents_manager.kb_tool.embedding_cache_stats()
+            self.run_details["serper_cache"] = agents_manager.serper_tool.cache_stats()
+            self.run_details["llm_cache"] = agents_manager.llm_cache_stats()
+            # O caso terminou: descartar o índice de metadados dos seus documentos
+            agents_manager.supabase_doc_tool.invalidate_case(self.inputs.get("case_id"))
+
+        self.structured_output = {
+            "dossie": structured_output(task_extracao.output, DossieCadastral),
+            "parecer": structured_output(task_analise.output, ParecerRisco),
+        }
+        result = outputs["analise_risco"]
+        self.report = (
+            self.structured_output["parecer"]["relatorioMarkdown"]
+            if self.structured_output["parecer"] else getattr(result, "raw", str(result))
+        )
         return result
 
 # Exemplo de como usar esta clase en main.py:
@@ -0,0 +1,266 @@
+"""
+Reanálise incremental de um caso já analisado, com resultados por documento.
+
+Quando todos os documentos do caso foram pré-carregados, a validação e a
+extração correm por documento (uma tarefa por documento, em paralelo) e os
+seus outputs são gravados junto ao informe (analysis_details["incremental"]),
+indexados pelo nome do documento e acompanhados do hash do texto parseado.
+Quando o caso é reenviado, cada documento é comparado com o anterior:
+
+- documento inalterado: a validação e a extração anteriores são reutilizadas;
+- documento novo ou alterado: só ele volta a ser validado e extraído;
+- documento removido: os seus resultados simplesmente saem da consolidação.
+
+A validação aplica regras de datas, por isso só é reutilizada quando o
+checklist e a data atual são os mesmos da análise anterior; a extração
+depende apenas do conteúdo do documento.
+
+Os resultados por documento são consolidados de forma determinística (sem
+LLM) antes da análise de risco: a validação num relatório por documento e a
+extração num único dossiê, com os conflitos entre documentos registados nas
+observações. O custo de uma reanálise cresce com o número de documentos
+alterados, não com o tamanho do caso.
+"""
+
+import hashlib
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+INCREMENTAL_STATE_VERSION = 2
+
+# Tarefas executadas por documento cujos outputs são guardados entre execuções
+PER_DOCUMENT_TASKS = ("validacao_documental", "extracao_dados")
+
+# Objetos que descrevem um único valor (um endereço não se monta com campos de documentos diferentes)
+_ATOMIC_FIELDS = {"enderecoSede", "enderecoResidencial"}
+_PERSON_LIST_FIELDS = {"dadosSociosRepresentantes"}
+_DIGITS = re.compile(r"\D")
+
+
+def text_fingerprint(text: Optional[str]) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def _validation_context_fingerprint(inputs: Dict[str, Any]) -> str:
+    """Tudo o que, além do documento, influencia o resultado da validação."""
+    return text_fingerprint(f"{inputs.get('checklist') or ''}|{inputs.get('current_date') or ''}")
+
+
+def plan_incremental(
+    previous_state: Optional[Dict[str, Any]],
+    prefetch_results: Optional[List[Dict[str, Any]]],
+    inputs: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Decide o que recalcular. Em modo "per_document" retorna, por tarefa, os documentos a
+    reprocessar; em modo "case" (documentos não pré-carregados) as tarefas correm sobre o
+    caso inteiro, como antes, e nada é reutilizado.
+    """
+    if not prefetch_results:
+        return {"mode": "case", "recompute": None, "reason": "documentos não pré-carregados"}
+    if any(doc["status"] != "ok" for doc in prefetch_results):
+        return {"mode": "case", "recompute": None, "reason": "falha no pré-carregamento de algum documento"}
+
+    names = [doc["name"] for doc in prefetch_results]
+    if not previous_state or previous_state.get("version") != INCREMENTAL_STATE_VERSION:
+        return {
+            "mode": "per_document",
+            "recompute": {task: list(names) for task in PER_DOCUMENT_TASKS},
+            "reason": "sem estado anterior",
+        }
+
+    previous_docs = previous_state.get("documents") or {}
+    same_context = previous_state.get("validation_context") == _validation_context_fingerprint(inputs)
+    recompute: Dict[str, List[str]] = {task: [] for task in PER_DOCUMENT_TASKS}
+    for doc in prefetch_results:
+        previous = previous_docs.get(doc["name"]) or {}
+        unchanged = previous.get("sha256") == text_fingerprint(doc["content"])
+        if not (unchanged and same_context and previous.get("validacao_documental")):
+            recompute["validacao_documental"].append(doc["name"])
+        # Uma extração anterior que não validou contra o modelo é refeita
+        if not (unchanged and (previous.get("extracao_dados") or {}).get("structured")):
+            recompute["extracao_dados"].append(doc["name"])
+
+    changed = sum(1 for doc in prefetch_results if (previous_docs.get(doc["name"]) or {}).get("sha256") != text_fingerprint(doc["content"]))
+    removed = sorted(set(previous_docs) - set(names))
+    reason = f"{changed} de {len(names)} documentos novos ou alterados"
+    if removed:
+        reason += f"; removidos: {', '.join(removed)}"
+    if not same_context:
+        reason += "; checklist ou data alterados (validação refeita)"
+    return {"mode": "per_document", "recompute": recompute, "reason": reason}
+
+
+def per_document_outputs(
+    previous_state: Optional[Dict[str, Any]],
+    prefetch_results: List[Dict[str, Any]],
+    plan: Dict[str, Any],
+    new_outputs: Dict[str, Dict[str, Dict[str, Any]]]
+) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    Outputs de cada tarefa por documento, na ordem dos documentos do caso: os recalculados
+    nesta execução (`new_outputs[tarefa][documento]`) e os reutilizados do estado anterior.
+    Cada output é {"structured": dict|None, "raw": str}.
+    """
+    previous_docs = (previous_state or {}).get("documents") or {}
+    outputs: Dict[str, Dict[str, Dict[str, Any]]] = {task: {} for task in PER_DOCUMENT_TASKS}
+    for task in PER_DOCUMENT_TASKS:
+        recomputed = set(plan["recompute"][task])
+        for doc in prefetch_results:
+            if doc["name"] in recomputed:
+                output = (new_outputs.get(task) or {}).get(doc["name"])
+            else:
+                output = (previous_docs.get(doc["name"]) or {}).get(task)
+            if output is not None:
+                outputs[task][doc["name"]] = output
+    return outputs
+
+
+def merge_validations(prefetch_results: List[Dict[str, Any]], validations: Dict[str, Dict[str, Any]]) -> str:
+    """Relatório de validação do caso: o veredito de cada documento, na ordem dos documentos."""
+    counts: Dict[str, int] = {}
+    sections = []
+    for doc in prefetch_results:
+        output = validations.get(doc["name"])
+        structured = (output or {}).get("structured")
+        status = structured["statusGeral"] if structured else "Sem veredito estruturado"
+        counts[status] = counts.get(status, 0) + 1
+        header = f"## {doc['name']} (tipo: {doc.get('type') or 'desconhecido'}) - {status}"
+        if structured:
+            lines = [header]
+            if structured.get("tipoDocumento"):
+                lines.append(f"Tipo identificado: {structured['tipoDocumento']}")
+            if structured.get("itens"):
+                lines.append("| Item do checklist | Status | Observações |")
+                lines.append("|---|---|---|")
+                for item in structured["itens"]:
+                    lines.append(f"| {item['item']} | {item['status']} | {item.get('observacoes') or ''} |")
+            lines.extend(f"- {note}" for note in structured.get("observacoes") or [])
+            sections.append("\n".join(lines))
+        else:
+            sections.append(f"{header}\n{(output or {}).get('raw') or 'Validação indisponível.'}")
+    summary = ", ".join(f"{status}: {total}" for status, total in counts.items())
+    return (
+        "# Relatório de validação documental (consolidado por documento)\n"
+        f"Documentos recebidos ({len(prefetch_results)}): {', '.join(doc['name'] for doc in prefetch_results)}\n"
+        f"Vereditos: {summary}\n"
+        "Itens obrigatórios do checklist sem documento correspondente devem ser tratados como pendência.\n\n"
+        + "\n\n".join(sections)
+    )
+
+
+def _is_empty(value: Any) -> bool:
+    if value is None or value == "" or value == [] or value == {}:
+        return True
+    if isinstance(value, dict):
+        return all(_is_empty(item) for item in value.values())
+    return False
+
+
+def _same(a: Any, b: Any) -> bool:
+    if isinstance(a, str) and isinstance(b, str):
+        return " ".join(a.split()).casefold() == " ".join(b.split()).casefold()
+    return json.dumps(a, sort_keys=True, default=str) == json.dumps(b, sort_keys=True, default=str)
+
+
+def _person_key(person: Dict[str, Any]) -> str:
+    cpf = _DIGITS.sub("", str(person.get("cpf") or ""))
+    if cpf:
+        return f"cpf:{cpf}"
+    return "nome:" + " ".join(str(person.get("nomeCompleto") or "").split()).casefold()
+
+
+def _merge_list(field: str, values: List[Tuple[str, List[Any]]], conflicts: List[str], path: str) -> List[Any]:
+    if field in _PERSON_LIST_FIELDS:
+        people: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+        for source, items in values:
+            for person in items:
+                if isinstance(person, dict) and not _is_empty(person):
+                    people.setdefault(_person_key(person), []).append((source, person))
+        return [_merge_dicts(entries, conflicts, f"{path}[{key}]") for key, entries in people.items()]
+    merged: List[Any] = []
+    for _, items in values:
+        for item in items:
+            if not any(_same(item, existing) for existing in merged):
+                merged.append(item)
+    return merged
+
+
+def _merge_dicts(values: List[Tuple[str, Dict[str, Any]]], conflicts: List[str], path: str = "") -> Dict[str, Any]:
+    """
+    Junta os dicionários (documento, valor) campo a campo: vale o primeiro valor não vazio na
+    ordem dos documentos; valores diferentes noutros documentos ficam registados em `conflicts`.
+    """
+    keys: List[str] = []
+    for _, value in values:
+        keys.extend(key for key in value if key not in keys)
+    merged: Dict[str, Any] = {}
+    for key in keys:
+        field_path = f"{path}.{key}" if path else key
+        present = [(source, value[key]) for source, value in values if not _is_empty(value.get(key))]
+        if not present:
+            merged[key] = next((value[key] for _, value in values if key in value), None)
+        elif key not in _ATOMIC_FIELDS and all(isinstance(value, dict) for _, value in present):
+            merged[key] = _merge_dicts(present, conflicts, field_path)
+        elif all(isinstance(value, list) for _, value in present):
+            merged[key] = _merge_list(key, present, conflicts, field_path)
+        else:
+            first_source, first = present[0]
+            merged[key] = first
+            for source, value in present[1:]:
+                if not _same(first, value):
+                    conflicts.append(
+                        f"Divergência em {field_path}: {json.dumps(first, ensure_ascii=False, default=str)} ({first_source}) "
+                        f"vs. {json.dumps(value, ensure_ascii=False, default=str)} ({source})"
+                    )
+    return merged
+
+
+def merge_dossies(prefetch_results: List[Dict[str, Any]], extractions: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Dossiê do caso a partir das extrações por documento, na ordem dos documentos. As divergências
+    entre documentos vão para outrasInformacoes.observacoes; extrações que não validaram contra o
+    modelo seguem em texto em 'extracoesNaoEstruturadas'.
+    """
+    structured = [
+        (doc["name"], extractions[doc["name"]]["structured"])
+        for doc in prefetch_results
+        if (extractions.get(doc["name"]) or {}).get("structured")
+    ]
+    conflicts: List[str] = []
+    dossie = _merge_dicts(structured, conflicts) if structured else {}
+    if conflicts:
+        outras = dossie.setdefault("outrasInformacoes", {}) or {}
+        outras["observacoes"] = list(outras.get("observacoes") or []) + conflicts
+        dossie["outrasInformacoes"] = outras
+    unstructured = [
+        {"documento": doc["name"], "texto": extractions[doc["name"]].get("raw")}
+        for doc in prefetch_results
+        if doc["name"] in extractions and not extractions[doc["name"]].get("structured")
+    ]
+    if unstructured:
+        dossie["extracoesNaoEstruturadas"] = unstructured
+    return dossie
+
+
+def build_incremental_state(
+    prefetch_results: List[Dict[str, Any]],
+    inputs: Dict[str, Any],
+    outputs: Dict[str, Dict[str, Dict[str, Any]]],
+    plan: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Estado a persistir com o informe para a próxima reanálise: hash e outputs de cada documento."""
+    return {
+        "version": INCREMENTAL_STATE_VERSION,
+        "validation_context": _validation_context_fingerprint(inputs),
+        "documents": {
+            doc["name"]: {
+                "type": doc.get("type"),
+                "sha256": text_fingerprint(doc["content"]),
+                **{task: outputs[task].get(doc["name"]) for task in PER_DOCUMENT_TASKS},
+            }
+            for doc in prefetch_results
+        },
+        "plan": plan,
+    }
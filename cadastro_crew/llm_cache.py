@@ -0,0 +1,175 @@
+"""
+Cache determinística das respostas do LLM, com modos de gravação e reprodução.
+
+Os agentes do "Crew de Cadastro" recebem um CachedLLM que delega as chamadas a
+um LLM real e guarda cada resposta numa base SQLite local, indexada pelo hash do
+modelo e dos seus parâmetros de amostragem, das stop words, da lista completa de
+mensagens, das ferramentas oferecidas e dos demais argumentos da chamada.
+
+Modos (variável LLM_CACHE_MODE):
+- off: sem cache, os agentes usam o LLM padrão da CrewAI.
+- record: chama sempre o LLM e grava/atualiza a resposta.
+- replay: responde apenas a partir da cache; uma chamada não gravada falha.
+- read-through: usa a cache quando existe e grava as respostas novas.
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from crewai import LLM, BaseLLM
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_MODES = ("off", "record", "replay", "read-through")
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "off").lower()
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "cache/llm_responses.db")
+
+# Parâmetros do LLM real que alteram a resposta e por isso entram na chave da cache
+_SAMPLING_PARAMS = ("temperature", "top_p", "max_tokens", "seed")
+# Argumentos da chamada que identificam quem chama, não o pedido (objetos sem representação estável)
+_CALLER_KWARGS = ("callbacks", "from_task", "from_agent")
+
+
+class LLMCacheMiss(RuntimeError):
+    """Chamada ao LLM sem resposta gravada em modo 'replay'."""
+
+
+class LLMResponseStore:
+    """Armazenamento SQLite das respostas do LLM, partilhável entre threads e processos."""
+
+    def __init__(self, db_path: str):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_responses ("
+            " cache_key TEXT PRIMARY KEY, model TEXT NOT NULL, response TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+
+    def get(self, cache_key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM llm_responses WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, cache_key: str, model: str, response: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (cache_key, model, response, created_at) VALUES (?, ?, ?, ?)",
+                (cache_key, model, response, time.time())
+            )
+
+
+class CachedLLM(BaseLLM):
+    """LLM que delega a um LLM real e grava/reproduz as respostas conforme o modo da cache."""
+
+    def __init__(self, inner: LLM, store: LLMResponseStore, mode: str):
+        super().__init__(model=inner.model, temperature=getattr(inner, "temperature", None))
+        self.inner = inner
+        self.store = store
+        self.mode = mode
+        self._stats_lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "recorded": 0}
+
+    def _cache_key(
+        self,
+        messages: Union[str, List[Dict[str, Any]]],
+        tools: Optional[List[dict]],
+        stop: List[str],
+        kwargs: Dict[str, Any]
+    ) -> str:
+        payload = json.dumps(
+            {
+                "model": self.model,
+                "params": {name: getattr(self.inner, name, None) for name in _SAMPLING_PARAMS},
+                "stop": sorted(stop),
+                "messages": messages,
+                "tools": tools,
+                "kwargs": {name: value for name, value in kwargs.items() if name not in _CALLER_KWARGS},
+            },
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _inner_for_call(self, stop: List[str]) -> LLM:
+        """
+        LLM real com as stop words desta chamada. O LLM real é partilhado pelos agentes que
+        correm em paralelo, por isso as stop words vão numa cópia rasa em vez de o alterar.
+        """
+        if list(getattr(self.inner, "stop", None) or []) == stop:
+            return self.inner
+        inner = copy.copy(self.inner)
+        inner.stop = stop
+        return inner
+
+    def _count(self, stat: str) -> None:
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+    def call(
+        self,
+        messages: Union[str, List[Dict[str, Any]]],
+        tools: Optional[List[dict]] = None,
+        callbacks: Optional[List[Any]] = None,
+        available_functions: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> Union[str, Any]:
+        # Os agentes definem as stop words no LLM que recebem (este); lê-las uma vez por chamada
+        stop = list(self.stop or [])
+        cache_key = self._cache_key(messages, tools, stop, kwargs)
+
+        if self.mode in ("replay", "read-through"):
+            cached = self.store.get(cache_key)
+            if cached is not None:
+                self._count("hits")
+                return cached
+            self._count("misses")
+            if self.mode == "replay":
+                raise LLMCacheMiss(f"Resposta do LLM não gravada para a chave {cache_key[:12]}... (modo replay).")
+
+        response = self._inner_for_call(stop).call(
+            messages,
+            tools=tools,
+            callbacks=callbacks,
+            available_functions=available_functions,
+            **kwargs
+        )
+        if isinstance(response, str):
+            self.store.put(cache_key, self.model, response)
+            self._count("recorded")
+        return response
+
+    def supports_function_calling(self) -> bool:
+        return self.inner.supports_function_calling()
+
+    def supports_stop_words(self) -> bool:
+        return self.inner.supports_stop_words()
+
+    def get_context_window_size(self) -> int:
+        return self.inner.get_context_window_size()
+
+
+def build_agent_llm() -> Optional[CachedLLM]:
+    """
+    Cria o LLM dos agentes conforme LLM_CACHE_MODE.
+    Retorna None no modo 'off' (os agentes usam o LLM padrão da CrewAI).
+    """
+    if LLM_CACHE_MODE == "off":
+        return None
+    if LLM_CACHE_MODE not in LLM_CACHE_MODES:
+        logger.warning(f"LLM_CACHE_MODE inválido '{LLM_CACHE_MODE}'; cache de LLM desativada.")
+        return None
+
+    model = os.getenv("MODEL") or os.getenv("OPENAI_MODEL_NAME") or "gpt-4o-mini"
+    logger.info(f"Cache de respostas do LLM ativa: modo={LLM_CACHE_MODE}, modelo={model}, base={LLM_CACHE_PATH}")
+    return CachedLLM(inner=LLM(model=model), store=LLMResponseStore(LLM_CACHE_PATH), mode=LLM_CACHE_MODE)
@@ -1,15 +1,22 @@
 #!/usr/bin/env python
+import argparse
+import json
+import statistics
 import sys
+import threading
+import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from textwrap import dedent
 from datetime import datetime
 import os
 from dotenv import load_dotenv
 from pathlib import Path # Adicionado para manipulação de caminhos
 import yaml
-from supabase import create_client, Client # Added supabase imports
+from supabase import Client # Added supabase imports
 
 from .crew import CadastroCrew
+from .resources import get_supabase_client, loaded_resources
 from .tools import SupabaseDocumentContentTool # Importar a nova ferramenta
 
 warnings.filterwarnings("ignore", category=SyntaxWarning, module="pysbd")
@@ -21,7 +28,12 @@ warnings.filterwarnings("ignore", category=SyntaxWarning, module="pysbd")
 
 # Carregar variáveis de ambiente do arquivo .env
 # É bom chamar isso o mais cedo possível.
-dotenv_path = Path(__file__).resolve().parent.parent.parent / '.env'
+# Diretório raiz do projeto (assumindo que main.py está em src/cadastro_crew)
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+# Relatórios gravados pelas execuções locais (run) e em lote (batch)
+REPORTS_DIR = PROJECT_ROOT / "reports"
+
+dotenv_path = PROJECT_ROOT / '.env'
 print(f"INFO: Caminho construído para .env: {dotenv_path}")
 print(f"INFO: Verificando existência de .env em {dotenv_path}: {dotenv_path.exists()}")
 
@@ -69,7 +81,7 @@ def setup_supabase_client() -> Client | None:
         return None 
     
     try:
-        supabase_client = create_client(supabase_url, supabase_key)
+        supabase_client = get_supabase_client(supabase_url, supabase_key)
         print("INFO: Cliente Supabase inicializado com sucesso em main.py (usando SERVICE_KEY conforme especificado).")
         return supabase_client
     except Exception as e:
@@ -169,6 +181,19 @@ def get_documents_for_case(client: Client, case_id: str) -> list:
         print(f"Erro ao buscar documentos para o case_id '{case_id}': {e}")
         return []
 
+def build_crew_inputs(case_id: str, documents: list, checklist: str, current_date: str,
+                      cnpj_fallback: str = '', cpf_socio_principal_fallback: str = '') -> dict:
+    """Inputs da CadastroCrew para um caso (comuns à execução local e à execução em lote)."""
+    return {
+        'case_id': case_id,
+        'documents': documents,
+        'checklist': checklist,
+        'current_date': current_date,
+        'dados_pj.cnpj': cnpj_fallback, # Este CNPJ é para a tarefa_geracao_relatorio
+        'lista_cpfs_socios': [],
+        'cpf_socio_principal': cpf_socio_principal_fallback
+    }
+
 def run():
     """
     Função principal para configurar e executar a CadastroCrew.
@@ -201,31 +226,30 @@ def run():
         # return 
     
     # Inputs para a crew
-    inputs = {
-        'case_id': case_id,
-        'documents': dynamic_documents_list, # Lista de documentos carregada dinamicamente
-        'checklist': parsed_checklist_content, 
-        'current_date': datetime.now().strftime('%Y-%m-%d'),
-        'dados_pj.cnpj': os.getenv('DADOS_PJ_CNPJ_FALLBACK', ''), # Este CNPJ é para a tarefa_geracao_relatorio
-        'lista_cpfs_socios': [], 
-        'cpf_socio_principal': os.getenv('CPF_SOCIO_PRINCIPAL_FALLBACK', '') 
-    }
+    inputs = build_crew_inputs(
+        case_id,
+        dynamic_documents_list, # Lista de documentos carregada dinamicamente
+        parsed_checklist_content,
+        datetime.now().strftime('%Y-%m-%d'),
+        cnpj_fallback=os.getenv('DADOS_PJ_CNPJ_FALLBACK', ''),
+        cpf_socio_principal_fallback=os.getenv('CPF_SOCIO_PRINCIPAL_FALLBACK', '')
+    )
 
     print(f"DEBUG: Inputs preparados para a CadastroCrew: {inputs}")
 
     cadastro_crew = CadastroCrew(inputs=inputs)
     print("INFO: Iniciando a execução do método run() do CadastroCrew...")
     try:
-        resultado = cadastro_crew.run()
+        cadastro_crew.run()
+        # Relatório em Markdown (do parecer estruturado quando disponível)
+        resultado = cadastro_crew.report
         print("\n---\nRESULTADO FINAL DA EXECUÇÃO DO CREW:\n")
         print(resultado)
         print("---")
 
         # Salvar o resultado em um arquivo Markdown
         try:
-            # Determinar o diretório raiz do projeto (assumindo que main.py está em src/cadastro_crew)
-            project_root = Path(__file__).resolve().parent.parent.parent 
-            reports_dir = project_root / "reports"
+            reports_dir = REPORTS_DIR
             reports_dir.mkdir(parents=True, exist_ok=True) # Cria o diretório se não existir
 
             timestamp = datetime.now().strftime("%Y-%m-%d_%H%M%S")
@@ -258,6 +282,206 @@ def run():
         import traceback
         traceback.print_exc()
 
+# Execução em lote: concorrência padrão e arquivo de checkpoint para retomar um lote interrompido
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "2"))
+# (caminhos relativos são resolvidos a partir da raiz do projeto, como os relatórios)
+BATCH_CHECKPOINT_PATH = PROJECT_ROOT / os.getenv("BATCH_CHECKPOINT_PATH", "reports/batch_checkpoint.jsonl")
+
+# CadastroAgents por thread do lote (ferramentas, clientes e modelos partilhados via resources.py)
+_batch_worker_state = threading.local()
+
+
+def _init_batch_worker():
+    from .agents import CadastroAgents
+    try:
+        _batch_worker_state.agents_manager = CadastroAgents()
+    except Exception as e:
+        # Sem agents_manager, CadastroCrew.run() constrói o seu a cada caso
+        print(f"AVISO: Falha ao inicializar CadastroAgents na thread do lote: {e}")
+        _batch_worker_state.agents_manager = None
+
+
+def get_case_ids_from_file(path: str) -> list:
+    """Lê case_ids de um arquivo (um por linha; linhas vazias e '#' são ignoradas), sem duplicados."""
+    case_ids = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            case_id = line.strip()
+            if case_id and not case_id.startswith("#"):
+                case_ids[case_id] = None
+    return list(case_ids)
+
+
+def get_case_ids_from_query(client: Client, query: str) -> list:
+    """
+    case_ids da tabela documents: 'all' devolve todos; 'pending' apenas os que
+    ainda não têm um informe com status 'success' em informe_cadastro.
+    """
+    unique_case_ids = {}
+    page_size, start = 1000, 0
+    while True:
+        response = client.table("documents").select("case_id").order("case_id").range(start, start + page_size - 1).execute()
+        rows = response.data or []
+        for row in rows:
+            if row.get("case_id"):
+                unique_case_ids[row["case_id"]] = None
+        if len(rows) < page_size:
+            break
+        start += page_size
+    case_ids = list(unique_case_ids)
+
+    if query == "pending" and case_ids:
+        done = set()
+        for i in range(0, len(case_ids), 200):
+            response = client.table("informe_cadastro").select("case_id").eq("status", "success").in_("case_id", case_ids[i:i + 200]).execute()
+            done.update(row["case_id"] for row in response.data or [])
+        case_ids = [case_id for case_id in case_ids if case_id not in done]
+    return case_ids
+
+
+def load_batch_checkpoint(path: Path) -> dict:
+    """Último estado registrado de cada case_id no checkpoint (JSONL)."""
+    state = {}
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Linha truncada por uma interrupção
+                state[entry["case_id"]] = entry
+    return state
+
+
+def run_batch_case(case_id: str, checklist: str, client: Client, current_date: str) -> dict:
+    """Executa a crew para um caso dentro de uma thread do lote e devolve o registro do checkpoint."""
+    start = time.perf_counter()
+    entry = {"case_id": case_id, "status": "ok", "error": None, "report": None}
+    try:
+        documents = get_documents_for_case(client, case_id)
+        if not documents:
+            raise RuntimeError("Nenhum documento mapeado para o caso")
+        inputs = build_crew_inputs(case_id, documents, checklist, current_date)
+        cadastro_crew = CadastroCrew(inputs=inputs, agents_manager=_batch_worker_state.agents_manager)
+        cadastro_crew.run()
+
+        reports_dir = REPORTS_DIR / "batch"
+        reports_dir.mkdir(parents=True, exist_ok=True)
+        report_path = reports_dir / f"relatorio_{case_id}.md"
+        report_path.write_text(str(cadastro_crew.report), encoding="utf-8")
+        entry["report"] = str(report_path)
+        parecer = cadastro_crew.structured_output.get("parecer")
+        entry["risk_score"] = parecer["scoreRisco"] if parecer else None
+        entry["run_details"] = {
+            key: cadastro_crew.run_details.get(key)
+            for key in ("task_timings", "incremental", "llm_cache")
+            if key in cadastro_crew.run_details
+        }
+    except Exception as e:
+        entry["status"] = "failed"
+        entry["error"] = f"{type(e).__name__}: {e}"
+    entry["duration_s"] = round(time.perf_counter() - start, 3)
+    entry["finished_at"] = datetime.now().isoformat()
+    return entry
+
+
+def batch(argv=None):
+    """
+    Executa a crew para vários casos num único processo, partilhando clientes,
+    modelos e caches entre eles:
+
+        python -m cadastro_crew.main batch --file case_ids.txt --concurrency 4
+        python -m cadastro_crew.main batch --query pending
+
+    O progresso é gravado num checkpoint JSONL; ao repetir o comando, os casos
+    já concluídos são ignorados (--retry-failed repete também os que falharam).
+
+    O lote não grava informes em informe_cadastro (só os relatórios em
+    reports/batch e o checkpoint). Por isso --query pending considera pendentes
+    os casos sem informe de sucesso gravado pelo serviço: os casos executados
+    por um lote anterior só são ignorados através do mesmo checkpoint.
+    """
+    parser = argparse.ArgumentParser(prog="cadastro_crew.main batch", description="Execução da CadastroCrew em lote")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--file", help="Arquivo com um case_id por linha")
+    source.add_argument("--query", choices=("all", "pending"), help="case_ids da tabela documents (pending = sem informe de sucesso em informe_cadastro; os casos do lote ficam só no checkpoint)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--checkpoint", default=str(BATCH_CHECKPOINT_PATH))
+    parser.add_argument("--retry-failed", action="store_true", help="Executa de novo os casos que falharam no checkpoint")
+    parser.add_argument("--limit", type=int, default=0, help="Máximo de casos a executar nesta invocação (0 = todos)")
+    args = parser.parse_args(argv)
+
+    s_client = setup_supabase_client()
+    if not s_client:
+        print("ERRO FATAL: Não foi possível inicializar o cliente Supabase. Saindo.")
+        return
+
+    case_ids = get_case_ids_from_file(args.file) if args.file else get_case_ids_from_query(s_client, args.query)
+    checkpoint_path = Path(args.checkpoint)
+    checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+    previous = load_batch_checkpoint(checkpoint_path)
+    skip_statuses = ("ok",) if args.retry_failed else ("ok", "failed")
+    pending = [case_id for case_id in case_ids if previous.get(case_id, {}).get("status") not in skip_statuses]
+    if args.limit > 0:
+        pending = pending[:args.limit]
+    print(f"INFO: {len(case_ids)} casos no lote, {len(case_ids) - len(pending)} já no checkpoint, {len(pending)} a executar (concorrência {args.concurrency}).")
+    if not pending:
+        return
+
+    # Checklist carregado uma única vez para todo o lote
+    checklist = get_checklist_content_from_checklist_config(s_client)
+    current_date = datetime.now().strftime('%Y-%m-%d')
+
+    results = []
+    checkpoint_lock = threading.Lock()
+    start = time.perf_counter()
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint, ThreadPoolExecutor(
+        max_workers=max(1, args.concurrency),
+        thread_name_prefix="batch-crew",
+        initializer=_init_batch_worker
+    ) as pool:
+        futures = [pool.submit(run_batch_case, case_id, checklist, s_client, current_date) for case_id in pending]
+        try:
+            for future in as_completed(futures):
+                entry = future.result()
+                results.append(entry)
+                with checkpoint_lock:
+                    checkpoint.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+                    checkpoint.flush()
+                print(
+                    f"INFO: [{len(results)}/{len(pending)}] {entry['case_id']}: {entry['status']} "
+                    f"em {entry['duration_s']}s{' - ' + entry['error'] if entry['error'] else ''}"
+                )
+        except KeyboardInterrupt:
+            print("AVISO: Lote interrompido; os casos concluídos estão no checkpoint e serão ignorados ao retomar.")
+            for future in futures:
+                future.cancel()
+            raise
+    wall_time = time.perf_counter() - start
+
+    durations = sorted(entry["duration_s"] for entry in results)
+    succeeded = sum(1 for entry in results if entry["status"] == "ok")
+    summary = {
+        "cases": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "skipped_from_checkpoint": len(case_ids) - len(pending),
+        "concurrency": args.concurrency,
+        "wall_time_s": round(wall_time, 1),
+        "cases_per_hour": round(len(results) / wall_time * 3600, 1) if wall_time else None,
+        "case_duration_s": {
+            "mean": round(statistics.mean(durations), 1),
+            "p50": round(statistics.median(durations), 1),
+            "p95": round(durations[min(len(durations) - 1, int(len(durations) * 0.95))], 1),
+            "sum": round(sum(durations), 1),
+        } if durations else None,
+        "shared_resources": loaded_resources(),
+        "checkpoint": str(checkpoint_path),
+    }
+    print("\n---\nRESUMO DO LOTE:\n")
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    return summary
+
 def train():
     """
     Train the crew for a given number of iterations.
@@ -300,4 +524,8 @@ def test():
 if __name__ == "__main__":
     # Este bloco permite executar o main.py diretamente com `python -m cadastro_crew.main`
     # ou `python src/cadastro_crew/main.py` (dependendo de como PYTHONPATH está configurado)
-    run()
+    # `python -m cadastro_crew.main batch ...` executa vários casos em lote (ver batch())
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        batch(sys.argv[2:])
+    else:
+        run()
@@ -0,0 +1,189 @@
+"""
+Modelos Pydantic dos outputs estruturados das tarefas.
+
+A validação de cada documento devolve uma ValidacaoDocumento, a extração um
+DossieCadastral (por documento ou do caso) e a análise de risco um ParecerRisco,
+validados uma única vez pela CrewAI (output_pydantic) e transportados como
+dicionários até a persistência, em vez de o serviço procurar o score e o
+resumo no texto do relatório com expressões regulares.
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Literal, Optional, Type, TypeVar
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator, model_validator
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+class _Flexible(BaseModel):
+    # Campos extra do LLM são preservados em vez de invalidar o output
+    model_config = ConfigDict(extra="allow")
+
+
+class Endereco(_Flexible):
+    logradouro: Optional[str] = None
+    numero: Optional[str] = None
+    complemento: Optional[str] = None
+    bairro: Optional[str] = None
+    cidade: Optional[str] = None
+    uf: Optional[str] = None
+    cep: Optional[str] = None
+
+
+class DadosPessoaJuridica(_Flexible):
+    razaoSocial: Optional[str] = None
+    nomeFantasia: Optional[str] = None
+    cnpj: Optional[str] = None
+    dataConstituicao: Optional[str] = None
+    enderecoSede: Optional[Endereco] = None
+    naturezaJuridica: Optional[str] = None
+    capitalSocial: Optional[str] = None
+    objetoSocial: Optional[str] = None
+    telefone: Optional[str] = None
+    email: Optional[str] = None
+
+
+class SocioRepresentante(_Flexible):
+    nomeCompleto: Optional[str] = None
+    cpf: Optional[str] = None
+    rg: Optional[str] = None
+    dataNascimento: Optional[str] = None
+    nacionalidade: Optional[str] = None
+    estadoCivil: Optional[str] = None
+    profissao: Optional[str] = None
+    enderecoResidencial: Optional[Endereco] = None
+    participacaoSocietaria: Optional[str] = None
+    cargo: Optional[str] = None
+    dataAdmissao: Optional[str] = None
+
+
+class DadosFinanceiros(_Flexible):
+    faturamentoUltimos12Meses: Optional[str] = None
+    periodoFaturamento: Optional[str] = None
+    faturamentoMensal: List[Dict[str, Any]] = Field(default_factory=list)
+    contadorNome: Optional[str] = None
+    contadorCRC: Optional[str] = None
+
+
+class OutrasInformacoes(_Flexible):
+    registroContrato: Optional[str] = None
+    dataUltimaAlteracao: Optional[str] = None
+    observacoes: List[str] = Field(default_factory=list)
+
+
+class DossieCadastral(_Flexible):
+    """Output da tarefa de extração de dados."""
+    dadosPessoaJuridica: DadosPessoaJuridica = Field(default_factory=DadosPessoaJuridica)
+    dadosSociosRepresentantes: List[SocioRepresentante] = Field(default_factory=list)
+    dadosFinanceiros: DadosFinanceiros = Field(default_factory=DadosFinanceiros)
+    outrasInformacoes: OutrasInformacoes = Field(default_factory=OutrasInformacoes)
+
+
+StatusValidacao = Literal["Conforme", "Não Conforme", "Pendência", "Não Aplicável"]
+
+_STATUS_ALIASES = {
+    "conforme": "Conforme",
+    "nao conforme": "Não Conforme", "não conforme": "Não Conforme",
+    "pendencia": "Pendência", "pendência": "Pendência",
+    "nao aplicavel": "Não Aplicável", "não aplicável": "Não Aplicável",
+}
+
+
+def _normalize_validation_status(value: Any) -> Any:
+    if isinstance(value, str):
+        return _STATUS_ALIASES.get(value.strip().lower(), value.strip())
+    return value
+
+
+class ItemValidacao(_Flexible):
+    item: str = Field(description="Item do checklist a que o documento corresponde")
+    status: StatusValidacao
+    observacoes: Optional[str] = None
+
+    @field_validator("status", mode="before")
+    @classmethod
+    def _normalize_status(cls, value: Any) -> Any:
+        return _normalize_validation_status(value)
+
+
+class ValidacaoDocumento(_Flexible):
+    """Output da validação de um único documento contra os itens do checklist que ele atende."""
+    documento: str
+    tipoDocumento: Optional[str] = None
+    statusGeral: StatusValidacao
+    itens: List[ItemValidacao] = Field(default_factory=list)
+    observacoes: List[str] = Field(default_factory=list)
+
+    @field_validator("statusGeral", mode="before")
+    @classmethod
+    def _normalize_status(cls, value: Any) -> Any:
+        return _normalize_validation_status(value)
+
+
+NivelRisco = Literal["Baixo", "Médio", "Alto"]
+
+# Mesmo mapeamento categórico -> numérico usado pelo serviço
+RISK_SCORE_NUMERIC = {"Baixo": 20, "Médio": 50, "Alto": 80}
+
+_RISK_ALIASES = {
+    "baixo": "Baixo", "low": "Baixo",
+    "medio": "Médio", "médio": "Médio", "medium": "Médio",
+    "alto": "Alto", "high": "Alto",
+}
+
+
+class Inconsistencia(_Flexible):
+    descricao: str
+    documentos: List[str] = Field(default_factory=list)
+    valorDocumentoA: Optional[str] = None
+    valorDocumentoB: Optional[str] = None
+
+
+class ParecerRisco(_Flexible):
+    """Output da tarefa de análise de risco: veredito estruturado e o relatório completo em Markdown."""
+    scoreRisco: NivelRisco
+    scoreRiscoNumerico: Optional[int] = Field(default=None, ge=0, le=100)
+    sumario: str = Field(description="Resumo do parecer em até 500 caracteres, para sistemas externos")
+    pendenciasCriticas: List[str] = Field(default_factory=list)
+    inconsistencias: List[Inconsistencia] = Field(default_factory=list)
+    relatorioMarkdown: str = Field(description="Relatório consolidado completo em Markdown")
+
+    @field_validator("scoreRisco", mode="before")
+    @classmethod
+    def _normalize_score(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            return _RISK_ALIASES.get(value.strip().lower(), value.strip())
+        return value
+
+    @model_validator(mode="after")
+    def _default_numeric(self) -> "ParecerRisco":
+        if self.scoreRiscoNumerico is None:
+            self.scoreRiscoNumerico = RISK_SCORE_NUMERIC[self.scoreRisco]
+        return self
+
+
+_JSON_FENCE = re.compile(r"```(?:json)?\s*(\{.*\})\s*```", re.DOTALL)
+
+
+def parse_model_output(raw: Optional[str], model: Type[ModelT]) -> Optional[ModelT]:
+    """Valida um output textual (JSON, possivelmente entre ```json```) contra o modelo; None se não for válido."""
+    if not raw:
+        return None
+    match = _JSON_FENCE.search(raw)
+    candidate = match.group(1) if match else raw[raw.find("{"):raw.rfind("}") + 1]
+    try:
+        return model.model_validate(json.loads(candidate))
+    except (ValueError, ValidationError):
+        return None
+
+
+def structured_output(task_output: Any, model: Type[ModelT]) -> Optional[Dict[str, Any]]:
+    """Dicionário do output estruturado de uma tarefa (TaskOutput.pydantic ou o raw validado)."""
+    if task_output is None:
+        return None
+    if isinstance(getattr(task_output, "pydantic", None), model):
+        return task_output.pydantic.model_dump()
+    parsed = parse_model_output(getattr(task_output, "raw", None), model)
+    return parsed.model_dump() if parsed is not None else None
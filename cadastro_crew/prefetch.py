@@ -0,0 +1,138 @@
+"""
+Etapa de pré-carregamento dos documentos de um caso antes do kickoff do Crew.
+
+Resolve as URLs de todos os documentos (SupabaseDocumentContentTool) e parseia
+todos eles concorrentemente (LlamaParseDirectTool), para que a latência de
+parseamento fique limitada pelo documento mais lento e não pela soma de todos.
+O texto resultante é injetado nos inputs do Crew, poupando aos agentes os
+turnos de LLM gastos a orquestrar chamadas às ferramentas.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Prefixos com que as ferramentas sinalizam falhas (elas retornam strings em vez de levantar exceções)
+_TOOL_ERROR_PREFIXES = (
+    "Error",
+    "An unexpected error",
+    "LlamaParse did not return",
+    "LlamaParse returned document(s) with no textual content",
+)
+
+NO_PREFETCH_PLACEHOLDER = (
+    "Nenhum documento foi pré-processado. Obtenha e parseie cada documento com as ferramentas "
+    "'Supabase Document Info Retriever' e 'LlamaParse Direct Document Parser'."
+)
+
+
+def _is_tool_error(text: Optional[str]) -> bool:
+    return not text or text.startswith(_TOOL_ERROR_PREFIXES)
+
+
+async def _prefetch_one(
+    case_id: str,
+    document: Dict[str, Any],
+    document_tool: Any,
+    parse_tool: Any,
+    semaphore: asyncio.Semaphore
+) -> Dict[str, Any]:
+    """Resolve a URL e parseia um único documento."""
+    name = document.get("name")
+    result: Dict[str, Any] = {
+        "name": name,
+        "type": document.get("type") or document.get("document_tag"),
+        "file_url": document.get("file_url"),
+        "status": "ok",
+        "content": None,
+        "error": None,
+        "parse": None,
+    }
+    start = time.perf_counter()
+    async with semaphore:
+        try:
+            if not result["file_url"]:
+                info = await asyncio.to_thread(document_tool._run, document_name=name, case_id=case_id)
+                if _is_tool_error(info):
+                    raise RuntimeError(info)
+                doc_info = json.loads(info)
+                result["file_url"] = doc_info.get("file_url")
+                result["type"] = result["type"] or doc_info.get("document_tag")
+
+            if parse_tool is None:
+                raise RuntimeError("LlamaParse indisponível neste ambiente.")
+
+            content = await parse_tool._arun(document_url=result["file_url"])
+            # Caminho de parseamento usado (cache, camada de texto local ou LlamaCloud)
+            result["parse"] = parse_tool.pop_parse_record(result["file_url"])
+            if _is_tool_error(content):
+                raise RuntimeError(content)
+            result["content"] = content
+        except Exception as e:
+            logger.warning(f"Falha no pré-carregamento do documento '{name}' (case_id: '{case_id}'): {e}")
+            result["status"] = "error"
+            result["error"] = str(e)
+    result["duration_s"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+async def prefetch_documents(
+    case_id: str,
+    documents: List[Dict[str, Any]],
+    document_tool: Any,
+    parse_tool: Any,
+    max_concurrency: int = 4
+) -> List[Dict[str, Any]]:
+    """Resolve e parseia concorrentemente todos os documentos de um caso, preservando a ordem."""
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    return await asyncio.gather(*[
+        _prefetch_one(case_id, document, document_tool, parse_tool, semaphore)
+        for document in documents
+    ])
+
+
+def format_parsed_documents(results: List[Dict[str, Any]]) -> str:
+    """Formata os documentos pré-carregados como texto para os inputs do Crew."""
+    if not results:
+        return NO_PREFETCH_PLACEHOLDER
+
+    sections = []
+    for doc in results:
+        header = f"### Documento: {doc['name']} (tipo: {doc.get('type') or 'desconhecido'})"
+        if doc["status"] == "ok":
+            sections.append(f"{header}\nfile_url: {doc['file_url']}\n\n{doc['content']}")
+        else:
+            sections.append(
+                f"{header}\nCONTEÚDO INDISPONÍVEL (erro no pré-carregamento: {doc['error']}). "
+                "Obtenha e parseie este documento com as ferramentas."
+            )
+    return "\n\n---\n\n".join(sections)
+
+
+def prefetch_report(results: List[Dict[str, Any]], wall_time_s: float) -> Dict[str, Any]:
+    """Resumo do pré-carregamento para os metadados da execução (sem o conteúdo parseado)."""
+    parse_paths: Dict[str, int] = {}
+    for doc in results:
+        if doc.get("parse"):
+            parse_paths[doc["parse"]["path"]] = parse_paths.get(doc["parse"]["path"], 0) + 1
+    return {
+        "wall_time_s": round(wall_time_s, 3),
+        "sum_document_time_s": round(sum(doc["duration_s"] for doc in results), 3),
+        "parse_paths": parse_paths,
+        "documents": [
+            {
+                "name": doc["name"],
+                "type": doc.get("type"),
+                "status": doc["status"],
+                "error": doc["error"],
+                "duration_s": doc["duration_s"],
+                "content_chars": len(doc["content"]) if doc["content"] else 0,
+                "parse": doc.get("parse"),
+            }
+            for doc in results
+        ],
+    }
@@ -0,0 +1,88 @@
+"""
+Registo, por processo, dos recursos pesados partilhados pelo serviço e pelas ferramentas.
+
+Clientes Supabase, modelos de embeddings e instâncias do LlamaParse são
+construídos de forma preguiçosa uma única vez por processo (por combinação de
+parâmetros) e partilhados por todas as ferramentas e workers do processo,
+evitando recarregar modelos e repetir handshakes a cada CadastroAgents.
+Cada recurso tem o seu próprio lock, de modo que carregar o modelo de
+embeddings não bloqueia quem só precisa do cliente Supabase.
+
+`reset_resources()` descarta tudo (para testes ou após mudar credenciais).
+"""
+
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from supabase import create_client, Client as SupabaseClient
+
+logger = logging.getLogger(__name__)
+
+_registry_lock = threading.Lock()
+_resources: Dict[Tuple[Any, ...], Any] = {}
+_labels: Dict[Tuple[Any, ...], str] = {}
+_resource_locks: Dict[Tuple[Any, ...], threading.Lock] = {}
+
+
+def _get_or_create(key: Tuple[Any, ...], label: str, factory: Callable[[], Any]) -> Any:
+    """Devolve o recurso registado em `key`, construindo-o com `factory` na primeira vez."""
+    with _registry_lock:
+        if key in _resources:
+            return _resources[key]
+        lock = _resource_locks.setdefault(key, threading.Lock())
+
+    with lock:
+        with _registry_lock:
+            if key in _resources:
+                return _resources[key]
+        resource = factory()  # Se falhar, nada é registado e a próxima chamada tenta de novo
+        with _registry_lock:
+            _resources[key] = resource
+            _labels[key] = label
+        logger.info(f"Recurso partilhado inicializado: {label}")
+        return resource
+
+
+def get_supabase_client(url: Optional[str] = None, service_key: Optional[str] = None) -> SupabaseClient:
+    """Cliente Supabase partilhado (por padrão com SUPABASE_URL/SUPABASE_SERVICE_KEY)."""
+    url = url or os.getenv("SUPABASE_URL")
+    service_key = service_key or os.getenv("SUPABASE_SERVICE_KEY")
+    if not url or not service_key:
+        raise ValueError("SUPABASE_URL ou SUPABASE_SERVICE_KEY não configurados.")
+    return _get_or_create(("supabase", url, service_key), "supabase", lambda: create_client(url, service_key))
+
+
+def get_embedding_model(model_name: str) -> Any:
+    """Modelo SentenceTransformer partilhado (a inferência com encode() é segura entre threads)."""
+    def load() -> Any:
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    return _get_or_create(("embedding_model", model_name), f"embedding_model:{model_name}", load)
+
+
+def get_llama_parser(api_key: str, result_type: str, language: str, mode: str) -> Any:
+    """Instância do LlamaParse partilhada por combinação de configuração (não guarda estado entre parseamentos)."""
+    def build() -> Any:
+        from llama_parse import LlamaParse
+        return LlamaParse(api_key=api_key, result_type=result_type, language=language, mode=mode)
+    return _get_or_create(
+        ("llama_parser", api_key, result_type, language, mode),
+        f"llama_parser:{mode}/{result_type}/{language}",
+        build
+    )
+
+
+def loaded_resources() -> List[str]:
+    """Tipos dos recursos já inicializados neste processo (sem credenciais)."""
+    with _registry_lock:
+        return sorted(_labels.values())
+
+
+def reset_resources() -> None:
+    """Descarta todos os recursos partilhados; serão reconstruídos no próximo pedido."""
+    with _registry_lock:
+        _resources.clear()
+        _labels.clear()
+        _resource_locks.clear()
@@ -1,12 +1,18 @@
+import os
 import yaml
 from pathlib import Path
 from crewai import Task
 
+from .models import DossieCadastral, ParecerRisco, ValidacaoDocumento
+
 # Carregar configurações das tarefas do arquivo YAML
 tasks_config_path = Path(__file__).parent / 'config/tasks.yaml'
 with open(tasks_config_path, 'r', encoding='utf-8') as file:
     tasks_config = yaml.safe_load(file)
 
+# Outputs estruturados (ValidacaoDocumento / DossieCadastral / ParecerRisco) nas tarefas de validação por documento, extração e risco
+CREW_STRUCTURED_OUTPUT = os.getenv("CREW_STRUCTURED_OUTPUT", "true").lower() == "true"
+
 class CadastroTasks:
     """
     Classe para criar e configurar as Tarefas do "Crew de Cadastro".
@@ -36,11 +42,33 @@ class CadastroTasks:
             description=config['description'],
             expected_output=config['expected_output'],
             agent=agente_extrator,
-            context=context_tasks if context_tasks else []
+            context=context_tasks if context_tasks else [],
+            output_pydantic=DossieCadastral if CREW_STRUCTURED_OUTPUT else None
             # async_execution=False
             # output_file=config.get('output_file')
         )
 
+    def tarefa_validacao_documento(self, agente_triagem) -> Task:
+        config = tasks_config['tarefa_validacao_documento']
+        # Placeholders: {case_id}, {documento_nome}, {checklist}, {current_date}, {documentos_parseados}
+        # ({documento_nome} e {documentos_parseados} vêm dos inputs próprios do nó do documento)
+        return Task(
+            description=config['description'],
+            expected_output=config['expected_output'],
+            agent=agente_triagem,
+            output_pydantic=ValidacaoDocumento if CREW_STRUCTURED_OUTPUT else None
+        )
+
+    def tarefa_extracao_documento(self, agente_extrator) -> Task:
+        config = tasks_config['tarefa_extracao_documento']
+        # Placeholders: {case_id}, {documento_nome}, {documentos_parseados}
+        return Task(
+            description=config['description'],
+            expected_output=config['expected_output'],
+            agent=agente_extrator,
+            output_pydantic=DossieCadastral if CREW_STRUCTURED_OUTPUT else None
+        )
+
     def tarefa_analise_risco(self, agente_risco, context_tasks=None) -> Task:
         config = tasks_config['tarefa_analise_risco_inconsistencias']
         # Placeholders: {case_id}, {dados_pj.cnpj}, {lista_cpfs_socios}
@@ -50,7 +78,8 @@ class CadastroTasks:
             description=config['description'],
             expected_output=config['expected_output'],
             agent=agente_risco,
-            context=context_tasks if context_tasks else []
+            context=context_tasks if context_tasks else [],
+            output_pydantic=ParecerRisco if CREW_STRUCTURED_OUTPUT else None
             # async_execution=False
             # output_file=config.get('output_file', 'report_analise_risco.md') # Exemplo de output file
         )
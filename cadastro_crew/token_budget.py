@@ -0,0 +1,288 @@
+"""
+Orçamento de tokens para os documentos parseados antes de chegarem aos agentes.
+
+O markdown do LlamaParse de um Contrato Social ou balanço longo ia inteiro
+para o contexto dos agentes e era carregado em todos os turnos. Esta etapa
+conta os tokens de cada documento, divide os que excedem o orçamento em
+trechos (por seção e, se preciso, por parágrafo) e mantém apenas os trechos
+mais relevantes para o checklist e para os campos de extração, na ordem
+original. O total do caso também tem um teto: acima dele, cada documento
+recebe uma fatia proporcional ao seu tamanho, e a soma das fatias (com os
+marcadores de trecho omitido) nunca excede TOKEN_BUDGET_PER_CASE.
+
+A contagem usa tiktoken quando disponível; senão, a aproximação de 4
+caracteres por token.
+"""
+
+import logging
+import math
+import os
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+CREW_TOKEN_BUDGET_ENABLED = os.getenv("CREW_TOKEN_BUDGET_ENABLED", "true").lower() == "true"
+TOKEN_BUDGET_PER_DOCUMENT = int(os.getenv("TOKEN_BUDGET_PER_DOCUMENT", "6000"))
+TOKEN_BUDGET_PER_CASE = int(os.getenv("TOKEN_BUDGET_PER_CASE", "24000"))
+TOKEN_BUDGET_CHUNK_TOKENS = int(os.getenv("TOKEN_BUDGET_CHUNK_TOKENS", "400"))
+TOKEN_BUDGET_ENCODING = os.getenv("TOKEN_BUDGET_ENCODING", "cl100k_base")
+# Nenhum documento fica com menos do que isto ao repartir o orçamento do caso
+TOKEN_BUDGET_MIN_PER_DOCUMENT = int(os.getenv("TOKEN_BUDGET_MIN_PER_DOCUMENT", "800"))
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding(TOKEN_BUDGET_ENCODING)
+    TOKENIZER = f"tiktoken:{TOKEN_BUDGET_ENCODING}"
+except Exception:
+    _ENCODING = None
+    TOKENIZER = "chars/4"
+
+OMITTED_MARKER = "[... trecho omitido pelo orçamento de tokens ...]"
+
+# Termos dos campos que o extrator e o analista de risco procuram (sem acentos, minúsculos)
+EXTRACTION_FIELD_KEYWORDS = {
+    "cnpj", "razao", "social", "nome", "fantasia", "socio", "socios", "cpf", "administrador",
+    "administracao", "capital", "quotas", "cotas", "endereco", "sede", "objeto", "atividade",
+    "cnae", "data", "abertura", "constituicao", "alteracao", "clausula", "assinatura", "junta",
+    "registro", "nire", "faturamento", "receita", "patrimonio", "liquido", "ativo", "passivo",
+    "lucro", "prejuizo", "situacao", "cadastral", "validade", "emissao", "representante", "poderes",
+}
+
+_STOPWORDS = {
+    "para", "como", "mais", "pelo", "pela", "pelos", "pelas", "deve", "devem", "estar", "sido",
+    "quando", "entre", "dentro", "seus", "suas", "este", "esta", "esse", "essa", "todos", "todas",
+    "ultimo", "ultimos", "ultima", "ultimas", "caso", "sobre", "qual", "quais", "outros", "outras",
+    "documentos", "documento", "aplicavel", "houver",
+}
+
+_HEADING = re.compile(r"^#{1,6}\s", re.MULTILINE)
+_WORD = re.compile(r"[a-z0-9]{3,}")
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 4)
+
+
+def _normalize(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def relevance_keywords(checklist: Optional[str]) -> Tuple[Set[str], Set[str]]:
+    """Termos do checklist (sem palavras vazias) e dos campos de extração."""
+    checklist_words = {
+        word for word in _WORD.findall(_normalize(checklist or ""))
+        if len(word) >= 4 and word not in _STOPWORDS and not word.isdigit()
+    }
+    return checklist_words, EXTRACTION_FIELD_KEYWORDS
+
+
+def _pack(pieces: List[str], separator: str, chunk_tokens: int) -> List[str]:
+    """Agrupa pedaços consecutivos em blocos de até ~chunk_tokens, subdividindo os que sozinhos excedem."""
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for piece in pieces:
+        piece_tokens = count_tokens(piece)
+        if piece_tokens > chunk_tokens:
+            if current:
+                chunks.append(separator.join(current))
+                current, current_tokens = [], 0
+            chunks.extend(_split_oversize(piece, separator, chunk_tokens))
+            continue
+        if current and current_tokens + piece_tokens > chunk_tokens:
+            chunks.append(separator.join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
+
+
+_SEPARATORS = ("\n\n", "\n", ". ")
+
+
+def _split_oversize(text: str, separator: str, chunk_tokens: int) -> List[str]:
+    """Divide um pedaço grande pelo próximo separador mais fino; sem separador, em janelas de caracteres."""
+    finer = _SEPARATORS[_SEPARATORS.index(separator) + 1:] if separator in _SEPARATORS else _SEPARATORS
+    for candidate in finer:
+        pieces = [piece.strip() for piece in text.split(candidate) if piece.strip()]
+        if len(pieces) > 1:
+            return _pack(pieces, candidate, chunk_tokens)
+    width = max(1, chunk_tokens * 4)
+    return [text[i:i + width] for i in range(0, len(text), width)]
+
+
+def split_chunks(text: str, chunk_tokens: int = TOKEN_BUDGET_CHUNK_TOKENS) -> List[str]:
+    """Divide o markdown em seções (títulos) e as seções grandes em blocos de parágrafos de ~chunk_tokens."""
+    starts = [match.start() for match in _HEADING.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    sections = [text[start:end].strip() for start, end in zip(starts, starts[1:] + [len(text)])]
+
+    chunks = []
+    for section in filter(None, sections):
+        if count_tokens(section) <= chunk_tokens:
+            chunks.append(section)
+        else:
+            chunks.extend(_split_oversize(section, "", chunk_tokens))
+    return chunks
+
+
+def _score(chunk: str, tokens: int, keywords: Tuple[Set[str], Set[str]]) -> float:
+    """Densidade de termos relevantes: campos de extração valem o dobro dos termos do checklist."""
+    words = set(_WORD.findall(_normalize(chunk)))
+    checklist_words, field_words = keywords
+    hits = len(words & checklist_words) + 2 * len(words & field_words)
+    return hits / max(1, tokens)
+
+
+def _truncate_tokens(text: str, tokens: int) -> str:
+    """Primeiros `tokens` tokens do texto."""
+    if tokens <= 0:
+        return ""
+    if _ENCODING is not None:
+        return _ENCODING.decode(_ENCODING.encode(text, disallowed_special=())[:tokens])
+    return text[:tokens * 4]
+
+
+def _assembled_tokens(chunk_tokens: List[int], kept: Set[int], marker_tokens: int, separator_tokens: int) -> int:
+    """Tokens do texto condensado: trechos mantidos, um marcador por lacuna e os separadores."""
+    total, parts, in_gap = 0, 0, False
+    for i, tokens in enumerate(chunk_tokens):
+        if i in kept:
+            total += tokens
+            parts += 1
+            in_gap = False
+        elif not in_gap:
+            total += marker_tokens
+            parts += 1
+            in_gap = True
+    return total + max(0, parts - 1) * separator_tokens
+
+
+def _assemble(chunks: List[str], kept: Set[int]) -> str:
+    parts: List[str] = []
+    for i, chunk in enumerate(chunks):
+        if i in kept:
+            parts.append(chunk)
+        elif not parts or parts[-1] != OMITTED_MARKER:
+            parts.append(OMITTED_MARKER)
+    return "\n\n".join(parts)
+
+
+def condense(text: str, budget: int, keywords: Tuple[Set[str], Set[str]]) -> Dict[str, Any]:
+    """
+    Reduz o texto a no máximo `budget` tokens (contando os marcadores de trecho omitido)
+    mantendo os trechos mais relevantes na ordem original. O primeiro trecho
+    (cabeçalho/identificação do documento) é sempre mantido, truncado se não couber.
+    """
+    tokens_before = count_tokens(text)
+    if tokens_before <= budget:
+        return {"text": text, "tokens_before": tokens_before, "tokens_after": tokens_before, "chunks": None}
+
+    chunks = split_chunks(text)
+    chunk_tokens = [count_tokens(chunk) for chunk in chunks]
+    marker_tokens = count_tokens(OMITTED_MARKER)
+    separator_tokens = count_tokens("\n\n")
+
+    # Cabeçalho: o que sobra do orçamento depois do marcador que segue a ele
+    tail_cost = marker_tokens + separator_tokens if len(chunks) > 1 else 0
+    if chunk_tokens[0] + tail_cost > budget:
+        chunks[0] = _truncate_tokens(chunks[0], budget - tail_cost)
+        chunk_tokens[0] = count_tokens(chunks[0])
+
+    scores = {i: _score(chunks[i], chunk_tokens[i], keywords) for i in range(1, len(chunks))}
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    kept = {0}
+    for i in ranked:
+        if _assembled_tokens(chunk_tokens, kept | {i}, marker_tokens, separator_tokens) <= budget:
+            kept.add(i)
+
+    condensed = _assemble(chunks, kept)
+    tokens_after = count_tokens(condensed)
+    # A contagem por partes é uma estimativa com tokenizadores reais: ajusta descartando os menos relevantes
+    while tokens_after > budget and len(kept) > 1:
+        kept.discard(min(kept - {0}, key=scores.get))
+        condensed = _assemble(chunks, kept)
+        tokens_after = count_tokens(condensed)
+    if tokens_after > budget:
+        condensed = _truncate_tokens(condensed, budget)
+        tokens_after = count_tokens(condensed)
+    return {
+        "text": condensed,
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "chunks": {"total": len(chunks), "kept": len(kept)},
+    }
+
+
+def case_budgets(capped: Dict[int, int], per_case: int) -> Dict[int, int]:
+    """
+    Reparte o orçamento do caso entre os documentos, proporcionalmente ao tamanho (já limitado)
+    de cada um. Cada documento recebe pelo menos TOKEN_BUDGET_MIN_PER_DOCUMENT, reduzido para
+    per_case // n quando os mínimos sozinhos excederiam o caso; a soma nunca passa de per_case.
+    """
+    if sum(capped.values()) <= per_case:
+        return dict(capped)
+    floor = min(TOKEN_BUDGET_MIN_PER_DOCUMENT, per_case // len(capped))
+    above_floor = {i: max(0, count - floor) for i, count in capped.items()}
+    total_above = sum(above_floor.values())
+    spare = per_case - floor * len(capped)
+    return {
+        i: min(count, floor + (spare * above_floor[i] // total_above if total_above else 0))
+        for i, count in capped.items()
+    }
+
+
+def apply_token_budget(
+    results: List[Dict[str, Any]],
+    checklist: Optional[str],
+    per_document: int = TOKEN_BUDGET_PER_DOCUMENT,
+    per_case: int = TOKEN_BUDGET_PER_CASE
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Aplica os orçamentos por documento e por caso aos resultados do pré-carregamento.
+    Retorna cópias dos resultados com o conteúdo condensado e o relatório de economia.
+    """
+    keywords = relevance_keywords(checklist)
+    tokens = {i: count_tokens(doc["content"]) for i, doc in enumerate(results) if doc.get("content")}
+    capped = {i: min(count, per_document) for i, count in tokens.items()}
+    budgets = case_budgets(capped, per_case)
+
+    condensed_results, documents = [], []
+    for i, doc in enumerate(results):
+        if i not in tokens:
+            condensed_results.append(doc)
+            continue
+        outcome = condense(doc["content"], budgets[i], keywords)
+        condensed_results.append({**doc, "content": outcome["text"]})
+        documents.append({
+            "name": doc["name"],
+            "budget": budgets[i],
+            "tokens_before": outcome["tokens_before"],
+            "tokens_after": outcome["tokens_after"],
+            "chunks": outcome["chunks"],
+        })
+
+    tokens_before = sum(doc["tokens_before"] for doc in documents)
+    tokens_after = sum(doc["tokens_after"] for doc in documents)
+    report = {
+        "tokenizer": TOKENIZER,
+        "per_document_budget": per_document,
+        "per_case_budget": per_case,
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": tokens_before - tokens_after,
+        "saved_ratio": round(1 - tokens_after / tokens_before, 3) if tokens_before else 0.0,
+        "documents_condensed": sum(1 for doc in documents if doc["chunks"] is not None),
+        "documents": documents,
+    }
+    return condensed_results, report
@@ -1,9 +1,11 @@
 from .llama_cloud_parsing_tool import LlamaParseDirectTool
 from .knowledge_base_query_tool import KnowledgeBaseQueryTool
 from .supabase_document_tool import SupabaseDocumentContentTool
+from .cached_serper_tool import CachedSerperDevTool
 
 __all__ = [
     "LlamaParseDirectTool",
     "KnowledgeBaseQueryTool",
-    "SupabaseDocumentContentTool"
+    "SupabaseDocumentContentTool",
+    "CachedSerperDevTool"
 ]
@@ -0,0 +1,163 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Set, Tuple
+
+from crewai_tools import SerperDevTool
+
+logger = logging.getLogger(__name__)
+
+SERPER_CACHE_PATH_DEFAULT = "cache/serper.db"
+SERPER_CACHE_TTL_SECONDS_DEFAULT = 7 * 24 * 3600
+SERPER_CACHE_STALE_SECONDS_DEFAULT = 30 * 24 * 3600
+
+# CNPJ e CPF com ou sem pontuação: "12.345.678/0001-90" e "12345678000190" geram a mesma chave
+_CNPJ_RE = re.compile(r"\b\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2}\b")
+_CPF_RE = re.compile(r"\b\d{3}\.?\d{3}\.?\d{3}-?\d{2}\b")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_search_query(query: str) -> str:
+    """Normaliza a query de busca: documentos (CNPJ/CPF) só com dígitos, minúsculas e espaços colapsados."""
+    digits_only = lambda match: re.sub(r"\D", "", match.group(0))
+    normalized = _CNPJ_RE.sub(digits_only, query)
+    normalized = _CPF_RE.sub(digits_only, normalized)
+    return _WHITESPACE_RE.sub(" ", normalized).strip().lower()
+
+
+class SearchResultStore:
+    """Armazenamento persistente (SQLite) dos resultados de busca, partilhável entre processos."""
+
+    def __init__(self, db_path: str):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS search_results ("
+            " cache_key TEXT PRIMARY KEY, query TEXT NOT NULL, result TEXT NOT NULL, fetched_at REAL NOT NULL)"
+        )
+
+    def get(self, cache_key: str) -> Optional[Tuple[Any, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, fetched_at FROM search_results WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def put(self, cache_key: str, query: str, result: Any) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_results (cache_key, query, result, fetched_at) VALUES (?, ?, ?, ?)",
+                (cache_key, query, json.dumps(result, ensure_ascii=False), time.time())
+            )
+
+
+class CachedSerperDevTool(SerperDevTool):
+    """
+    SerperDevTool com cache persistente por query normalizada.
+
+    - Dentro do TTL: o resultado em cache é devolvido sem chamar a API.
+    - Entre o TTL e TTL + janela de stale: devolve o resultado antigo e revalida em segundo plano.
+    - Depois disso: busca de forma síncrona; se a busca falhar, devolve o resultado antigo se existir.
+    """
+    _store: Optional[SearchResultStore] = None
+    _ttl_seconds: float = SERPER_CACHE_TTL_SECONDS_DEFAULT
+    _stale_seconds: float = SERPER_CACHE_STALE_SECONDS_DEFAULT
+    _refreshing: Optional[Set[str]] = None
+    _refresh_lock: Optional[Any] = None
+    _stats: Optional[Dict[str, int]] = None
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._ttl_seconds = float(os.getenv("SERPER_CACHE_TTL_SECONDS", str(SERPER_CACHE_TTL_SECONDS_DEFAULT)))
+        self._stale_seconds = float(os.getenv("SERPER_CACHE_STALE_SECONDS", str(SERPER_CACHE_STALE_SECONDS_DEFAULT)))
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "background_refreshes": 0, "stale_on_error": 0}
+        cache_path = os.getenv("SERPER_CACHE_PATH", SERPER_CACHE_PATH_DEFAULT)
+        try:
+            self._store = SearchResultStore(cache_path)
+        except Exception as e:
+            logger.warning(f"Cache do Serper indisponível ({cache_path}): {e}")
+            self._store = None
+
+    @staticmethod
+    def _cache_key(kwargs: Dict[str, Any]) -> Tuple[str, str]:
+        query = str(kwargs.get("search_query") or kwargs.get("query") or "")
+        normalized_query = normalize_search_query(query)
+        other_args = {k: v for k, v in kwargs.items() if k not in ("search_query", "query")}
+        return json.dumps([normalized_query, other_args], sort_keys=True, default=str), normalized_query
+
+    def cache_stats(self) -> Optional[Dict[str, int]]:
+        if self._stats is None:
+            return None
+        with self._refresh_lock:  # type: ignore[union-attr]
+            return dict(self._stats)
+
+    def _count(self, name: str) -> None:
+        # Chamado das threads paralelas do DAG e da thread de revalidação
+        with self._refresh_lock:  # type: ignore[union-attr]
+            self._stats[name] += 1  # type: ignore[index]
+
+    def _fetch_and_store(self, cache_key: str, normalized_query: str, kwargs: Dict[str, Any]) -> Any:
+        result = super()._run(**kwargs)
+        try:
+            self._store.put(cache_key, normalized_query, result)  # type: ignore[union-attr]
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Resultado do Serper não serializável, não será guardado em cache: {e}")
+        return result
+
+    def _refresh_in_background(self, cache_key: str, normalized_query: str, kwargs: Dict[str, Any]) -> None:
+        with self._refresh_lock:  # type: ignore[union-attr]
+            if cache_key in self._refreshing:  # type: ignore[operator]
+                return
+            self._refreshing.add(cache_key)  # type: ignore[union-attr]
+            self._stats["background_refreshes"] += 1  # type: ignore[index]
+
+        def refresh() -> None:
+            try:
+                self._fetch_and_store(cache_key, normalized_query, kwargs)
+            except Exception as e:
+                logger.warning(f"Falha ao revalidar em segundo plano a busca '{normalized_query}': {e}")
+            finally:
+                with self._refresh_lock:  # type: ignore[union-attr]
+                    self._refreshing.discard(cache_key)  # type: ignore[union-attr]
+
+        threading.Thread(target=refresh, name="serper-refresh", daemon=True).start()
+
+    def _run(self, **kwargs: Any) -> Any:
+        if self._store is None:
+            return super()._run(**kwargs)
+
+        cache_key, normalized_query = self._cache_key(kwargs)
+        cached = self._store.get(cache_key)
+        if cached is not None:
+            result, fetched_at = cached
+            age = time.time() - fetched_at
+            if age < self._ttl_seconds:
+                self._count("hits")
+                logger.info(f"Busca '{normalized_query}' servida da cache (idade {int(age)}s).")
+                return result
+            if age < self._ttl_seconds + self._stale_seconds:
+                self._count("stale_hits")
+                logger.info(f"Busca '{normalized_query}' servida da cache (stale); revalidando em segundo plano.")
+                self._refresh_in_background(cache_key, normalized_query, kwargs)
+                return result
+
+        self._count("misses")
+        try:
+            return self._fetch_and_store(cache_key, normalized_query, kwargs)
+        except Exception:
+            if cached is not None:
+                self._count("stale_on_error")
+                logger.warning(f"Falha na busca '{normalized_query}'; devolvendo resultado antigo da cache.")
+                return cached[0]
+            raise
@@ -0,0 +1,88 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+KB_EMBEDDING_CACHE_MAX_MB_DEFAULT = 16
+KB_EMBEDDING_CACHE_TTL_SECONDS_DEFAULT = 24 * 3600
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class EmbeddingCache:
+    """
+    Cache LRU/TTL em memória de query normalizada -> embedding.
+
+    Os vetores são guardados como arrays float32 compactos e o total de bytes
+    (vetores + chaves) é limitado por `max_bytes`; ao exceder o orçamento as
+    entradas menos usadas recentemente são removidas.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Normaliza a query (Unicode NFC, minúsculas, espaços colapsados) para usar como chave."""
+        return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFC", query)).strip().lower()
+
+    @staticmethod
+    def _entry_size(key: str, vector: np.ndarray) -> int:
+        return vector.nbytes + len(key.encode("utf-8"))
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] > self.ttl_seconds:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, vector: Any) -> np.ndarray:
+        array = np.ascontiguousarray(vector, dtype=np.float32)
+        size = self._entry_size(key, array)
+        if size > self.max_bytes:
+            return array
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (array, time.monotonic())
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+        return array
+
+    def _remove(self, key: str) -> None:
+        vector, _ = self._entries.pop(key)
+        self._bytes -= self._entry_size(key, vector)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions,
+                "size_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
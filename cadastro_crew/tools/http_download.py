@@ -0,0 +1,246 @@
+"""
+Download em streaming dos documentos, com clientes httpx partilhados pelo processo.
+
+Um cliente síncrono e um assíncrono por event loop mantêm o pool de conexões
+keep-alive (e HTTP/2, se o pacote 'h2' estiver instalado) entre documentos.
+Cada download acumula em memória até o limite pedido pelo chamador (no
+parser, LLAMA_PARSE_MEMORY_MAX_MB); acima disso o conteúdo é despejado num
+arquivo em DOWNLOAD_SPOOL_DIR (por padrão /dev/shm, se existir). A
+transferência é abortada com DownloadTooLarge quando o Content-Length ou os
+bytes recebidos excedem DOWNLOAD_MAX_BYTES.
+"""
+
+import asyncio
+import importlib.util
+import logging
+import os
+import tempfile
+import threading
+import weakref
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_MAX_BYTES_DEFAULT = 100 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# Limites e tempos das transferências (o servidor de origem pode ser lento ou servir arquivos enormes)
+DOWNLOAD_MAX_BYTES = int(os.getenv("DOWNLOAD_MAX_BYTES", str(DOWNLOAD_MAX_BYTES_DEFAULT)))
+DOWNLOAD_CONNECT_TIMEOUT_SECONDS = float(os.getenv("DOWNLOAD_CONNECT_TIMEOUT_SECONDS", "10"))
+DOWNLOAD_READ_TIMEOUT_SECONDS = float(os.getenv("DOWNLOAD_READ_TIMEOUT_SECONDS", "60"))
+DOWNLOAD_MAX_CONNECTIONS = int(os.getenv("DOWNLOAD_MAX_CONNECTIONS", "20"))
+# HTTP/2 só é usado se o pacote opcional 'h2' estiver instalado (pip install httpx[http2])
+DOWNLOAD_HTTP2 = (
+    os.getenv("DOWNLOAD_HTTP2", "true").lower() == "true"
+    and importlib.util.find_spec("h2") is not None
+)
+
+
+class DownloadTooLarge(Exception):
+    """O arquivo remoto excede DOWNLOAD_MAX_BYTES."""
+
+
+def _client_options() -> dict:
+    return {
+        "http2": DOWNLOAD_HTTP2,
+        "timeout": httpx.Timeout(DOWNLOAD_READ_TIMEOUT_SECONDS, connect=DOWNLOAD_CONNECT_TIMEOUT_SECONDS),
+        "limits": httpx.Limits(
+            max_connections=DOWNLOAD_MAX_CONNECTIONS,
+            max_keepalive_connections=DOWNLOAD_MAX_CONNECTIONS
+        ),
+    }
+
+
+_sync_client: Optional[httpx.Client] = None
+_sync_client_lock = threading.Lock()
+# Um httpx.AsyncClient só pode ser usado no event loop em que foi criado
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_sync_client() -> httpx.Client:
+    """Cliente síncrono partilhado pelo processo (pool de conexões keep-alive)."""
+    global _sync_client
+    with _sync_client_lock:
+        if _sync_client is None:
+            _sync_client = httpx.Client(**_client_options())
+        return _sync_client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Cliente assíncrono partilhado pelas corrotinas do event loop atual."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(**_client_options())
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_client() -> None:
+    """Fecha o cliente assíncrono do event loop atual (chamar antes de o loop terminar)."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _default_spool_dir() -> Optional[str]:
+    """/dev/shm (tmpfs, em memória) quando disponível; senão o diretório temporário padrão."""
+    return "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else None
+
+
+# Diretório dos arquivos que precisam de um caminho (documentos grandes ou modo 'tempfile')
+DOWNLOAD_SPOOL_DIR = os.getenv("DOWNLOAD_SPOOL_DIR") or _default_spool_dir()
+
+
+@dataclass
+class DownloadedDocument:
+    """Documento baixado: em memória (`data`) ou, se não couber no limite de memória, num arquivo (`path`)."""
+    url: str
+    file_name: str
+    size: int
+    data: Optional[bytes] = None
+    path: Optional[str] = None
+    # False para arquivos locais fornecidos pelo chamador, que nunca são removidos
+    owned: bool = True
+
+    @classmethod
+    def local(cls, path: str) -> "DownloadedDocument":
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        return cls(url=path, file_name=os.path.basename(path), size=size, path=path, owned=False)
+
+    def spool_to_file(self, spool_dir: Optional[str] = DOWNLOAD_SPOOL_DIR) -> str:
+        """Grava o conteúdo em memória num arquivo (tmpfs se disponível) quando um caminho é inevitável."""
+        if self.path is None:
+            with tempfile.NamedTemporaryFile(
+                delete=False, suffix=os.path.splitext(self.file_name)[1], dir=spool_dir, mode="wb"
+            ) as f:
+                f.write(self.data or b"")
+            self.path = f.name
+        return self.path
+
+    def cleanup(self) -> None:
+        if self.path and self.owned:
+            _remove_quietly(self.path)
+            self.path = None
+
+
+def file_name_from_url(url: str, default_suffix: str = ".pdf") -> str:
+    """Nome do arquivo na URL (sem parâmetros de consulta), com extensão para a detecção do tipo."""
+    last_segment = url.split("?")[0].rstrip("/").split("/")[-1] or "document"
+    return last_segment if "." in last_segment else last_segment + default_suffix
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class _DownloadSink:
+    """
+    Destino de um download em streaming: acumula em memória até `memory_limit`
+    bytes e, acima disso, despeja o conteúdo num arquivo em `spool_dir` e
+    continua a escrever nele. Aborta acima de `max_bytes`.
+    """
+
+    def __init__(self, url: str, memory_limit: int, max_bytes: int, spool_dir: Optional[str]):
+        self.url = url
+        self.memory_limit = memory_limit
+        self.max_bytes = max_bytes
+        self.spool_dir = spool_dir
+        self.buffer = bytearray()
+        self.file = None
+        self.received = 0
+
+    def start(self, response: httpx.Response) -> None:
+        declared = response.headers.get("content-length")
+        if declared and declared.isdigit():
+            if int(declared) > self.max_bytes:
+                raise DownloadTooLarge(f"{self.url} declara {declared} bytes (limite: {self.max_bytes}).")
+            if int(declared) > self.memory_limit:
+                self._spill()
+
+    def write(self, chunk: bytes) -> None:
+        self.received += len(chunk)
+        if self.received > self.max_bytes:
+            raise DownloadTooLarge(f"{self.url} excede o limite de {self.max_bytes} bytes.")
+        if self.file is not None:
+            self.file.write(chunk)
+            return
+        self.buffer.extend(chunk)
+        if len(self.buffer) > self.memory_limit:
+            self._spill()
+
+    def _spill(self) -> None:
+        self.file = tempfile.NamedTemporaryFile(
+            delete=False, suffix=os.path.splitext(file_name_from_url(self.url))[1], dir=self.spool_dir, mode="wb"
+        )
+        self.file.write(self.buffer)
+        self.buffer = bytearray()
+
+    def finish(self) -> DownloadedDocument:
+        document = DownloadedDocument(url=self.url, file_name=file_name_from_url(self.url), size=self.received)
+        if self.file is not None:
+            self.file.close()
+            document.path = self.file.name
+        else:
+            document.data = bytes(self.buffer)
+        logger.info(
+            f"Arquivo baixado de {self.url} ({self.received} bytes, "
+            f"{'arquivo ' + document.path if document.path else 'em memória'})"
+        )
+        return document
+
+    def abort(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            _remove_quietly(self.file.name)
+
+
+async def adownload(
+    url: str,
+    memory_limit: int,
+    max_bytes: int = DOWNLOAD_MAX_BYTES,
+    spool_dir: Optional[str] = DOWNLOAD_SPOOL_DIR
+) -> DownloadedDocument:
+    """
+    Baixa a URL em streaming. Documentos até `memory_limit` bytes ficam em
+    memória; os maiores vão para um arquivo em `spool_dir` (memory_limit=0
+    grava sempre em arquivo). A transferência é abortada assim que o tamanho
+    excede `max_bytes` (pelo Content-Length ou durante a leitura).
+    """
+    sink = _DownloadSink(url, memory_limit, max_bytes, spool_dir)
+    try:
+        async with get_async_client().stream("GET", url) as response:
+            response.raise_for_status()
+            sink.start(response)
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                sink.write(chunk)
+    except BaseException:
+        sink.abort()
+        raise
+    return sink.finish()
+
+
+def download(
+    url: str,
+    memory_limit: int,
+    max_bytes: int = DOWNLOAD_MAX_BYTES,
+    spool_dir: Optional[str] = DOWNLOAD_SPOOL_DIR
+) -> DownloadedDocument:
+    """Versão síncrona de `adownload`, usando o cliente síncrono partilhado."""
+    sink = _DownloadSink(url, memory_limit, max_bytes, spool_dir)
+    try:
+        with get_sync_client().stream("GET", url) as response:
+            response.raise_for_status()
+            sink.start(response)
+            for chunk in response.iter_bytes(DOWNLOAD_CHUNK_SIZE):
+                sink.write(chunk)
+    except BaseException:
+        sink.abort()
+        raise
+    return sink.finish()
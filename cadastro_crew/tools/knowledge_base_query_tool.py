@@ -6,9 +6,13 @@ from crewai.tools import BaseTool
 # Dependências para a Knowledge Base (exemplo com Supabase/pgvector e SentenceTransformers)
 # pip install supabase sentence-transformers
 # Lembre-se de configurar o Supabase e a extensão pgvector
-from supabase import create_client, Client as SupabaseClient
+from supabase import Client as SupabaseClient
 from sentence_transformers import SentenceTransformer
 
+from ..resources import get_embedding_model, get_supabase_client
+
+from .embedding_cache import EmbeddingCache, KB_EMBEDDING_CACHE_MAX_MB_DEFAULT, KB_EMBEDDING_CACHE_TTL_SECONDS_DEFAULT
+
 # --- Configuração da Knowledge Base (Supabase) ---
 # REMOVER a leitura de variáveis de ambiente daqui
 # SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -45,6 +49,8 @@ class KnowledgeBaseQueryTool(BaseTool):
     _supabase_service_key: Optional[str] = None
     _kb_table_name: str = KB_TABLE_NAME_DEFAULT
     _embedding_model_name: str = EMBEDDING_MODEL_NAME_DEFAULT
+    # Memoização dos embeddings das queries (as tarefas repetem queries quase idênticas em cada caso)
+    _embedding_cache: Optional[EmbeddingCache] = None
 
     def __init__(self, **kwargs):
         """
@@ -58,6 +64,10 @@ class KnowledgeBaseQueryTool(BaseTool):
         self._supabase_service_key = os.getenv("SUPABASE_SERVICE_KEY")
         self._kb_table_name = os.getenv("KB_TABLE_NAME", KB_TABLE_NAME_DEFAULT)
         self._embedding_model_name = os.getenv("EMBEDDING_MODEL_NAME", EMBEDDING_MODEL_NAME_DEFAULT)
+        self._embedding_cache = EmbeddingCache(
+            max_bytes=int(float(os.getenv("KB_EMBEDDING_CACHE_MAX_MB", str(KB_EMBEDDING_CACHE_MAX_MB_DEFAULT))) * 1024 * 1024),
+            ttl_seconds=float(os.getenv("KB_EMBEDDING_CACHE_TTL_SECONDS", str(KB_EMBEDDING_CACHE_TTL_SECONDS_DEFAULT)))
+        )
 
         if not self._supabase_url or not self._supabase_service_key:
             print(f"ALERTA (KnowledgeBaseQueryTool): Variáveis SUPABASE_URL ({self._supabase_url is not None}) ou SUPABASE_SERVICE_KEY ({self._supabase_service_key is not None}) não configuradas ou faltando. A ferramenta pode não funcionar.")
@@ -66,19 +76,40 @@ class KnowledgeBaseQueryTool(BaseTool):
             return
 
         try:
-            self._supabase_client = create_client(self._supabase_url, self._supabase_service_key)
+            self._supabase_client = get_supabase_client(self._supabase_url, self._supabase_service_key)
             print("INFO: Cliente Supabase inicializado para a KnowledgeBaseQueryTool.")
         except Exception as e:
             print(f"ERRO CRÍTICO (KnowledgeBaseQueryTool): Não foi possível inicializar o cliente Supabase: {e}")
             self._supabase_client = None
 
         try:
-            self._embedding_model = SentenceTransformer(self._embedding_model_name)
+            # Modelo partilhado por todas as instâncias da ferramenta no processo
+            self._embedding_model = get_embedding_model(self._embedding_model_name)
             print(f"INFO: Modelo de embedding \'{self._embedding_model_name}\' carregado para KnowledgeBaseQueryTool.")
         except Exception as e:
             print(f"ERRO CRÍTICO (KnowledgeBaseQueryTool): Não foi possível carregar o modelo de embedding \'{self._embedding_model_name}\': {e}")
             self._embedding_model = None
 
+    def embedding_cache_stats(self) -> Optional[dict]:
+        """Estatísticas (hit rate, bytes usados) da cache de embeddings das queries."""
+        return self._embedding_cache.stats() if self._embedding_cache else None
+
+    def _embed_query(self, query: str) -> list:
+        """Gera (ou obtém da cache) o embedding da query normalizada."""
+        normalized_query = EmbeddingCache.normalize(query)
+        if self._embedding_cache is not None:
+            cached = self._embedding_cache.get(normalized_query)
+            if cached is not None:
+                print("INFO: Embedding da query obtido da cache.")
+                return cached.tolist()
+
+        print("INFO: Gerando embedding para a query...")
+        vector = self._embedding_model.encode(normalized_query) # type: ignore
+        if self._embedding_cache is not None:
+            vector = self._embedding_cache.put(normalized_query, vector)
+        print("INFO: Embedding da query gerado.")
+        return vector.tolist()
+
     def _run(self, query: str, top_k: int = 3) -> str:
         """
         Executa a consulta na Knowledge Base.
@@ -98,10 +129,8 @@ class KnowledgeBaseQueryTool(BaseTool):
         print(f"INFO (KnowledgeBaseQueryTool): Recebida query para KB: \'{query}\', top_k={top_k}")
 
         try:
-            # 1. Gerar embedding para a query
-            print("INFO: Gerando embedding para a query...")
-            query_embedding = self._embedding_model.encode(query).tolist() # type: ignore
-            print("INFO: Embedding da query gerado.")
+            # 1. Gerar embedding para a query (memoizado por query normalizada)
+            query_embedding = self._embed_query(query)
 
             # 2. Consultar Supabase usando uma função RPC (stored procedure) para busca de similaridade
             #    Esta função 'match_documents' (ou similar) precisaria ser criada no seu Supabase
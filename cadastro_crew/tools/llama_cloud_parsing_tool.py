@@ -1,17 +1,30 @@
 import os
-import tempfile
+import time
 import asyncio
+import threading
+from collections import OrderedDict
 import httpx # Usado para baixar arquivos de URLs
-from typing import Type, Optional, Literal, List, Any
+from typing import Type, Optional, Literal, List, Any, Dict, Union
 from pydantic import BaseModel, Field, validator # MODIFICADO: Usar pydantic (V2)
 from crewai.tools import BaseTool
 from dotenv import load_dotenv
 # import llamacloud # Removido - não é necessário, já que usamos llama_parse diretamente
 import logging # Adicionado para o logger que já existe
 
+from .parse_cache import ParseCache, LLAMA_PARSE_CACHE_DIR_DEFAULT, LLAMA_PARSE_CACHE_MAX_MB_DEFAULT
+from ..resources import get_llama_parser
+from .local_text_extractor import LOCAL_TEXT_EXTRACTION_ENABLED, LocalExtraction, extract_text_layer
+from .http_download import DOWNLOAD_SPOOL_DIR, DownloadedDocument, DownloadTooLarge, adownload, download
+
 # Certifique-se de instalar: pip install crewai-tools llama-parse httpx pydantic llama-index-core
 # llama-parse é a biblioteca específica para o serviço LlamaParse
 from llama_parse import LlamaParse
+try:
+    # llama_parse >= 0.4.4 aceita bytes e buffers (com extra_info["file_name"]) além de caminhos
+    from llama_parse.base import FileInput  # noqa: F401
+    LLAMA_PARSE_ACCEPTS_BYTES = True
+except ImportError:
+    LLAMA_PARSE_ACCEPTS_BYTES = False
 try:
     from llama_index.core.schema import Document # LlamaParse retorna objetos Document do LlamaIndex
 except ImportError:
@@ -31,12 +44,36 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 LLAMA_CLOUD_API_KEY = os.getenv("LLAMA_CLOUD_API_KEY")
 
+# Cache em disco dos resultados de parseamento (ver parse_cache.py)
+LLAMA_PARSE_CACHE_ENABLED = os.getenv("LLAMA_PARSE_CACHE_ENABLED", "true").lower() == "true"
+LLAMA_PARSE_CACHE_DIR = os.getenv("LLAMA_PARSE_CACHE_DIR", LLAMA_PARSE_CACHE_DIR_DEFAULT)
+LLAMA_PARSE_CACHE_MAX_MB = int(os.getenv("LLAMA_PARSE_CACHE_MAX_MB", str(LLAMA_PARSE_CACHE_MAX_MB_DEFAULT)))
+
+# Entrada dos documentos baixados para o LlamaParse:
+# - "memory": os bytes são enviados diretamente, sem arquivo temporário; documentos acima de
+#   LLAMA_PARSE_MEMORY_MAX_MB (ou versões do llama_parse sem suporte a bytes) usam um arquivo em tmpfs.
+# - "tempfile": comportamento anterior, download para um arquivo no diretório temporário do sistema.
+LLAMA_PARSE_IO_MODES = ("memory", "tempfile")
+LLAMA_PARSE_IO_MODE = os.getenv("LLAMA_PARSE_IO_MODE", "memory").lower()
+LLAMA_PARSE_MEMORY_MAX_MB = int(os.getenv("LLAMA_PARSE_MEMORY_MAX_MB", "32"))
+
+# Registros de parseamento guardados para pop_parse_record; os parseamentos pedidos
+# diretamente pelos agentes nunca são retirados, por isso os mais antigos são descartados
+LLAMA_PARSE_RECORDS_MAX = int(os.getenv("LLAMA_PARSE_RECORDS_MAX", "256"))
+
 # Definindo os tipos de preset permitidos, alinhados com ParsingMode
 # O usuário mencionou "fast", "balanced", "detailed".
 # ParsingMode tem SIMPLE e DETAILED.
 # Mapearemos "fast" e "balanced" para SIMPLE, e "detailed" para DETAILED.
 ParsingPreset = Literal["simple", "detailed"]
 
+def download_options(io_mode: str) -> Dict[str, Any]:
+    """Limite de memória e diretório dos arquivos do download conforme o modo de entrada."""
+    if io_mode == "tempfile":
+        return {"memory_limit": 0, "spool_dir": None}
+    return {"memory_limit": LLAMA_PARSE_MEMORY_MAX_MB * 1024 * 1024, "spool_dir": DOWNLOAD_SPOOL_DIR}
+
+
 class LlamaParseDirectToolSchema(BaseModel):
     """Input schema for LlamaParseDirectTool (Pydantic V2)."""
     document_url: Optional[str] = Field(
@@ -63,6 +100,10 @@ class LlamaParseDirectToolSchema(BaseModel):
         default="simple",
         description="Preset de parseamento a ser usado ('simple' ou 'detailed', padrão: 'simple')."
     )
+    bypass_cache: Optional[bool] = Field(
+        default=False,
+        description="Se True, ignora a cache de parseamento e força um novo parseamento no LlamaCloud (padrão: False)."
+    )
 
     # Para Pydantic V2, a validação cruzada é feita com model_validator
     # from pydantic import model_validator
@@ -85,7 +126,13 @@ class LlamaParseDirectTool(BaseTool):
     )
     args_schema: Type[BaseModel] = LlamaParseDirectToolSchema
     api_key: Optional[str] = None
-    _sync_parser: Optional[LlamaParse] = None # Para cache da instância síncrona
+    _parse_cache: Optional[ParseCache] = None # Cache em disco dos resultados (endereçada por conteúdo)
+    _io_mode: str = "memory"
+    # Caminho usado em cada documento ("cache", "local" ou "llamacloud"), por URL/caminho de origem
+    # (LRU limitado a LLAMA_PARSE_RECORDS_MAX entradas)
+    _parse_records: Optional["OrderedDict[str, Dict[str, Any]]"] = None
+    _path_counts: Optional[Dict[str, int]] = None
+    _records_lock: Optional[Any] = None
 
     def __init__(self, llama_cloud_api_key: Optional[str] = None, **kwargs: Any):
         super().__init__(**kwargs)
@@ -94,43 +141,135 @@ class LlamaParseDirectTool(BaseTool):
             logger.error("LLAMA_CLOUD_API_KEY não foi encontrada nas variáveis de ambiente nem fornecida diretamente.")
             raise ValueError("LLAMA_CLOUD_API_KEY não configurada para LlamaParseDirectTool.")
         self.api_key = resolved_api_key
-        
-        # Removida a inicialização do self.client = llamacloud.LlamaCloud(...)
-        # A instância de LlamaParse (de llama_parse) será criada sob demanda.
 
-    async def _download_file_if_url(self, file_path_or_url: str) -> str:
-        """Downloads a file from a URL to a temporary local path if it's a URL."""
-        # A lógica parece correta, mantida como está (com pequena correção de nome de var)
-        if file_path_or_url.startswith("http://") or file_path_or_url.startswith("https://"):
+        if LLAMA_PARSE_CACHE_ENABLED:
             try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(file_path_or_url)
-                    response.raise_for_status()
-                
-                possible_extension = ""
-                # FIX: Limpiar parámetros de consulta (?) antes de extraer la extensión
-                url_without_params = file_path_or_url.split('?')[0]  # Remover parámetros de consulta
-                if '.' in url_without_params.split('/')[-1]:
-                    possible_extension = "." + url_without_params.split('/')[-1].split('.')[-1]
-
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=possible_extension, mode='wb') # mode='wb' para binário
-                temp_file.write(response.content)
-                temp_file.close()
-                logger.info(f"Arquivo baixado de {file_path_or_url} para {temp_file.name}")
-                return temp_file.name
-            except httpx.HTTPStatusError as e:
-                logger.error(f"Erro HTTP {e.response.status_code} ao baixar {file_path_or_url}: {e.response.text}")
-                return f"Error downloading file: HTTP error {e.response.status_code}"
-            except httpx.RequestError as e:
-                logger.error(f"Erro de requisição ao baixar {file_path_or_url}: {e}")
-                return f"Error downloading file: Request failed {e}"
+                self._parse_cache = ParseCache(LLAMA_PARSE_CACHE_DIR, LLAMA_PARSE_CACHE_MAX_MB * 1024 * 1024)
             except Exception as e:
-                logger.error(f"Erro inesperado ao baixar {file_path_or_url}: {e}")
-                return f"An unexpected error occurred while downloading the file: {e}"
-        return file_path_or_url
+                logger.warning(f"Cache de parseamento indisponível ({LLAMA_PARSE_CACHE_DIR}): {e}")
+                self._parse_cache = None
+
+        self._io_mode = LLAMA_PARSE_IO_MODE if LLAMA_PARSE_IO_MODE in LLAMA_PARSE_IO_MODES else "memory"
+        self._parse_records = OrderedDict()
+        self._path_counts = {"cache": 0, "local": 0, "llamacloud": 0}
+        self._records_lock = threading.Lock()
+        
+        # Removida a inicialização do self.client = llamacloud.LlamaCloud(...)
+        # As instâncias de LlamaParse são obtidas do registo partilhado (resources.py) sob demanda.
+
+    def _download_options(self) -> Dict[str, Any]:
+        return download_options(self._io_mode)
+
+    @staticmethod
+    def _download_error_message(url: str, e: Exception) -> str:
+        if isinstance(e, DownloadTooLarge):
+            logger.error(f"Download abortado: {e}")
+            return f"Error downloading file: {e}"
+        if isinstance(e, httpx.HTTPStatusError):
+            logger.error(f"Erro HTTP {e.response.status_code} ao baixar {url}")
+            return f"Error downloading file: HTTP error {e.response.status_code}"
+        if isinstance(e, httpx.RequestError):
+            logger.error(f"Erro de requisição ao baixar {url}: {e}")
+            return f"Error downloading file: Request failed {e}"
+        logger.error(f"Erro inesperado ao baixar {url}: {e}")
+        return f"An unexpected error occurred while downloading the file: {e}"
+
+    async def _download_file_if_url(self, file_path_or_url: str) -> Union[DownloadedDocument, str]:
+        """
+        Obtém o documento: URLs são baixadas em streaming com o cliente partilhado (em memória
+        ou num arquivo, conforme o modo); caminhos locais são usados tal como estão.
+        Retorna uma string de erro se o download falhar.
+        """
+        if not (file_path_or_url.startswith("http://") or file_path_or_url.startswith("https://")):
+            return DownloadedDocument.local(file_path_or_url)
+        try:
+            return await adownload(file_path_or_url, **self._download_options())
+        except Exception as e:
+            return self._download_error_message(file_path_or_url, e)
+
+    def _download_file_if_url_sync(self, file_path_or_url: str) -> Union[DownloadedDocument, str]:
+        """Versão síncrona de `_download_file_if_url`."""
+        if not (file_path_or_url.startswith("http://") or file_path_or_url.startswith("https://")):
+            return DownloadedDocument.local(file_path_or_url)
+        try:
+            return download(file_path_or_url, **self._download_options())
+        except Exception as e:
+            return self._download_error_message(file_path_or_url, e)
+
+    @staticmethod
+    def _parser_input(source: DownloadedDocument) -> Dict[str, Any]:
+        """
+        Argumentos para load_data/aload_data: os bytes com o nome do arquivo (usado pelo
+        LlamaParse para detectar o tipo) ou, quando um caminho é inevitável, um arquivo em tmpfs.
+        """
+        if source.data is not None and LLAMA_PARSE_ACCEPTS_BYTES:
+            return {"file_path": source.data, "extra_info": {"file_name": source.file_name}}
+        return {"file_path": source.spool_to_file()}
+
+    def _try_local_extraction(self, source: DownloadedDocument, parsing_preset: ParsingPreset) -> Optional[LocalExtraction]:
+        """Camada de texto embutida no PDF; o preset 'detailed' vai sempre ao LlamaCloud."""
+        if not LOCAL_TEXT_EXTRACTION_ENABLED or parsing_preset == "detailed":
+            return None
+        return extract_text_layer(source.data if source.data is not None else source.path)  # type: ignore[arg-type]
+
+    def _record_parse(self, source: DownloadedDocument, path: str, local: Optional[LocalExtraction] = None) -> None:
+        record: Dict[str, Any] = {"path": path}
+        if local is not None:
+            record["local_text"] = local.metrics()
+        with self._records_lock:  # type: ignore[union-attr]
+            self._path_counts[path] += 1  # type: ignore[index]
+            self._parse_records[source.url] = record  # type: ignore[index]
+            self._parse_records.move_to_end(source.url)  # type: ignore[union-attr]
+            while len(self._parse_records) > max(1, LLAMA_PARSE_RECORDS_MAX):  # type: ignore[arg-type]
+                self._parse_records.popitem(last=False)  # type: ignore[union-attr]
+        if path == "local":
+            logger.info(f"Camada de texto local usada para {source.url} ({local.chars_per_page:.0f} caracteres/página).")  # type: ignore[union-attr]
+        elif local is not None:
+            logger.info(f"Camada de texto local rejeitada para {source.url}: {local.reason}.")
+
+    def pop_parse_record(self, document_url: str) -> Optional[Dict[str, Any]]:
+        """Caminho usado no último parseamento do documento (e métricas da camada de texto, se avaliada)."""
+        with self._records_lock:  # type: ignore[union-attr]
+            return self._parse_records.pop(document_url, None)  # type: ignore[union-attr]
+
+    def parse_path_stats(self) -> Dict[str, int]:
+        """Quantos documentos foram servidos pela cache, pela extração local e pelo LlamaCloud."""
+        with self._records_lock:  # type: ignore[union-attr]
+            return dict(self._path_counts)  # type: ignore[arg-type]
+
+    def parse_cache_stats(self) -> Optional[dict]:
+        """Contadores de hit/miss da cache de parseamento (None se a cache estiver desativada)."""
+        return self._parse_cache.stats() if self._parse_cache else None
+
+    def _cache_key_for(self, source: DownloadedDocument, preset: ParsingPreset, language: str, result_as_markdown: bool) -> Optional[str]:
+        """Calcula a chave de cache do documento, ou None se a cache estiver desativada."""
+        if not self._parse_cache:
+            return None
+        actual_language = "pt" if language.lower() == "por" else language
+        if source.data is not None:
+            digest = ParseCache.bytes_digest(source.data)
+        else:
+            digest = ParseCache.file_digest(source.path)  # type: ignore[arg-type]
+        return ParseCache.make_key(digest, preset, actual_language, result_as_markdown)
+
+    def _cache_lookup(self, cache_key: Optional[str], bypass_cache: bool) -> Optional[str]:
+        if cache_key is None or bypass_cache:
+            return None
+        cached = self._parse_cache.get(cache_key)  # type: ignore[union-attr]
+        if cached is not None:
+            logger.info(f"Resultado de parseamento obtido da cache (chave {cache_key[:12]}...).")
+        return cached
+
+    def _cache_store(self, cache_key: Optional[str], full_text: str) -> None:
+        if cache_key is None or not full_text:
+            return
+        try:
+            self._parse_cache.put(cache_key, full_text)  # type: ignore[union-attr]
+        except Exception as e:
+            logger.warning(f"Não foi possível gravar o resultado na cache de parseamento: {e}")
 
     def _get_parser_instance(self, preset: ParsingPreset, language: str, result_as_markdown: bool) -> LlamaParse:
-        """Configura e retorna uma instância do LlamaParse parser."""
+        """Retorna a instância partilhada do LlamaParse para esta configuração (criada uma vez por processo)."""
         api_key_to_use = self.api_key or LLAMA_CLOUD_API_KEY
         if not api_key_to_use:
             logger.error("LlamaCloud API Key não fornecida nem como argumento nem como variável de ambiente.")
@@ -142,7 +281,7 @@ class LlamaParseDirectTool(BaseTool):
         # sugere que "simple" ou "detailed" como strings são aceitáveis.
         mode_to_use_str = "detailed" if preset == "detailed" else "simple"
 
-        return LlamaParse(
+        return get_llama_parser(
             api_key=api_key_to_use,
             result_type="markdown" if result_as_markdown else "text",
             language=actual_language,
@@ -155,45 +294,60 @@ class LlamaParseDirectTool(BaseTool):
         parsing_preset: ParsingPreset, 
         parsing_instructions: Optional[str],
         language: str, 
-        result_as_markdown: bool
+        result_as_markdown: bool,
+        bypass_cache: bool = False
     ) -> str:
         """Lógica assíncrona interna para parsear o documento."""
         if not self.api_key:
             return "Error: Llama Cloud API key not configured."
 
-        actual_file_path = await self._download_file_if_url(file_path_or_url)
-        if actual_file_path.startswith("Error:"): 
-            return actual_file_path 
+        source = await self._download_file_if_url(file_path_or_url)
+        if isinstance(source, str):
+            return source
 
         try:
-            logger.info(f"Parseando documento: {actual_file_path} com preset={parsing_preset}, lang={language}")
+            if source.data is not None:
+                cache_key = self._cache_key_for(source, parsing_preset, language, result_as_markdown)
+            else:
+                cache_key = await asyncio.to_thread(
+                    self._cache_key_for, source, parsing_preset, language, result_as_markdown
+                )
+            cached_text = self._cache_lookup(cache_key, bypass_cache)
+            if cached_text is not None:
+                self._record_parse(source, "cache")
+                return cached_text
+
+            local = await asyncio.to_thread(self._try_local_extraction, source, parsing_preset)
+            if local is not None and local.accepted:
+                self._record_parse(source, "local", local)
+                return local.text
+            self._record_parse(source, "llamacloud", local)
+
+            logger.info(f"Parseando documento: {source.url} com preset={parsing_preset}, lang={language}")
             parser = self._get_parser_instance(parsing_preset, language, result_as_markdown)
 
-            documents: List[Document] = await parser.aload_data(actual_file_path)
+            documents: List[Document] = await parser.aload_data(**self._parser_input(source))
             
             if not documents:
-                logger.warning(f"LlamaParse não retornou documentos para {actual_file_path}.")
+                logger.warning(f"LlamaParse não retornou documentos para {source.url}.")
                 return "LlamaParse did not return any documents."
             
             full_text = "\n\n---\n\n".join([doc.text for doc in documents if doc.text])
-            logger.info(f"Parseamento de {actual_file_path} concluído. Tamanho do texto: {len(full_text)}")
+            logger.info(f"Parseamento de {source.url} concluído. Tamanho do texto: {len(full_text)}")
+            self._cache_store(cache_key, full_text)
             return full_text if full_text else "LlamaParse returned document(s) with no textual content."
 
         except FileNotFoundError:
-            logger.error(f"Arquivo não encontrado em {actual_file_path} durante o parseamento.")
-            return f"Error: File not found at {actual_file_path}"
+            logger.error(f"Arquivo não encontrado em {source.path} durante o parseamento.")
+            return f"Error: File not found at {source.path}"
         except Exception as e:
-            logger.exception(f"Erro inesperado durante o processamento LlamaParse de {actual_file_path}: {e}")
+            logger.exception(f"Erro inesperado durante o processamento LlamaParse de {source.url}: {e}")
             if hasattr(e, 'response') and hasattr(e.response, 'text'): # Para erros HTTP
                 return f"Error during LlamaParse processing: {e.response.text} (Details: {str(e)})"
             return f"An unexpected error occurred during LlamaParse processing: {str(e)}"
         finally:
-            if (file_path_or_url.startswith("http://") or file_path_or_url.startswith("https://")) and os.path.exists(actual_file_path) and tempfile.gettempdir() in os.path.abspath(actual_file_path):
-                try:
-                    os.remove(actual_file_path)
-                    logger.info(f"Arquivo temporário {actual_file_path} removido.")
-                except Exception as e_rm:
-                    logger.warning(f"Não foi possível remover o arquivo temporário {actual_file_path}: {e_rm}")
+            # Remove o arquivo temporário/tmpfs, se houver (nunca os arquivos locais do chamador)
+            source.cleanup()
 
     def _run(
         self, 
@@ -202,10 +356,12 @@ class LlamaParseDirectTool(BaseTool):
         parsing_preset: ParsingPreset = "simple", 
         parsing_instructions: Optional[str] = None,
         language: str = "pt", 
-        result_as_markdown: bool = True
+        result_as_markdown: bool = True,
+        bypass_cache: bool = False
     ) -> str:
         """
         Synchronously parses a document (local file or URL) using LlamaParse.
+        Results are cached on disk by file content unless bypass_cache is set.
         """
         if not document_url and not file_path:
             return "Error: Either document_url or file_path must be provided."
@@ -215,67 +371,46 @@ class LlamaParseDirectTool(BaseTool):
              return "Error: Document source path is None after check, unexpected error."
 
         logger.info(f"Iniciando parseamento síncrono para: {source_path}")
-        
-        actual_file_to_parse = source_path
-        temp_file_path_for_cleanup: Optional[str] = None
 
-        if source_path.startswith("http://") or source_path.startswith("https://"):
-            logger.info(f"Baixando arquivo para execução síncrona: {source_path}")
-            temp_file_obj = None
-            try:
-                with httpx.Client() as client: # Cliente síncrono
-                    response = client.get(source_path)
-                    response.raise_for_status()
-                
-                possible_extension = ""
-                # FIX: Limpiar parámetros de consulta (?) antes de extraer la extensión
-                url_without_params = source_path.split('?')[0]  # Remover parámetros de consulta
-                if '.' in url_without_params.split('/')[-1]:
-                    possible_extension = "." + url_without_params.split('/')[-1].split('.')[-1]
-                
-                # Usar with para garantir o fechamento do arquivo temporário
-                temp_file_obj = tempfile.NamedTemporaryFile(delete=False, suffix=possible_extension, mode='wb')
-                temp_file_obj.write(response.content)
-                actual_file_to_parse = temp_file_obj.name
-                temp_file_path_for_cleanup = actual_file_to_parse # Guardar para limpeza
-                temp_file_obj.close() # Fechar o arquivo para que LlamaParse possa abri-lo
-                logger.info(f"Arquivo baixado para {actual_file_to_parse}")
-            except Exception as e_dl_sync:
-                logger.error(f"Erro ao baixar {source_path} sincronicamente: {e_dl_sync}")
-                if temp_file_obj and os.path.exists(temp_file_obj.name):
-                    try:
-                        os.remove(temp_file_obj.name)
-                    except Exception as e_rm_fail: 
-                        logger.warning(f"Falha ao remover arquivo temporário após erro de download: {temp_file_obj.name}, erro: {e_rm_fail}")
-                return f"Error downloading file synchronously: {e_dl_sync}"
+        source = self._download_file_if_url_sync(source_path)
+        if isinstance(source, str):
+            return source
         
         try:
+            cache_key = self._cache_key_for(source, parsing_preset, language, result_as_markdown)
+            cached_text = self._cache_lookup(cache_key, bypass_cache)
+            if cached_text is not None:
+                self._record_parse(source, "cache")
+                return cached_text
+
+            local = self._try_local_extraction(source, parsing_preset)
+            if local is not None and local.accepted:
+                self._record_parse(source, "local", local)
+                return local.text
+            self._record_parse(source, "llamacloud", local)
+
             parser = self._get_parser_instance(parsing_preset, language, result_as_markdown)
             
-            documents: List[Document] = parser.load_data(actual_file_to_parse) 
+            documents: List[Document] = parser.load_data(**self._parser_input(source))
             if not documents:
-                logger.warning(f"LlamaParse não retornou documentos para {actual_file_to_parse} (sync).")
+                logger.warning(f"LlamaParse não retornou documentos para {source.url} (sync).")
                 return "LlamaParse did not return any documents (sync)."
             
             full_text = "\n\n---\n\n".join([doc.text for doc in documents if doc.text])
-            logger.info(f"Parseamento de {actual_file_to_parse} (sync) concluído. Tamanho do texto: {len(full_text)}")
+            logger.info(f"Parseamento de {source.url} (sync) concluído. Tamanho do texto: {len(full_text)}")
+            self._cache_store(cache_key, full_text)
             return full_text if full_text else "LlamaParse returned document(s) with no textual content (sync)."
 
         except FileNotFoundError:
-            logger.error(f"Arquivo não encontrado em {actual_file_to_parse} durante o parseamento (sync).")
-            return f"Error: File not found at {actual_file_to_parse} (sync)"
+            logger.error(f"Arquivo não encontrado em {source.path} durante o parseamento (sync).")
+            return f"Error: File not found at {source.path} (sync)"
         except Exception as e_parse_sync:
-            logger.exception(f"Erro durante parseamento síncrono de {actual_file_to_parse}: {e_parse_sync}")
+            logger.exception(f"Erro durante parseamento síncrono de {source.url}: {e_parse_sync}")
             if hasattr(e_parse_sync, 'response') and hasattr(e_parse_sync.response, 'text'): # Para erros HTTP de LlamaParse
                  return f"Error during LlamaParse processing (sync): {e_parse_sync.response.text} (Details: {str(e_parse_sync)})"
             return f"An unexpected error occurred during synchronous LlamaParse processing: {e_parse_sync}"
         finally:
-            if temp_file_path_for_cleanup and os.path.exists(temp_file_path_for_cleanup):
-                try:
-                    os.remove(temp_file_path_for_cleanup)
-                    logger.info(f"Arquivo temporário {temp_file_path_for_cleanup} removido (sync).")
-                except Exception as e_rm_sync:
-                    logger.warning(f"Não foi possível remover o arquivo temporário {temp_file_path_for_cleanup} (sync): {e_rm_sync}")
+            source.cleanup()
 
     async def _arun(
         self, 
@@ -284,10 +419,12 @@ class LlamaParseDirectTool(BaseTool):
         parsing_preset: ParsingPreset = "simple",
         parsing_instructions: Optional[str] = None,
         language: str = "pt", 
-        result_as_markdown: bool = True
+        result_as_markdown: bool = True,
+        bypass_cache: bool = False
     ) -> str:
         """
         Asynchronously parses a document (local file or URL) using LlamaParse.
+        Results are cached on disk by file content unless bypass_cache is set.
         """
         if not document_url and not file_path:
             return "Error: Either document_url or file_path must be provided."
@@ -302,9 +439,54 @@ class LlamaParseDirectTool(BaseTool):
             parsing_preset=parsing_preset, 
             parsing_instructions=parsing_instructions,
             language=language, 
-            result_as_markdown=result_as_markdown
+            result_as_markdown=result_as_markdown,
+            bypass_cache=bool(bypass_cache)
         )
 
+async def benchmark_io_modes(urls: List[str], repeats: int = 3) -> Dict[str, Any]:
+    """
+    Compara os modos de entrada "memory" e "tempfile" no trecho que antecede o LlamaCloud:
+    download, hash para a cache e entrega do documento ao parser (no modo "tempfile" o
+    LlamaParse lê o arquivo de volta do disco, o que é simulado aqui). Não chama a API.
+    """
+    from .http_download import close_async_client
+
+    report: Dict[str, Any] = {}
+    try:
+        for io_mode in LLAMA_PARSE_IO_MODES:
+            download_s = handoff_s = 0.0
+            total_bytes = 0
+            for _ in range(repeats):
+                for url in urls:
+                    start = time.perf_counter()
+                    source = await adownload(url, **download_options(io_mode))
+                    download_s += time.perf_counter() - start
+                    start = time.perf_counter()
+                    try:
+                        if source.data is not None:
+                            ParseCache.bytes_digest(source.data)
+                        else:
+                            ParseCache.file_digest(source.path)  # type: ignore[arg-type]
+                        parser_input = LlamaParseDirectTool._parser_input(source)
+                        if isinstance(parser_input["file_path"], str):
+                            with open(parser_input["file_path"], "rb") as f:
+                                f.read()
+                    finally:
+                        source.cleanup()
+                    handoff_s += time.perf_counter() - start
+                    total_bytes += source.size
+            total_s = download_s + handoff_s
+            report[io_mode] = {
+                "documents": len(urls) * repeats,
+                "bytes": total_bytes,
+                "download_s": round(download_s, 3),
+                "handoff_s": round(handoff_s, 3),
+                "throughput_mb_s": round(total_bytes / total_s / (1024 * 1024), 2) if total_s else None,
+            }
+    finally:
+        await close_async_client()
+    return report
+
 # Exemplo de como testar a ferramenta (opcional, pode ser removido ou movido para testes)
 async def main_async_test():
     print("Testando LlamaParseDirectTool...")
@@ -334,6 +516,12 @@ async def main_async_test():
     # print(f"Resultado _run Local:\n{result_sync_local}")
 
 if __name__ == "__main__":
+    # Benchmark dos modos de entrada: python -m cadastro_crew.tools.llama_cloud_parsing_tool --benchmark-io URL [URL ...]
+    import json
+    import sys
+    if len(sys.argv) > 2 and sys.argv[1] == "--benchmark-io":
+        print(json.dumps(asyncio.run(benchmark_io_modes(sys.argv[2:])), indent=2))
+
     # Para rodar o teste async:
     # asyncio.run(main_async_test())
     
@@ -0,0 +1,131 @@
+"""
+Extração local da camada de texto de PDFs digitais (pypdf), antes do LlamaCloud.
+
+Muitos documentos do cadastro já trazem texto embutido; nesses casos o texto
+local é usado e o documento não vai ao LlamaCloud. A camada só é aceita se
+tiver pelo menos LOCAL_TEXT_MIN_CHARS_PER_PAGE caracteres por página, no
+máximo LOCAL_TEXT_MAX_GARBAGE_RATIO de caracteres ilegíveis (fontes sem
+mapeamento Unicode) e texto em pelo menos LOCAL_TEXT_MIN_PAGE_COVERAGE das
+páginas; PDFs digitalizados, protegidos ou sem pypdf seguem para o LlamaCloud.
+"""
+
+import io
+import logging
+import os
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+try:
+    from pypdf import PdfReader
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PdfReader = None  # type: ignore[assignment,misc]
+    PYPDF_AVAILABLE = False
+
+# Critérios para aceitar a camada de texto embutida no PDF em vez de enviar o documento ao LlamaCloud
+LOCAL_TEXT_EXTRACTION_ENABLED = os.getenv("LOCAL_TEXT_EXTRACTION_ENABLED", "true").lower() == "true"
+LOCAL_TEXT_MIN_CHARS_PER_PAGE = float(os.getenv("LOCAL_TEXT_MIN_CHARS_PER_PAGE", "200"))
+LOCAL_TEXT_MAX_GARBAGE_RATIO = float(os.getenv("LOCAL_TEXT_MAX_GARBAGE_RATIO", "0.05"))
+# Fração mínima de páginas com texto (PDFs com capa digital e o resto digitalizado não passam)
+LOCAL_TEXT_MIN_PAGE_COVERAGE = float(os.getenv("LOCAL_TEXT_MIN_PAGE_COVERAGE", "0.8"))
+
+_PAGE_SEPARATOR = "\n\n---\n\n"
+_MIN_CHARS_FOR_TEXT_PAGE = 20
+# Caracteres de controle, uso privado, não atribuídos e substitutos: típicos de fontes sem mapeamento Unicode
+_GARBAGE_CATEGORIES = {"Cc", "Co", "Cn", "Cs"}
+
+
+@dataclass
+class LocalExtraction:
+    """Resultado da extração local da camada de texto e da avaliação da sua qualidade."""
+    text: str
+    pages: int
+    chars_per_page: float
+    garbage_ratio: float
+    page_coverage: float
+    accepted: bool
+    reason: str
+    page_chars: List[int] = field(default_factory=list)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "pages": self.pages,
+            "chars_per_page": round(self.chars_per_page, 1),
+            "garbage_ratio": round(self.garbage_ratio, 4),
+            "page_coverage": round(self.page_coverage, 3),
+            "accepted": self.accepted,
+            "reason": self.reason,
+        }
+
+
+def garbage_ratio(text: str) -> float:
+    """Fração de caracteres ilegíveis (U+FFFD, controle, uso privado...) no texto, sem contar espaços."""
+    visible = [ch for ch in text if not ch.isspace()]
+    if not visible:
+        return 1.0
+    garbage = sum(1 for ch in visible if ch == "\ufffd" or unicodedata.category(ch) in _GARBAGE_CATEGORIES)
+    return garbage / len(visible)
+
+
+def _is_pdf(data: bytes) -> bool:
+    return data.lstrip()[:5] == b"%PDF-"
+
+
+def extract_text_layer(source: Union[bytes, str]) -> Optional[LocalExtraction]:
+    """
+    Extrai a camada de texto de um PDF (bytes ou caminho) e avalia se é boa o bastante
+    para dispensar o LlamaCloud. Retorna None se a extração local não se aplica
+    (pypdf ausente, arquivo que não é PDF, PDF protegido ou ilegível).
+    """
+    if not PYPDF_AVAILABLE:
+        return None
+    try:
+        if isinstance(source, (bytes, bytearray)):
+            if not _is_pdf(bytes(source[:1024])):
+                return None
+            reader = PdfReader(io.BytesIO(source))
+        else:
+            with open(source, "rb") as f:
+                if not _is_pdf(f.read(1024)):
+                    return None
+            reader = PdfReader(source)
+
+        if reader.is_encrypted and not reader.decrypt(""):
+            return None
+
+        page_texts = [(page.extract_text() or "").strip() for page in reader.pages]
+    except Exception as e:
+        logger.info(f"Extração local da camada de texto falhou ({e}); o documento será enviado ao LlamaCloud.")
+        return None
+
+    pages = len(page_texts)
+    if pages == 0:
+        return None
+    page_chars = [len(text) for text in page_texts]
+    text = _PAGE_SEPARATOR.join(text for text in page_texts if text)
+    chars_per_page = sum(page_chars) / pages
+    ratio = garbage_ratio(text)
+    coverage = sum(1 for chars in page_chars if chars >= _MIN_CHARS_FOR_TEXT_PAGE) / pages
+
+    if chars_per_page < LOCAL_TEXT_MIN_CHARS_PER_PAGE:
+        accepted, reason = False, f"poucos caracteres por página ({chars_per_page:.0f})"
+    elif ratio > LOCAL_TEXT_MAX_GARBAGE_RATIO:
+        accepted, reason = False, f"texto com muitos caracteres ilegíveis ({ratio:.1%})"
+    elif coverage < LOCAL_TEXT_MIN_PAGE_COVERAGE:
+        accepted, reason = False, f"páginas sem texto (cobertura {coverage:.0%})"
+    else:
+        accepted, reason = True, "camada de texto de boa qualidade"
+
+    return LocalExtraction(
+        text=text,
+        pages=pages,
+        chars_per_page=chars_per_page,
+        garbage_ratio=ratio,
+        page_coverage=coverage,
+        accepted=accepted,
+        reason=reason,
+        page_chars=page_chars,
+    )
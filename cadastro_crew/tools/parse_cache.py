@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+LLAMA_PARSE_CACHE_DIR_DEFAULT = "cache/llamaparse"
+LLAMA_PARSE_CACHE_MAX_MB_DEFAULT = 512
+
+_CACHE_SUFFIX = ".txt"
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class ParseCache:
+    """
+    Cache em disco, endereçada por conteúdo, dos resultados do LlamaParse.
+
+    A chave é o sha256 dos bytes do arquivo combinado com o preset, o idioma e o
+    tipo de resultado, de modo que o mesmo PDF enviado por URLs diferentes (ou em
+    casos diferentes) é parseado uma única vez. O tamanho total é limitado e as
+    entradas menos usadas recentemente (mtime, atualizado a cada hit) são removidas.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._total_bytes = sum(p.stat().st_size for p in self.cache_dir.glob(f"*{_CACHE_SUFFIX}"))
+
+    @staticmethod
+    def file_digest(file_path: str) -> str:
+        """sha256 do conteúdo do arquivo, lido em blocos para não carregar o arquivo inteiro em memória."""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def bytes_digest(data: bytes) -> str:
+        """sha256 de um conteúdo já em memória."""
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def make_key(content_digest: str, parsing_preset: str, language: str, result_as_markdown: bool) -> str:
+        result_type = "markdown" if result_as_markdown else "text"
+        raw_key = f"{content_digest}|{parsing_preset}|{language}|{result_type}"
+        return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+    def _path_for(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{_CACHE_SUFFIX}"
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path_for(key)
+        try:
+            text = path.read_text(encoding="utf-8")
+            os.utime(path)  # Marca como usado recentemente (LRU)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return text
+
+    def put(self, key: str, text: str) -> None:
+        path = self._path_for(key)
+        data = text.encode("utf-8")
+        # Escrita atômica: vários workers (threads ou processos) podem partilhar o diretório
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            previous_size = path.stat().st_size if path.exists() else 0
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._total_bytes += len(data) - previous_size
+            over_limit = self._total_bytes > self.max_bytes
+        if over_limit:
+            self._evict()
+
+    def _evict(self) -> None:
+        """Remove as entradas menos usadas recentemente até ficar abaixo de 90% do limite."""
+        with self._lock:
+            entries = []
+            for p in self.cache_dir.glob(f"*{_CACHE_SUFFIX}"):
+                try:
+                    stat = p.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, p))
+            total = sum(size for _, size, _ in entries)
+            target = int(self.max_bytes * 0.9)
+            for _, size, p in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    p.unlink()
+                    total -= size
+                    self.evictions += 1
+                except FileNotFoundError:
+                    continue
+            self._total_bytes = total
+        logger.info(f"Cache de parseamento reduzida para {total} bytes ({self.evictions} remoções no total).")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions,
+                "size_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -1,12 +1,15 @@
 import os
-from typing import Type, Optional
+import threading
+from typing import Any, Dict, Type, Optional
 from pydantic import BaseModel, Field
 from crewai.tools import BaseTool
-from supabase import create_client, Client as SupabaseClient
+from supabase import Client as SupabaseClient
 from dotenv import load_dotenv
 import logging
 import json # Importar json para serializar o dicionário de retorno
 
+from ..resources import get_supabase_client
+
 logger = logging.getLogger(__name__)
 load_dotenv()
 
@@ -23,35 +26,96 @@ class SupabaseDocumentContentTool(BaseTool):
     description: str = "Retrieves metadata, including the file URL, name, and document_tag, for a specific document stored in the 'documents' table in Supabase, filtered by its name and case_id. Returns a JSON string with this information."
     args_schema: Type[BaseModel] = SupabaseDocumentContentSchema
     supabase_client: Optional[SupabaseClient] = None
+    # Índice em memória por caso: case_id -> {nome do documento -> linha da tabela 'documents'}
+    _case_index: Optional[Dict[str, Dict[str, dict]]] = None
+    # O lock global protege apenas os dicionários; a consulta de cada caso usa o lock do caso
+    _index_lock: Optional[Any] = None
+    _case_locks: Optional[Dict[str, Any]] = None
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        self._case_index = {}
+        self._index_lock = threading.Lock()
+        self._case_locks = {}
         if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
             logger.error("Supabase URL ou Service Key não configurados nas variáveis de ambiente.")
             raise ValueError("Supabase URL or Service Key not configured for SupabaseDocumentContentTool.")
         try:
-            self.supabase_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+            self.supabase_client = get_supabase_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
             logger.info("Cliente Supabase inicializado para SupabaseDocumentContentTool.")
         except Exception as e:
             logger.error(f"Falha ao inicializar cliente Supabase para SupabaseDocumentContentTool: {e}")
             self.supabase_client = None # Garantir que está None se falhar
 
-    def _run(self, document_name: str, case_id: str) -> str:
-        if not self.supabase_client:
-            return "Error: Supabase client not initialized."
-        try:
-            logger.info(f"Recuperando informações para o documento: '{document_name}' com case_id: '{case_id}' da tabela 'documents'.")
+    def _load_case_index(self, case_id: str) -> Dict[str, dict]:
+        """
+        Carrega numa única consulta todas as linhas de 'documents' do caso (na primeira vez que o caso é visto).
+        Só as consultas do mesmo caso esperam umas pelas outras; casos diferentes carregam em paralelo.
+        """
+        with self._index_lock:  # type: ignore[union-attr]
+            index = self._case_index.get(case_id)  # type: ignore[union-attr]
+            if index is not None:
+                return index
+            case_lock = self._case_locks.setdefault(case_id, threading.Lock())  # type: ignore[union-attr]
+        with case_lock:
+            with self._index_lock:  # type: ignore[union-attr]
+                index = self._case_index.get(case_id)  # type: ignore[union-attr]
+            if index is not None:
+                return index
+            logger.info(f"Carregando metadados de todos os documentos do case_id '{case_id}' da tabela 'documents'.")
             response = (
-                self.supabase_client.table("documents")
+                self.supabase_client.table("documents")  # type: ignore[union-attr]
                 .select("file_url, name, document_tag")
-                .eq("name", document_name)
                 .eq("case_id", case_id)
-                .limit(1)
                 .execute()
             )
+            index = {row.get("name"): row for row in (response.data or []) if row.get("name")}
+            with self._index_lock:  # type: ignore[union-attr]
+                # Documentos adicionados por get_document_info enquanto a consulta corria são preservados
+                index = {**index, **self._case_index.get(case_id, {})}  # type: ignore[union-attr]
+                self._case_index[case_id] = index  # type: ignore[index]
+            logger.info(f"{len(index)} documentos indexados para o case_id '{case_id}'.")
+            return index
+
+    def get_document_info(self, document_name: str, case_id: str) -> Optional[dict]:
+        """
+        Retorna a linha de 'documents' para o documento, ou None se não existir.
+        Depois da primeira consulta do caso, a resposta vem do índice em memória.
+        """
+        doc_info = self._load_case_index(case_id).get(document_name)
+        if doc_info is not None:
+            return doc_info
+
+        # Documento ausente do índice: pode ter sido registrado depois do carregamento do caso
+        response = (
+            self.supabase_client.table("documents")  # type: ignore[union-attr]
+            .select("file_url, name, document_tag")
+            .eq("name", document_name)
+            .eq("case_id", case_id)
+            .limit(1)
+            .execute()
+        )
+        if not response.data:
+            return None
+        doc_info = response.data[0]
+        with self._index_lock:  # type: ignore[union-attr]
+            self._case_index.setdefault(case_id, {})[document_name] = doc_info  # type: ignore[union-attr]
+        return doc_info
+
+    def invalidate_case(self, case_id: str) -> None:
+        """Descarta o índice do caso (chamado quando a análise do caso termina)."""
+        with self._index_lock:  # type: ignore[union-attr]
+            self._case_index.pop(case_id, None)  # type: ignore[union-attr]
+            self._case_locks.pop(case_id, None)  # type: ignore[union-attr]
+
+    def _run(self, document_name: str, case_id: str) -> str:
+        if not self.supabase_client:
+            return "Error: Supabase client not initialized."
+        try:
+            logger.info(f"Recuperando informações para o documento: '{document_name}' com case_id: '{case_id}' da tabela 'documents'.")
+            doc_info = self.get_document_info(document_name, case_id)
             
-            if response.data:
-                doc_info = response.data[0]
+            if doc_info:
                 file_url = doc_info.get("file_url")
                 
                 if file_url:
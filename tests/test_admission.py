@@ -0,0 +1,41 @@
+from analysis_service.admission import AdmissionController
+
+
+def test_rate_limit_rejects_with_retry_after_and_does_not_hold_a_slot():
+    admission = AdmissionController(rate_per_pipe=0.1, burst_per_pipe=1, max_global=10, max_per_pipe=10)
+
+    assert admission.try_acquire("pipe-1").admitted
+    rejected = admission.try_acquire("pipe-1")
+
+    assert not rejected.admitted
+    assert rejected.reason == "rate_limit"
+    assert 1 <= rejected.retry_after <= 10
+    snapshot = admission.snapshot()
+    assert snapshot["in_flight"] == 1
+    assert snapshot["pipes"]["pipe-1"]["rejected"] == 1
+    # Otro pipe tiene su propio bucket
+    assert admission.try_acquire("pipe-2").admitted
+
+
+def test_concurrency_limits_reject_without_consuming_a_token():
+    admission = AdmissionController(rate_per_pipe=0, burst_per_pipe=2, max_global=10, max_per_pipe=1, retry_after_seconds=30)
+
+    assert admission.try_acquire("pipe-1").admitted
+    rejected = admission.try_acquire("pipe-1")
+    assert (rejected.admitted, rejected.reason, rejected.retry_after) == (False, "limite_por_pipe", 30)
+
+    admission.release("pipe-1")
+    # El rechazo por concurrencia no gastó el segundo token del burst
+    assert admission.try_acquire("pipe-1").admitted
+
+
+def test_cancel_refunds_the_slot_and_the_token():
+    admission = AdmissionController(rate_per_pipe=0, burst_per_pipe=1, max_global=1, max_per_pipe=1)
+
+    assert admission.try_acquire(None).admitted
+    assert admission.try_acquire("pipe-2").reason == "limite_global"
+
+    # El trabajo no llegó a encolarse: se devuelven el slot y el token
+    admission.cancel(None)
+    assert admission.snapshot()["in_flight"] == 0
+    assert admission.try_acquire(None).admitted
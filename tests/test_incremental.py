@@ -0,0 +1,124 @@
+from cadastro_crew.incremental import (
+    build_incremental_state,
+    merge_dossies,
+    merge_validations,
+    per_document_outputs,
+    plan_incremental,
+)
+
+INPUTS = {"checklist": "Cartão CNPJ emitido nos últimos 90 dias", "current_date": "2025-05-17"}
+
+
+def _doc(name: str, content: str) -> dict:
+    return {"name": name, "type": "pdf", "status": "ok", "content": content}
+
+
+def _outputs(names, task_prefix=""):
+    return {
+        "validacao_documental": {
+            name: {"structured": {"documento": name, "statusGeral": "Conforme", "itens": []}, "raw": f"{task_prefix}val {name}"}
+            for name in names
+        },
+        "extracao_dados": {
+            name: {"structured": {"dadosPessoaJuridica": {"cnpj": "1"}}, "raw": f"{task_prefix}ext {name}"}
+            for name in names
+        },
+    }
+
+
+def _state(documents):
+    plan = plan_incremental(None, documents, INPUTS)
+    outputs = per_document_outputs(None, documents, plan, _outputs([doc["name"] for doc in documents]))
+    return build_incremental_state(documents, INPUTS, outputs, plan)
+
+
+def test_only_changed_and_new_documents_are_recomputed():
+    before = [_doc("cnpj.pdf", "a"), _doc("contrato.pdf", "b"), _doc("removido.pdf", "c")]
+    state = _state(before)
+    after = [_doc("cnpj.pdf", "a"), _doc("contrato.pdf", "b alterado"), _doc("novo.pdf", "d")]
+
+    plan = plan_incremental(state, after, INPUTS)
+
+    assert plan["mode"] == "per_document"
+    assert plan["recompute"] == {
+        "validacao_documental": ["contrato.pdf", "novo.pdf"],
+        "extracao_dados": ["contrato.pdf", "novo.pdf"],
+    }
+    outputs = per_document_outputs(state, after, plan, _outputs(["contrato.pdf", "novo.pdf"], task_prefix="new "))
+    assert list(outputs["extracao_dados"]) == ["cnpj.pdf", "contrato.pdf", "novo.pdf"]
+    assert outputs["extracao_dados"]["cnpj.pdf"]["raw"] == "ext cnpj.pdf"
+    assert outputs["extracao_dados"]["contrato.pdf"]["raw"] == "new ext contrato.pdf"
+
+
+def test_validation_is_redone_when_the_checklist_context_changes():
+    documents = [_doc("cnpj.pdf", "a")]
+    state = _state(documents)
+
+    plan = plan_incremental(state, documents, {**INPUTS, "current_date": "2025-09-01"})
+
+    assert plan["recompute"] == {"validacao_documental": ["cnpj.pdf"], "extracao_dados": []}
+
+
+def test_failed_prefetch_falls_back_to_case_mode():
+    documents = [_doc("cnpj.pdf", "a"), {**_doc("contrato.pdf", None), "status": "error"}]
+
+    assert plan_incremental(None, documents, INPUTS)["mode"] == "case"
+    assert plan_incremental(None, None, INPUTS)["mode"] == "case"
+
+
+def test_merge_dossies_is_deterministic_and_records_conflicts():
+    documents = [_doc("cnpj.pdf", "a"), _doc("contrato.pdf", "b"), _doc("rg.pdf", "c")]
+    extractions = {
+        "cnpj.pdf": {"structured": {
+            "dadosPessoaJuridica": {"razaoSocial": "Exemplo LTDA", "cnpj": "00.000.000/0001-00", "enderecoSede": {"cidade": "São Paulo", "uf": "SP"}},
+            "dadosSociosRepresentantes": [],
+        }},
+        "contrato.pdf": {"structured": {
+            "dadosPessoaJuridica": {"razaoSocial": "Exemplo Comércio LTDA", "cnpj": None, "enderecoSede": {"cidade": "Campinas", "uf": None}},
+            "dadosSociosRepresentantes": [{"nomeCompleto": "Maria Silva", "cpf": "111.222.333-44", "cargo": "Sócia"}],
+        }},
+        "rg.pdf": {"structured": None, "raw": "texto livre"},
+    }
+
+    dossie = merge_dossies(documents, extractions)
+
+    assert dossie == merge_dossies(documents, extractions)
+    assert dossie["dadosPessoaJuridica"]["razaoSocial"] == "Exemplo LTDA"
+    assert dossie["dadosPessoaJuridica"]["cnpj"] == "00.000.000/0001-00"
+    # O endereço não mistura campos de documentos diferentes
+    assert dossie["dadosPessoaJuridica"]["enderecoSede"] == {"cidade": "São Paulo", "uf": "SP"}
+    assert dossie["dadosSociosRepresentantes"] == [{"nomeCompleto": "Maria Silva", "cpf": "111.222.333-44", "cargo": "Sócia"}]
+    conflicts = dossie["outrasInformacoes"]["observacoes"]
+    assert any("razaoSocial" in conflict and "contrato.pdf" in conflict for conflict in conflicts)
+    assert any("enderecoSede" in conflict for conflict in conflicts)
+    assert dossie["extracoesNaoEstruturadas"] == [{"documento": "rg.pdf", "texto": "texto livre"}]
+
+
+def test_partners_are_merged_by_cpf_digits():
+    documents = [_doc("contrato.pdf", "a"), _doc("rg.pdf", "b")]
+    extractions = {
+        "contrato.pdf": {"structured": {"dadosSociosRepresentantes": [{"nomeCompleto": "Maria Silva", "cpf": "111.222.333-44", "rg": None}]}},
+        "rg.pdf": {"structured": {"dadosSociosRepresentantes": [{"nomeCompleto": "MARIA SILVA", "cpf": "11122233344", "rg": "12.345.678-9"}]}},
+    }
+
+    partners = merge_dossies(documents, extractions)["dadosSociosRepresentantes"]
+
+    assert len(partners) == 1
+    assert partners[0]["rg"] == "12.345.678-9"
+
+
+def test_merge_validations_lists_every_document_in_order():
+    documents = [_doc("cnpj.pdf", "a"), _doc("contrato.pdf", "b")]
+    validations = {
+        "cnpj.pdf": {"structured": {
+            "documento": "cnpj.pdf", "statusGeral": "Não Conforme",
+            "itens": [{"item": "Cartão CNPJ", "status": "Não Conforme", "observacoes": "emitido há 120 dias"}],
+        }},
+        "contrato.pdf": {"structured": None, "raw": "Contrato conforme"},
+    }
+
+    report = merge_validations(documents, validations)
+
+    assert report.index("## cnpj.pdf") < report.index("## contrato.pdf")
+    assert "| Cartão CNPJ | Não Conforme | emitido há 120 dias |" in report
+    assert "Contrato conforme" in report
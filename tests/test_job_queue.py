@@ -0,0 +1,34 @@
+from analysis_service.job_queue import JobQueue
+
+
+def test_recover_requeues_interrupted_jobs_until_the_attempts_cap(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.db", max_attempts=2)
+    job = queue.enqueue("CASE-1", "pipe-1", {"case_id": "CASE-1"})
+
+    assert queue.claim_next()["attempts"] == 1
+    # Reinicio con el job en curso: vuelve a la cola
+    assert queue.recover() == 1
+    assert queue.get(job["id"])["status"] == "queued"
+
+    claimed = queue.claim_next()
+    assert claimed["attempts"] == 2
+    assert claimed["payload"] == {"case_id": "CASE-1"}
+    # Segunda interrupción: agotó max_attempts y se marca 'failed' en lugar de reintentarse
+    assert queue.recover() == 0
+    failed = queue.get(job["id"])
+    assert failed["status"] == "failed"
+    assert "2 veces" in failed["error"]
+    assert queue.claim_next() is None
+    assert queue.counts()["failed"] == 1
+
+
+def test_recover_leaves_finished_and_queued_jobs_alone(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.db", max_attempts=1)
+    done = queue.enqueue("CASE-1", None, {})
+    queued = queue.enqueue("CASE-2", None, {})
+    queue.finish(queue.claim_next()["id"], "done", result={"ok": True})
+
+    assert queue.recover() == 0
+    assert queue.get(done["id"])["status"] == "done"
+    assert queue.get(done["id"])["result"] == {"ok": True}
+    assert queue.get(queued["id"])["status"] == "queued"
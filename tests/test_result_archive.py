@@ -0,0 +1,53 @@
+import os
+import time
+
+from analysis_service.result_archive import ResultArchive
+
+
+def _record(case_id: str, timestamp: str, **extra) -> dict:
+    return {"case_id": case_id, "status": "success", "timestamp": timestamp, **extra}
+
+
+def test_append_is_idempotent_and_latest_returns_the_newest_result(tmp_path):
+    archive = ResultArchive(tmp_path)
+
+    assert archive.append(_record("CASE-1", "2025-05-17T10:00:00", informe="v1")) is True
+    assert archive.append(_record("CASE-1", "2025-05-17T10:00:00", informe="v1")) is False
+    assert archive.append(_record("CASE-1", "2025-05-18T10:00:00", informe="v2")) is True
+    assert archive.append(_record("CASE-2", "2025-05-19T10:00:00", informe="outro")) is True
+
+    assert archive.latest("CASE-1")["informe"] == "v2"
+    assert [entry["timestamp"] for entry in archive.history("CASE-1")] == ["2025-05-18T10:00:00", "2025-05-17T10:00:00"]
+    assert archive.latest("CASE-3") is None
+    assert archive.stats()["records"] == 3
+
+
+def test_segments_rotate_by_size_and_records_stay_readable(tmp_path):
+    archive = ResultArchive(tmp_path, segment_max_bytes=1, retention_days=0)
+
+    for day in range(1, 4):
+        archive.append(_record(f"CASE-{day}", f"2025-05-0{day}T10:00:00", informe="x" * 100))
+
+    assert archive.stats()["segments"] == 3
+    assert archive.active_segment == "segment-000003.jsonl.gz"
+    assert all(archive.latest(f"CASE-{day}")["informe"] == "x" * 100 for day in range(1, 4))
+
+    # Al reabrir se continúa en el último segmento
+    archive.close()
+    assert ResultArchive(tmp_path, segment_max_bytes=1, retention_days=0).active_segment == "segment-000003.jsonl.gz"
+
+
+def test_rotation_drops_segments_past_retention(tmp_path):
+    archive = ResultArchive(tmp_path, segment_max_bytes=1, retention_days=1)
+    archive.append(_record("CASE-OLD", "2025-01-01T10:00:00"))
+    archive.append(_record("CASE-1", "2025-05-01T10:00:00"))
+    old_segment = tmp_path / "segment-000001.jsonl.gz"
+    two_days_ago = time.time() - 2 * 86400
+    os.utime(old_segment, (two_days_ago, two_days_ago))
+
+    archive.append(_record("CASE-2", "2025-05-02T10:00:00"))
+
+    assert not old_segment.exists()
+    assert archive.latest("CASE-OLD") is None
+    assert archive.latest("CASE-1")["case_id"] == "CASE-1"
+    assert archive.stats()["records"] == 2
@@ -0,0 +1,74 @@
+import time
+
+from analysis_service import result_outbox
+from analysis_service.result_outbox import ResultOutbox, backoff_seconds, idempotency_key
+
+
+class _Clock:
+    """Sustituye al módulo time de result_outbox para avanzar el reloj sin esperar."""
+
+    def __init__(self):
+        self.now = time.time()
+
+    def time(self):
+        return self.now
+
+
+def _outbox(tmp_path, monkeypatch, **kwargs):
+    clock = _Clock()
+    monkeypatch.setattr(result_outbox, "time", clock)
+    return ResultOutbox(tmp_path / "outbox.db", **kwargs), clock
+
+
+def test_record_is_idempotent_per_key(tmp_path, monkeypatch):
+    outbox, _ = _outbox(tmp_path, monkeypatch)
+    key = idempotency_key("CASE-1", "success", "2025-05-17T10:00:00")
+
+    assert outbox.record(key, "CASE-1", {"case_id": "CASE-1"}, ["markdown", "supabase"]) is True
+    assert outbox.record(key, "CASE-1", {"case_id": "CASE-1", "otro": 1}, ["markdown", "supabase"]) is False
+
+    due = outbox.due()
+    assert sorted(delivery["sink"] for delivery in due) == ["markdown", "supabase"]
+    assert all(delivery["payload"] == {"case_id": "CASE-1"} for delivery in due)
+    assert outbox.stats()["results"] == 1
+
+
+def test_failed_delivery_backs_off_then_goes_dead(tmp_path, monkeypatch):
+    outbox, clock = _outbox(tmp_path, monkeypatch, max_attempts=3)
+    outbox.record("k1", "CASE-1", {}, ["supabase"])
+
+    for attempt in (1, 2):
+        delivery = outbox.due()[0]
+        assert delivery["attempts"] == attempt - 1
+        assert outbox.mark_failed("k1", "supabase", delivery["attempts"], "timeout") == "pending"
+        # No vuelve a vencer hasta pasado el backoff de este intento
+        clock.now += backoff_seconds(attempt) - 0.5
+        assert outbox.due() == []
+        clock.now += 1
+
+    delivery = outbox.due()[0]
+    assert outbox.mark_failed("k1", "supabase", delivery["attempts"], "timeout") == "dead"
+    clock.now += 3600
+    assert outbox.due() == []
+    assert outbox.stats()["sinks"]["supabase"]["dead"] == 1
+
+    assert outbox.retry_dead("supabase") == 1
+    assert outbox.due()[0]["attempts"] == 0
+
+
+def test_prune_removes_only_fully_delivered_results_past_retention(tmp_path, monkeypatch):
+    outbox, clock = _outbox(tmp_path, monkeypatch, retention_days=7)
+    outbox.record("delivered", "CASE-1", {}, ["markdown", "supabase"])
+    outbox.record("pending", "CASE-2", {}, ["markdown", "supabase"])
+    for sink in ("markdown", "supabase"):
+        outbox.mark_delivered("delivered", sink, reference="ref")
+    outbox.mark_delivered("pending", "markdown")
+
+    assert outbox.prune() == 0  # Aún dentro de la retención
+
+    clock.now += 8 * 86400
+    assert outbox.prune() == 1
+    stats = outbox.stats()
+    assert stats["results"] == 1
+    assert stats["pruned"] == 1
+    assert [delivery["outbox_id"] for delivery in outbox.due()] == ["pending"]
@@ -0,0 +1,57 @@
+from cadastro_crew.token_budget import (
+    OMITTED_MARKER,
+    apply_token_budget,
+    case_budgets,
+    condense,
+    count_tokens,
+    relevance_keywords,
+)
+
+
+def _long_document(index: int, sections: int = 60) -> str:
+    parts = [f"# Documento {index}\nCNPJ 00.000.000/0001-{index:02d} - Razão Social Exemplo {index}"]
+    for section in range(sections):
+        parts.append(
+            f"## Cláusula {section}\n"
+            + " ".join(f"texto corrido do parágrafo {section} palavra{word}" for word in range(40))
+        )
+    return "\n\n".join(parts)
+
+
+def test_case_budget_is_enforced_with_many_long_documents():
+    results = [{"name": f"doc{i}.pdf", "content": _long_document(i)} for i in range(40)]
+
+    condensed, report = apply_token_budget(results, "Contrato social e cartão CNPJ", per_document=6000, per_case=24000)
+
+    assert report["tokens_after"] <= 24000
+    assert sum(count_tokens(doc["content"]) for doc in condensed) <= 24000
+    assert all(doc["tokens_after"] <= doc["budget"] for doc in report["documents"])
+
+
+def test_case_budgets_never_exceed_the_case_when_floors_do_not_fit():
+    budgets = case_budgets({i: 6000 for i in range(40)}, 24000)
+
+    assert sum(budgets.values()) <= 24000
+    assert min(budgets.values()) == 24000 // 40
+
+
+def test_case_budgets_keep_small_documents_whole_under_the_cap():
+    assert case_budgets({0: 100, 1: 200}, 24000) == {0: 100, 1: 200}
+
+
+def test_condense_counts_omitted_markers_against_the_budget():
+    text = _long_document(1)
+    keywords = relevance_keywords("cnpj razão social")
+
+    outcome = condense(text, 700, keywords)
+
+    assert outcome["tokens_after"] <= 700
+    assert OMITTED_MARKER in outcome["text"]
+    assert outcome["text"].startswith("# Documento 1")
+
+
+def test_condense_keeps_text_within_budget_unchanged():
+    outcome = condense("# Curto\nCNPJ", 100, relevance_keywords(None))
+
+    assert outcome["text"] == "# Curto\nCNPJ"
+    assert outcome["chunks"] is None